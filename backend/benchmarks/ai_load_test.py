@@ -0,0 +1,41 @@
+# benchmarks/ai_load_test.py
+# Fires concurrent requests at the AI endpoints of a running server and compares the wall time with
+# the sum of the individual latencies. If the calls were serialized inside one worker the two would
+# be about equal; with non-blocking Gemini calls the wall time stays close to the slowest request.
+#   uvicorn main:app --port 8000   (in another shell)
+#   python benchmarks/ai_load_test.py --url http://localhost:8000 --concurrency 10
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ENDPOINTS = ["/improve_text", "/lengthen_text", "/shorten_text"]
+SAMPLE_TEXT = "Worked on a machine learning project that predicted stock prices using news data"
+
+def call(url: str, endpoint: str):
+    start = time.perf_counter()
+    response = requests.post(url + endpoint, json={"text": SAMPLE_TEXT}, timeout=120)
+    return endpoint, response.status_code, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    endpoints = [ENDPOINTS[i % len(ENDPOINTS)] for i in range(args.concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda ep: call(args.url, ep), endpoints))
+    wall = time.perf_counter() - start
+
+    for endpoint, status, latency in results:
+        print(f"{endpoint:16s} {status}  {latency:6.2f}s")
+    serial = sum(latency for _, _, latency in results)
+    slowest = max(latency for _, _, latency in results)
+    print(f"\nrequests: {len(results)}  wall: {wall:.2f}s  sum of latencies: {serial:.2f}s  slowest: {slowest:.2f}s")
+    print(f"overlap factor: {serial / wall:.1f}x (1.0x means the calls were serialized)")
+
+if __name__ == "__main__":
+    main()
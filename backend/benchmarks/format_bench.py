@@ -0,0 +1,83 @@
+# benchmarks/format_bench.py
+# Per-compile wall time of a cold pdflatex run with and without the template's precompiled format,
+# plus how long a warm pool worker takes to become ready either way. Formats are built (or reused
+# from LATEX_FORMAT_DIR) before timing starts. Needs pdflatex and mylatexformat.ltx.
+# Run from backend/:  python benchmarks/format_bench.py --iterations 10
+# No results have been recorded yet (the formats were written on a machine without TeX), so they
+# are not a measured speedup until a run on the Docker image is added to the history with its
+# output, including the pdflatex version line printed first.
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import latex_compiler
+from latex_compiler import WarmWorker, compile_cold, formats, job_paths, make_scratch_dir, mark_end_of_dump, split_document
+from template_registry import template_registry
+
+BODY_TEMPLATES = ["iitb_one_page.tex", "dense_blue.tex", "tcolorbox_style.tex"]
+
+PERSONAL_DETAILS = r"\textbf{Benchmark Student} \hfill Computer Science \\ IIT Bombay \hfill student@example.com"
+DYNAMIC_CONTENT = "\n".join([
+    r"\section*{Professional Experience}",
+    r"\begin{itemize}",
+    r"\item Cut p50 latency of the PDF service by 45\% with a warm compiler pool",
+    r"\item Trained a predictive FinBERT NLP model on 25,000+ news articles, reaching 73\% accuracy",
+    r"\end{itemize}",
+])
+
+def populated(body_id: str) -> str:
+    source = template_registry.get(body_id)
+    return source.replace("__PERSONAL_DETAILS_SECTION__", PERSONAL_DETAILS).replace("__DYNAMIC_CONTENT_SECTION__", DYNAMIC_CONTENT)
+
+def time_cold(latex_source: str, fmt):
+    workdir = make_scratch_dir()
+    try:
+        pdf_filepath, _, _, tex_filepath = job_paths(workdir)
+        if fmt:
+            preamble, _ = split_document(latex_source)
+            latex_source = mark_end_of_dump(preamble) + latex_source[len(preamble):]
+        with open(tex_filepath, "w", encoding='utf-8') as f: f.write(latex_source)
+        start = time.perf_counter()
+        compile_cold(tex_filepath, fmt=fmt)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not os.path.exists(pdf_filepath): raise SystemExit(f"compile failed (fmt={fmt}), see {workdir}")
+        return elapsed
+    finally:
+        if os.path.exists(pdf_filepath): shutil.rmtree(workdir, ignore_errors=True)
+
+def time_warmup(preamble: str, fmt):
+    worker = WarmWorker(preamble, fmt=fmt)
+    start = time.perf_counter()
+    try:
+        worker.start()
+        if not worker.ready.wait(latex_compiler.LATEX_POOL_WARMUP_TIMEOUT): raise SystemExit(f"worker never became ready (fmt={fmt})")
+        return (time.perf_counter() - start) * 1000
+    finally:
+        worker.stop()
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+    if not formats.enabled: raise SystemExit("formats are disabled (LATEX_FORMATS=0, or pdflatex/mylatexformat missing)")
+    print(f"{latex_compiler.compiler_version()}  cpus={os.cpu_count()}  {args.iterations} iterations, medians")
+
+    print(f"{'template':22s} {'stage':14s} {'plain ms':>10s} {'format ms':>10s} {'speedup':>8s}")
+    for body_id in BODY_TEMPLATES:
+        latex_source = populated(body_id)
+        preamble, _ = split_document(latex_source)
+        fmt = formats.ensure(preamble)
+        if fmt is None: raise SystemExit(f"{body_id}: format build failed: {formats.stats()['failed']}")
+        for stage, func, arg in (("cold compile", time_cold, latex_source), ("worker warmup", time_warmup, preamble)):
+            plain = statistics.median(func(arg, None) for _ in range(args.iterations))
+            dumped = statistics.median(func(arg, fmt) for _ in range(args.iterations))
+            print(f"{body_id:22s} {stage:14s} {plain:10.1f} {dumped:10.1f} {plain / dumped:7.2f}x")
+
+if __name__ == "__main__":
+    main_cli()
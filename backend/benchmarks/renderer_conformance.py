@@ -0,0 +1,93 @@
+# benchmarks/renderer_conformance.py
+# Conformance suite for alternative renderers: renders the sample resume with every shipped body
+# template through pdflatex (the reference) and through each other installed renderer, rasterizes
+# every page with pdftoppm and diffs the page images. A renderer conforms when the page count
+# matches and no page has more than --max-diff of its pixels changed. Also prints render latency.
+# Needs pdftoppm (poppler-utils) and the TeX engines under test.
+# Run from backend/:  python benchmarks/renderer_conformance.py [--renderer lualatex] [--dpi 60]
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from fastapi.testclient import TestClient
+import main
+from pdf_response_bench import BODY_TEMPLATES, sample_resume
+
+REFERENCE_RENDERER = "pdflatex"
+PIXEL_TOLERANCE = 48   # grey levels two pixels may differ by before they count as changed
+
+RUN_MARKER = f"conformance-{time.time_ns()}"   # same content for every renderer, but never a PDF cache hit
+
+def render(client: TestClient, renderer: str, body_id: str):
+    start = time.perf_counter()
+    response = client.post(f"/generate_pdf?renderer={renderer}", json=sample_resume(body_id, RUN_MARKER))
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 200: raise RuntimeError(f"{renderer} failed on {body_id}: {response.status_code} {response.text[:200]}")
+    return response.content, elapsed
+
+def read_pgm(path: str):
+    # Binary greyscale PGM (P5) as written by pdftoppm -gray: (width, height, pixel bytes)
+    with open(path, "rb") as f: data = f.read()
+    fields, offset = [], 0
+    while len(fields) < 4:
+        while data[offset:offset + 1].isspace(): offset += 1
+        if data[offset:offset + 1] == b"#":
+            offset = data.index(b"\n", offset)
+            continue
+        end = offset
+        while not data[end:end + 1].isspace(): end += 1
+        fields.append(data[offset:end])
+        offset = end
+    return int(fields[1]), int(fields[2]), data[offset + 1:]
+
+def rasterize(pdf_bytes: bytes, dpi: int, workdir: str, prefix: str):
+    pdf_path = os.path.join(workdir, f"{prefix}.pdf")
+    with open(pdf_path, "wb") as f: f.write(pdf_bytes)
+    subprocess.run(["pdftoppm", "-gray", "-r", str(dpi), pdf_path, os.path.join(workdir, prefix)], check=True)
+    return [read_pgm(path) for path in sorted(glob.glob(os.path.join(workdir, f"{prefix}-*.pgm")))]
+
+def page_diff(reference, candidate) -> float:
+    # Fraction of pixels that differ by more than PIXEL_TOLERANCE; 1.0 if the page sizes differ
+    ref_w, ref_h, ref_pixels = reference
+    cand_w, cand_h, cand_pixels = candidate
+    if (ref_w, ref_h) != (cand_w, cand_h): return 1.0
+    changed = sum(1 for a, b in zip(ref_pixels, cand_pixels) if abs(a - b) > PIXEL_TOLERANCE)
+    return changed / len(ref_pixels)
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renderer", action="append", help="renderer(s) to check; default: every installed one")
+    parser.add_argument("--dpi", type=int, default=60)
+    parser.add_argument("--max-diff", type=float, default=0.02, help="largest allowed fraction of changed pixels per page")
+    args = parser.parse_args()
+
+    candidates = args.renderer or [name for name, r in main.RENDERERS.items() if name != REFERENCE_RENDERER and r.available()]
+    if not candidates: raise SystemExit("no alternative renderer is installed")
+
+    failures = 0
+    print(f"{'template':22s} {'renderer':10s} {'pages':>7s} {'worst diff':>11s} {'ref ms':>8s} {'ms':>8s}  result")
+    with TestClient(main.app) as client, tempfile.TemporaryDirectory() as workdir:
+        for body_id in BODY_TEMPLATES:
+            reference_pdf, reference_ms = render(client, REFERENCE_RENDERER, body_id)
+            reference_pages = rasterize(reference_pdf, args.dpi, workdir, f"ref-{body_id}")
+            for renderer in candidates:
+                candidate_pdf, candidate_ms = render(client, renderer, body_id)
+                candidate_pages = rasterize(candidate_pdf, args.dpi, workdir, f"{renderer}-{body_id}")
+                same_count = len(candidate_pages) == len(reference_pages)
+                worst = max((page_diff(r, c) for r, c in zip(reference_pages, candidate_pages)), default=1.0)
+                ok = same_count and worst <= args.max_diff
+                failures += not ok
+                pages = f"{len(candidate_pages)}/{len(reference_pages)}"
+                print(f"{body_id:22s} {renderer:10s} {pages:>7s} {worst:10.2%} {reference_ms:8.1f} {candidate_ms:8.1f}  {'PASS' if ok else 'FAIL'}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main_cli()
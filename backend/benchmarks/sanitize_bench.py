@@ -0,0 +1,79 @@
+# benchmarks/sanitize_bench.py
+# Parity check and micro-benchmark for sanitize_and_format against the original chained-replace
+# implementation. Run from backend/:  python benchmarks/sanitize_bench.py [--cases 20000]
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from resume_latex import sanitize_and_format
+
+def legacy_sanitize_and_format(text: str) -> str:
+    # Verbatim copy of the implementation this rewrite replaced.
+    def sanitize_plain_text(s: str) -> str:
+        s = s.replace('\\', r'\textbackslash{}')
+        s = s.replace('&', r'\&')
+        s = s.replace('%', r'\%')
+        s = s.replace('$', r'\$')
+        s = s.replace('#', r'\#')
+        s = s.replace('_', r'\_')
+        s = s.replace('{', r'\{')
+        s = s.replace('}', r'\}')
+        s = s.replace('[', r'{[}')
+        s = s.replace(']', r'{]}')
+        s = s.replace('~', r'\textasciitilde{}')
+        s = s.replace('^', r'\textasciicircum{}')
+        return s
+
+    parts = re.split(r'(\*\*.*?\*\*)', text)
+    processed_parts = []
+    for part in parts:
+        if part.startswith('**') and part.endswith('**'):
+            content = part[2:-2]
+            processed_parts.append(f"\\textbf{{{sanitize_plain_text(content)}}}")
+        else:
+            processed_parts.append(sanitize_plain_text(part))
+    return "".join(processed_parts)
+
+# Alphabet weighted towards the characters that matter: every escape, the bold marker and newlines
+ALPHABET = list("abc XYZ019.,-|") + list("\\&%$#_{}[]~^") + ["*", "**", "\n", "é", "₹"]
+
+def random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+
+def check_parity(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    edge_cases = ["", "*", "**", "***", "****", "**a**", "**a\nb**", "a**b", "**\\**", "\\{}", "** ** **"]
+    samples = edge_cases + [random_text(rng) for _ in range(cases)]
+    for text in samples:
+        expected, actual = legacy_sanitize_and_format(text), sanitize_and_format(text)
+        if expected != actual:
+            print(f"MISMATCH for {text!r}:\n  legacy: {expected!r}\n  new:    {actual!r}")
+            return 1
+    print(f"parity: {len(samples)} inputs identical")
+    return 0
+
+def run_benchmark(number: int) -> None:
+    corpus = [
+        "Trained a predictive FinBERT NLP model to predict stock trends from 25,000+ news articles, reaching 73% accuracy",
+        "Led the hostel cycle auction, coordinating with the **warden** and the security office to sell 400+ cycles",
+        "May 2024 - Jul 2024",
+        "Goldman Sachs",
+        "C++, Python, R & SQL; {LaTeX} #1 ~ ^_^",
+    ]
+    for name, func in (("legacy", legacy_sanitize_and_format), ("current", sanitize_and_format)):
+        seconds = timeit.timeit(lambda: [func(t) for t in corpus], number=number)
+        print(f"{name:8s} {seconds / (number * len(corpus)) * 1e6:8.3f} us/call")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    status = check_parity(args.cases, args.seed)
+    if status == 0: run_benchmark(args.number)
+    sys.exit(status)
@@ -0,0 +1,108 @@
+# benchmarks/scaling_bench.py
+# Throughput of /generate_pdf as the number of gunicorn workers grows. For each worker count the
+# server is started with gunicorn.conf.py (WEB_CONCURRENCY=n), loaded by --clients-per-worker
+# threads per worker for --seconds, and stopped again. With --mode compile every request carries a
+# unique bullet so it really compiles; with --mode cached every request asks for one of a few
+# resumes that are already in the shared PDF cache, which measures the Python serving path alone.
+# Near-linear scaling shows up as an efficiency (speedup / workers) close to 100%.
+# Needs gunicorn and pdflatex. Run from backend/:  python benchmarks/scaling_bench.py --workers 1,2,4,8
+# Worker counts above the host's CPU count measure oversubscription, not scaling. No results have
+# been recorded yet (the gunicorn setup was written on a one-CPU machine without TeX), so it is not
+# a measured throughput gain until a multi-core run is added to the history with its output.
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+os.chdir(BACKEND_DIR)
+
+from pdf_response_bench import BODY_TEMPLATES, sample_resume
+
+STARTUP_TIMEOUT = 120
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workers: int, port: int, cache_dir: str) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "PORT": str(port), "PDF_CACHE_DIR": cache_dir,
+           "AI_CACHE_PATH": os.path.join(cache_dir, "ai_cache.sqlite3"), "JOB_DB_PATH": os.path.join(cache_dir, "jobs.sqlite3")}
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/renderers", timeout=2).ok: return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    server.kill()
+    raise RuntimeError(f"server with {workers} workers did not come up within {STARTUP_TIMEOUT}s")
+
+def load(url: str, clients: int, seconds: float, mode: str):
+    # Returns (completed requests, errors, elapsed seconds)
+    stop_at = time.perf_counter() + seconds
+    counts = {"ok": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def client(client_id: int):
+        session = requests.Session()
+        i = 0
+        while time.perf_counter() < stop_at:
+            body_id = BODY_TEMPLATES[i % len(BODY_TEMPLATES)]
+            marker = f"scaling-{client_id}-{i}-{time.time_ns()}" if mode == "compile" else "scaling-cached"
+            try:
+                ok = session.post(f"{url}/generate_pdf", json=sample_resume(body_id, marker), timeout=120).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock: counts["ok" if ok else "errors"] += 1
+            i += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return counts["ok"], counts["errors"], time.perf_counter() - start
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, os.cpu_count() or 1)), help="comma-separated worker counts")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--clients-per-worker", type=int, default=4)
+    parser.add_argument("--mode", choices=["compile", "cached"], default="compile")
+    args = parser.parse_args()
+    worker_counts = sorted({int(n) for n in args.workers.split(",") if n.strip()})
+
+    print(f"mode={args.mode}  cpus={os.cpu_count()}  {args.seconds:.0f}s per run")
+    if max(worker_counts) > (os.cpu_count() or 1): print(f"warning: more workers than CPUs ({max(worker_counts)} > {os.cpu_count()})")
+    print(f"{'workers':>8s} {'clients':>8s} {'requests':>9s} {'errors':>7s} {'req/s':>8s} {'speedup':>8s} {'efficiency':>11s}")
+    baseline = None
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            port = free_port()
+            server = start_server(workers, port, cache_dir)
+            try:
+                url = f"http://127.0.0.1:{port}"
+                if args.mode == "cached":
+                    for body_id in BODY_TEMPLATES: requests.post(f"{url}/generate_pdf", json=sample_resume(body_id, "scaling-cached"), timeout=120)
+                clients = workers * args.clients_per_worker
+                completed, errors, elapsed = load(url, clients, args.seconds, args.mode)
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+        throughput = completed / elapsed
+        baseline = baseline or throughput / workers
+        speedup = throughput / baseline
+        print(f"{workers:8d} {clients:8d} {completed:9d} {errors:7d} {throughput:8.1f} {speedup:7.2f}x {speedup / workers:10.0%}")
+
+if __name__ == "__main__":
+    main_cli()
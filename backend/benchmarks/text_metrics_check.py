@@ -0,0 +1,86 @@
+# benchmarks/text_metrics_check.py
+# Checks the TFM parser in text_metrics.py against a real TeX Live font: cmr10.tfm (found with
+# kpsewhich) must give the widths, interword glue, ligatures and kerns that tftopl lists for it in
+# cmr10.pl. Then, for every template, compares the width text_metrics predicts for a sample bullet
+# with the width pdflatex gives the same bullet set in an \hbox inside that template's list (microtype
+# protrusion and expansion don't apply in an \hbox, and aren't modelled either). Needs a TeX Live
+# installation.
+# Run from backend/:  python benchmarks/text_metrics_check.py
+import os
+import re
+import sys
+import shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import text_metrics
+from latex_compiler import compile_cold, job_paths, make_scratch_dir
+from resume_latex import bullet_probe_latex, sanitize_and_format
+from template_registry import template_registry
+
+TOLERANCE = 1e-5      # TFM fix_words are exact to 2**-20 of the design size
+WIDTH_TOLERANCE_PT = 0.05
+
+# From tftopl cmr10.tfm (design-size units)
+CMR10_WIDTHS = {"a": 0.500002, "A": 0.750002, "M": 0.916669, "f": 0.305557, "i": 0.277781}
+CMR10_GLUE = {"space": 0.333334, "space_stretch": 0.166667, "space_shrink": 0.111112}
+CMR10_LIGATURES = {("f", "i"): 0o14, ("f", "f"): 0o13, ("-", "-"): 0o173}
+CMR10_KERNS = {("A", "V"): -0.111112, ("A", "t"): -0.027779}
+
+SAMPLE_BULLET = "Reduced **p99 latency by 40%** for the checkout service by batching database writes"
+
+def check_cmr10() -> list:
+    path = text_metrics.find_tfm("cmr10")
+    if not path: return ["cmr10.tfm not found (is TeX Live installed and kpsewhich on PATH?)"]
+    with open(path, "rb") as f: font = text_metrics.parse_tfm(f.read())
+    failures = []
+    for char, expected in CMR10_WIDTHS.items():
+        actual = font.widths.get(ord(char))
+        if actual is None or abs(actual - expected) > TOLERANCE: failures.append(f"width of {char!r}: {actual} != {expected}")
+    for field, expected in CMR10_GLUE.items():
+        actual = getattr(font, field)
+        if abs(actual - expected) > TOLERANCE: failures.append(f"{field}: {actual} != {expected}")
+    for (left, right), expected in CMR10_LIGATURES.items():
+        actual = font.ligatures.get((ord(left), ord(right)))
+        if actual != expected: failures.append(f"ligature {left}{right}: {actual} != {expected}")
+    for (left, right), expected in CMR10_KERNS.items():
+        actual = font.kerns.get((ord(left), ord(right)))
+        if actual is None or abs(actual - expected) > TOLERANCE: failures.append(f"kern {left}{right}: {actual} != {expected}")
+    print(f"cmr10 ({path}): {'ok' if not failures else f'{len(failures)} mismatches'}")
+    return failures
+
+def typeset_width(body_id: str, text: str) -> float:
+    # Natural width pdflatex gives text (same markup as a resume point) inside the template's bullet list
+    sample = f"\\setbox0\\hbox{{{sanitize_and_format(text)}}}\\typeout{{SAMPLE-WIDTH=\\the\\wd0}}"
+    source = bullet_probe_latex(body_id, text_metrics.PROBE_MARKER).replace(text_metrics.PROBE_MARKER, sample, 1)
+    workdir = make_scratch_dir()
+    _, log_filepath, _, tex_filepath = job_paths(workdir)
+    with open(tex_filepath, "w", encoding='utf-8') as f: f.write(source)
+    compile_cold(tex_filepath)
+    with open(log_filepath, "r", encoding='utf-8', errors='replace') as f: log = f.read()
+    match = re.search(r"^SAMPLE-WIDTH=([\d.]+)pt$", log, re.MULTILINE)
+    if not match: raise RuntimeError(f"pdflatex did not report the sample width (see {log_filepath})")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return float(match.group(1))
+
+def check_templates() -> list:
+    failures = []
+    for body_id in template_registry.names():
+        try:
+            fonts = text_metrics.template_fonts(body_id)
+        except text_metrics.TextMetricsUnavailable as e:
+            failures.append(f"{body_id}: {e}")
+            continue
+        predicted = text_metrics.measure(SAMPLE_BULLET, body_id).width_pt
+        actual = typeset_width(body_id, SAMPLE_BULLET)
+        print(f"{body_id}: {fonts.regular}/{fonts.bold} at {fonts.size_pt}pt, line {fonts.line_width_pt:.2f}pt; "
+              f"sample bullet {predicted:.2f}pt predicted, {actual:.2f}pt typeset")
+        if abs(predicted - actual) > WIDTH_TOLERANCE_PT: failures.append(f"{body_id}: sample bullet {predicted:.2f}pt != {actual:.2f}pt")
+    return failures
+
+def main_cli():
+    failures = check_cmr10() + check_templates()
+    for failure in failures: print(f"    {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main_cli()
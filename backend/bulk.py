@@ -0,0 +1,266 @@
+# bulk.py (compile thousands of resumes from a JSONL stream across every core)
+# Used by the /bulk/pdf endpoint and as a CLI for placement cells:
+#   python bulk.py students.jsonl --out resumes/ [--workers 8] [--renderer pdflatex]
+# Each input line is one ResumeData object (an optional "id" field names the output file).
+# Rerunning the CLI on the same --out directory skips every record its manifest.jsonl already
+# lists as written, so a crashed or interrupted run picks up where it stopped.
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from caching import pdf_cache
+from latex_compiler import formats, job_paths, make_scratch_dir, pool as pdflatex_pool, split_document
+from renderers import RENDERERS, get_renderer
+
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(os.cpu_count() or 2)))
+# /bulk/pdf runs inside a web worker next to interactive compiles, so it gets at most half the cores
+# and its processes run at a lower CPU priority (niceness) than the server's own compiles
+BULK_HTTP_WORKERS = int(os.getenv("BULK_HTTP_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+BULK_HTTP_NICE = int(os.getenv("BULK_HTTP_NICE", "10"))
+BULK_MAX_RECORDS = int(os.getenv("BULK_MAX_RECORDS", "5000"))    # per /bulk/pdf request
+BULK_MAX_RECORD_BYTES = int(os.getenv("BULK_MAX_RECORD_BYTES", str(1024 * 1024)))   # longest accepted JSONL line
+MANIFEST_FILE = "manifest.jsonl"
+ERRORS_FILE = "errors.jsonl"
+STATS_FILE = "stats.json"
+NAME_PATTERN = re.compile(r"[^A-Za-z0-9_.-]+")
+
+class BulkRecord(NamedTuple):
+    line: int                  # 1-based line of the input stream
+    name: str                  # output file name
+    cache_key: str = ""
+    latex: Optional[str] = None
+    error: Optional[str] = None   # set when the record could not even be turned into LaTeX
+
+class BulkOutcome(NamedTuple):
+    record: BulkRecord
+    pdf: Optional[bytes]
+    error: Optional[str]
+    source: str                # "compiled", "cache" or "failed"
+
+class BulkStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.compiled = self.cached = self.failed = self.skipped = 0
+
+    def count(self, outcome: BulkOutcome) -> None:
+        if outcome.source == "compiled": self.compiled += 1
+        elif outcome.source == "cache": self.cached += 1
+        else: self.failed += 1
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        written = self.compiled + self.cached
+        return {"written": written, "compiled": self.compiled, "from_cache": self.cached, "failed": self.failed,
+                "skipped": self.skipped, "seconds": round(elapsed, 2), "resumes_per_second": round(written / elapsed, 2) if elapsed else 0.0}
+
+def record_name(line: int, record: dict) -> str:
+    details = record.get("personalDetails") or {}
+    label = str(record.get("id") or details.get("roll_no") or details.get("name") or "resume")
+    return f"{line:05d}-{NAME_PATTERN.sub('_', label).strip('_')[:60] or 'resume'}.pdf"
+
+def read_records(lines: Iterable[str], build_latex: Callable[[dict], str], renderer_version: str) -> Iterator[BulkRecord]:
+    # Parses the JSONL stream and populates each resume's template in this process (the section
+    # fragment cache makes that cheap); a bad line becomes a BulkRecord carrying the error.
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip(): continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict): raise ValueError("each line must be a JSON object")
+        except ValueError as e:
+            yield BulkRecord(line_number, record_name(line_number, {}), error=f"Invalid JSON: {e}")
+            continue
+        name = record_name(line_number, record)
+        try:
+            latex = build_latex(record)
+        except Exception as e:
+            # HTTPException from build_resume_latex carries its message in .detail
+            yield BulkRecord(line_number, name, error=str(getattr(e, "detail", None) or e))
+            continue
+        yield BulkRecord(line_number, name, pdf_cache.key_for(latex, renderer_version), latex)
+
+# --- Worker Processes ---
+def disable_warm_pools() -> None:
+    # Each bulk process is one parallel lane compiling cold from the templates' precompiled formats;
+    # resident warm workers would only duplicate TeX processes here.
+    pdflatex_pool.size = 0
+    for renderer in RENDERERS.values():
+        if hasattr(renderer, "pool"): renderer.pool.size = 0
+
+def init_worker(template_sources: List[str], nice: int = 0) -> None:
+    if nice and hasattr(os, "nice"): os.nice(nice)
+    disable_warm_pools()
+    for template in template_sources:
+        preamble, _ = split_document(template)
+        if preamble is not None: formats.ensure(preamble)   # finds the parent's format files on disk
+
+def compile_record(latex: str, renderer_name: str) -> bytes:
+    workdir = make_scratch_dir()
+    try:
+        get_renderer(renderer_name).render(latex, workdir)
+        pdf_filepath, log_filepath, _, _ = job_paths(workdir)
+        if not os.path.exists(pdf_filepath):
+            log_tail = ""
+            if os.path.exists(log_filepath):
+                with open(log_filepath, "r", encoding='utf-8', errors='replace') as f: log_tail = f.read()[-1500:]
+            raise RuntimeError(f"PDF file was not created. LaTeX log tail: {log_tail}")
+        with open(pdf_filepath, "rb") as f: return f.read()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_bulk(records: Iterable[BulkRecord], renderer_name: str, template_sources: List[str], workers: int = BULK_WORKERS,
+             nice: int = 0) -> Iterator[BulkOutcome]:
+    # Yields an outcome per record, in completion order. Cached PDFs are served without a compile and
+    # at most 2 * workers compiles are outstanding, so memory stays flat however long the stream is.
+    # New PDFs go into the PDF cache, which is what lets a retried request skip finished records.
+    context = multiprocessing.get_context("spawn")   # never fork a server process that has threads running
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(template_sources, nice)) as executor:
+        pending: Dict = {}
+
+        def drain(block_until: int) -> Iterator[BulkOutcome]:
+            while len(pending) > block_until:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = pending.pop(future)
+                    try:
+                        pdf = future.result()
+                    except Exception as e:
+                        yield BulkOutcome(record, None, str(e), "failed")
+                        continue
+                    pdf_cache.put(record.cache_key, pdf)
+                    yield BulkOutcome(record, pdf, None, "compiled")
+
+        for record in records:
+            if record.error is not None:
+                yield BulkOutcome(record, None, record.error, "failed")
+                continue
+            cached_pdf = pdf_cache.get(record.cache_key)
+            if cached_pdf is not None:
+                yield BulkOutcome(record, cached_pdf, None, "cache")
+                continue
+            pending[executor.submit(compile_record, record.latex, renderer_name)] = record
+            yield from drain(2 * workers - 1)
+        yield from drain(0)
+
+def error_entry(outcome: BulkOutcome) -> dict:
+    return {"line": outcome.record.line, "name": outcome.record.name, "error": outcome.error}
+
+# --- ZIP Streaming ---
+class ZipChunks:
+    # Write-only file object for zipfile: collects what it writes until the next take().
+    # zipfile falls back to data descriptors because it can't seek, so entries stream in order.
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+def stream_zip(outcomes: Iterable[BulkOutcome], stats: BulkStats) -> Iterator[bytes]:
+    # PDFs are stored uncompressed (they are already deflated); errors.jsonl and stats.json close the archive.
+    sink = ZipChunks()
+    errors = []
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for outcome in outcomes:
+            stats.count(outcome)
+            if outcome.pdf is None:
+                errors.append(error_entry(outcome))
+                continue
+            archive.writestr(outcome.record.name, outcome.pdf)
+            yield sink.take()
+        archive.writestr(ERRORS_FILE, "".join(json.dumps(entry) + "\n" for entry in errors))
+        archive.writestr(STATS_FILE, json.dumps(stats.as_dict(), indent=2))
+    yield sink.take()
+
+# --- Output Directory (CLI) ---
+def load_manifest(out_dir: str) -> Dict[int, dict]:
+    # Records already written by an earlier run: line -> manifest entry, for files still on disk
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path): return {}
+    done = {}
+    with open(path, "r", encoding='utf-8') as f:
+        for line in f:
+            try: entry = json.loads(line)
+            except ValueError: continue   # a line cut short by the crash we are recovering from
+            if os.path.exists(os.path.join(out_dir, entry["name"])): done[entry["line"]] = entry
+    return done
+
+def write_to_directory(records: Iterable[BulkRecord], out_dir: str, renderer_name: str, template_sources: List[str],
+                       workers: int = BULK_WORKERS, progress_every: int = 100) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    done = load_manifest(out_dir)
+    stats = BulkStats()
+
+    def remaining() -> Iterator[BulkRecord]:
+        for record in records:
+            entry = done.get(record.line)
+            if entry is not None and entry.get("cache_key") == record.cache_key:
+                stats.skipped += 1
+                continue
+            yield record
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), "a", encoding='utf-8') as manifest, \
+         open(os.path.join(out_dir, ERRORS_FILE), "w", encoding='utf-8') as errors:
+        for outcome in run_bulk(remaining(), renderer_name, template_sources, workers):
+            stats.count(outcome)
+            if outcome.pdf is None:
+                errors.write(json.dumps(error_entry(outcome)) + "\n")
+            else:
+                # Write to a temp name first: a file listed in the manifest is always complete
+                target = os.path.join(out_dir, outcome.record.name)
+                with open(f"{target}.tmp", "wb") as f: f.write(outcome.pdf)
+                os.replace(f"{target}.tmp", target)
+                manifest.write(json.dumps({"line": outcome.record.line, "name": outcome.record.name, "cache_key": outcome.record.cache_key}) + "\n")
+                manifest.flush()
+            processed = stats.compiled + stats.cached + stats.failed
+            if progress_every and processed % progress_every == 0: print(f"--- BULK PROGRESS ---: {stats.as_dict()}")
+    summary = stats.as_dict()
+    with open(os.path.join(out_dir, STATS_FILE), "w", encoding='utf-8') as f: json.dump(summary, f, indent=2)
+    return summary
+
+def open_lines(path: str) -> Tuple[Iterable[str], Callable[[], None]]:
+    if path == "-": return sys.stdin, lambda: None
+    f = open(path, "r", encoding='utf-8')
+    return f, f.close
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Compile a JSONL file of ResumeData into PDFs")
+    parser.add_argument("input", help="JSONL file with one ResumeData per line, or - for stdin")
+    parser.add_argument("--out", required=True, help="output directory (rerun with the same one to resume)")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--renderer", default=None)
+    args = parser.parse_args()
+
+    from renderers import start_renderers
+    from resume_latex import bulk_resume_latex
+    from template_registry import template_registry
+    renderer = get_renderer(args.renderer)
+    # Builds any missing template formats once here, before the worker processes look for them
+    disable_warm_pools()
+    start_renderers(template_registry.sources())
+
+    lines, close = open_lines(args.input)
+    try:
+        records = read_records(lines, bulk_resume_latex, renderer.version())
+        summary = write_to_directory(records, args.out, renderer.name, template_registry.sources(), args.workers)
+    finally:
+        close()
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
+
+if __name__ == "__main__":
+    main_cli()
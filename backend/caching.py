@@ -0,0 +1,312 @@
+# caching.py (in-process LRU, content-addressed PDF cache and AI response cache)
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Cache Configuration ---
+PDF_CACHE_MEMORY_MAX_BYTES = int(os.getenv("PDF_CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+PDF_CACHE_DISK_MAX_BYTES = int(os.getenv("PDF_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(BACKEND_DIR, ".pdf_cache"))
+AI_CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND", "memory")   # "memory", "sqlite" or "off"
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "10000"))
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(BACKEND_DIR, ".ai_cache.sqlite3"))
+
+class LRUCache:
+    # Thread-safe LRU bounded by item count and, optionally, by total size of the values.
+    def __init__(self, max_items: int = 1024, max_bytes: Optional[int] = None, sizeof: Callable[[Any], int] = len):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key, value) -> None:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes: return
+        with self._lock:
+            if key in self._data:
+                if self.max_bytes is not None: self._bytes -= self.sizeof(self._data[key])
+                del self._data[key]
+            self._data[key] = value
+            self._bytes += size
+            while len(self._data) > self.max_items or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                if self.max_bytes is not None: self._bytes -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes if self.max_bytes is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class PDFCache:
+    # Two-tier cache of compiled PDFs, keyed by the hash of the populated LaTeX source plus the
+    # compiler version. The memory tier is a byte-bounded LRU; the disk tier is a directory of
+    # <key>.pdf files trimmed oldest-first (by mtime, refreshed on every hit) once over budget.
+    # Several worker processes may share the disk tier, each seeing only its own writes, so the
+    # byte count is rescanned from the directory every RESCAN_EVERY puts.
+    RESCAN_EVERY = 64
+
+    def __init__(self, cache_dir: str = PDF_CACHE_DIR, memory_max_bytes: int = PDF_CACHE_MEMORY_MAX_BYTES,
+                 disk_max_bytes: int = PDF_CACHE_DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = LRUCache(max_items=4096, max_bytes=memory_max_bytes)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_bytes: Optional[int] = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(latex_source: str, compiler_version: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(compiler_version.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(latex_source.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[bytes]:
+        pdf_bytes = self.memory.get(key)
+        if pdf_bytes is not None:
+            with self._lock: self.memory_hits += 1
+            return pdf_bytes
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f: pdf_bytes = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock: self.misses += 1
+            return None
+        self.memory.put(key, pdf_bytes)
+        with self._lock: self.disk_hits += 1
+        return pdf_bytes
+
+    def put(self, key: str, pdf_bytes: bytes) -> None:
+        self.memory.put(key, pdf_bytes)
+        if self.disk_max_bytes <= 0: return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write-then-rename so concurrent readers never see a half-written PDF
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f: f.write(pdf_bytes)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"--- PDF CACHE WRITE FAILED ---: {e}")
+            return
+        with self._lock:
+            self._puts += 1
+            if self._disk_bytes is None or self._puts % self.RESCAN_EVERY == 0: self._disk_bytes = self._scan_disk_bytes()
+            else: self._disk_bytes += len(pdf_bytes)
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget: self.evict_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pdf"): continue
+            try: st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError: continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def _scan_disk_bytes(self) -> int:
+        if not os.path.isdir(self.cache_dir): return 0
+        return sum(size for _, size, _ in self._disk_entries())
+
+    def evict_disk(self) -> None:
+        # Trim to 90% of the budget so we don't rescan the directory on every put
+        with self._lock:
+            entries = sorted(self._disk_entries())
+            total = sum(size for _, size, _ in entries)
+            target = int(self.disk_max_bytes * 0.9)
+            for _, size, name in entries:
+                if total <= target: break
+                try: os.remove(os.path.join(self.cache_dir, name))
+                except OSError: continue
+                total -= size
+            self._disk_bytes = total
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes,
+        }
+
+pdf_cache = PDFCache()
+
+# --- AI Response Cache ---
+class MemoryTTLBackend:
+    # In-process backend: an LRU whose entries also expire after ttl seconds.
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES, ttl: float = AI_CACHE_TTL):
+        self.ttl = ttl
+        self._lru = LRUCache(max_items=max_entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, int]]:
+        entry = self._lru.get(key)
+        if entry is None: return None
+        expires_at, value, tokens = entry
+        if expires_at < time.time(): return None
+        return value, tokens
+
+    def put(self, key: str, value: str, tokens: int) -> None:
+        self._lru.put(key, (time.time() + self.ttl, value, tokens))
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+class SQLiteTTLBackend:
+    # On-disk backend that survives restarts and can be shared by several worker processes.
+    # last_used is refreshed on every hit, so trimming oldest-last_used rows gives LRU eviction.
+    TRIM_EVERY = 100
+
+    def __init__(self, path: str = AI_CACHE_PATH, max_entries: int = AI_CACHE_MAX_ENTRIES, ttl: float = AI_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._puts = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS ai_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, tokens INTEGER NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ai_cache_last_used ON ai_cache (last_used)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One transaction on a fresh connection, closed afterwards (sqlite3's own context manager
+        # only commits or rolls back and leaves the connection open until garbage collection)
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            yield conn
+
+    def get(self, key: str) -> Optional[Tuple[str, int]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, tokens FROM ai_cache WHERE key = ? AND expires_at >= ?", (key, now)).fetchone()
+            if row is None: return None
+            conn.execute("UPDATE ai_cache SET last_used = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def put(self, key: str, value: str, tokens: int) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO ai_cache (key, value, tokens, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                         (key, value, tokens, now + self.ttl, now))
+        self._puts += 1
+        if self._puts % self.TRIM_EVERY == 0: self.trim()
+
+    def trim(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ai_cache WHERE expires_at < ?", (time.time(),))
+            conn.execute("DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+
+class AIResponseCache:
+    # Caches cleaned Gemini rewrites keyed on (operation, model, prompt version, normalized text),
+    # counting hits, misses and the tokens the skipped model calls would have cost.
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # Retries and copy-pasted templates differ mostly in whitespace and Unicode composition
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def key_for(cls, operation: str, model_name: str, prompt_version, text: str) -> str:
+        payload = json.dumps([operation, model_name, str(prompt_version), cls.normalize(text)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.backend is None: return None
+        try:
+            entry = self.backend.get(key)
+        except sqlite3.Error as e:
+            print(f"--- AI CACHE READ FAILED ---: {e}")
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += entry[1]
+        return entry[0]
+
+    def put(self, key: str, value: str, tokens: int = 0) -> None:
+        if self.backend is None: return
+        try:
+            self.backend.put(key, value, tokens)
+        except sqlite3.Error as e:
+            print(f"--- AI CACHE WRITE FAILED ---: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
+
+def make_ai_cache_backend(name: str = AI_CACHE_BACKEND):
+    if name == "sqlite": return SQLiteTTLBackend()
+    if name == "memory": return MemoryTTLBackend()
+    return None
+
+ai_cache = AIResponseCache(make_ai_cache_backend())
@@ -0,0 +1,165 @@
+# fit_solver.py (squeeze a populated resume onto one page by searching spacing and font knobs)
+import os
+import re
+import asyncio
+from typing import Any, Awaitable, Callable, List, NamedTuple, Tuple
+
+# --- Knob Limits (all overridable from the environment) ---
+FIT_MIN_STRETCH = float(os.getenv("FIT_MIN_STRETCH", "0.85"))                 # tightest line spacing, as a fraction of the template's
+FIT_MAX_ITEMSEP_SHRINK_MM = float(os.getenv("FIT_MAX_ITEMSEP_SHRINK_MM", "1.0"))  # most we take off every itemsep=
+FIT_FONT_SIZES = [size.strip() for size in os.getenv("FIT_FONT_SIZES", "11pt,10pt").split(",") if size.strip()]
+FIT_PARALLELISM = int(os.getenv("FIT_PARALLELISM", "3"))     # candidates compiled side by side per search round
+FIT_SEARCH_ROUNDS = int(os.getenv("FIT_SEARCH_ROUNDS", "3"))  # each round narrows the interval by FIT_PARALLELISM + 1
+
+METRICS_MARKER = "RESUME-FIT"   # the whole \typeout line must stay under TeX's 79-column log wrap
+MAX_DIMEN_PT = 16383.0   # \pagegoal is \maxdimen while the current page is still empty
+PT_PER_MM = 72.27 / 25.4
+
+DOCUMENTCLASS_PATTERN = re.compile(r"\\documentclass(\[([^\]]*)\])?")
+FONT_SIZE_OPTION_PATTERN = re.compile(r"\b1[012]pt\b")
+SETSTRETCH_PATTERN = re.compile(r"\\setstretch\{([\d.]+)\}")
+ITEMSEP_PATTERN = re.compile(r"itemsep\s*=\s*(-?\s*\d+(?:\.\d+)?)\s*(mm|pt)")   # generators write both "itemsep=-1.55mm" and "itemsep = -1.5 mm"
+PAGES_PATTERN = re.compile(r"Output written on .*?\((\d+) pages?")
+METRICS_PATTERN = re.compile(METRICS_MARKER + r" total=([-\d.]+)pt goal=([-\d.]+)pt height=([-\d.]+)pt")
+
+# Size commands as the standard classes' size10/11/12.clo define them: (command, size pt, baselineskip pt).
+# A fit variant switches to another size inside the body instead of changing the \documentclass
+# option, so every variant keeps the template's preamble and shares its precompiled format and warm
+# TeX pool (a new preamble would build a format and register a pool of its own for each size).
+CLASS_FONT_SIZES = {
+    "10pt": [("normalsize", 10, 12), ("small", 9, 11), ("footnotesize", 8, 9.5), ("scriptsize", 7, 8), ("tiny", 5, 6),
+             ("large", 12, 14), ("Large", 14.4, 18), ("LARGE", 17.28, 22), ("huge", 20.74, 25), ("Huge", 24.88, 30)],
+    "11pt": [("normalsize", 10.95, 13.6), ("small", 10, 12), ("footnotesize", 9, 11), ("scriptsize", 8, 9.5), ("tiny", 6, 7),
+             ("large", 12, 14), ("Large", 14.4, 18), ("LARGE", 17.28, 22), ("huge", 20.74, 25), ("Huge", 24.88, 30)],
+    "12pt": [("normalsize", 12, 14.5), ("small", 10.95, 13.6), ("footnotesize", 10, 12), ("scriptsize", 8, 9.5), ("tiny", 6, 7),
+             ("large", 14.4, 18), ("Large", 17.28, 22), ("LARGE", 20.74, 25), ("huge", 24.88, 30), ("Huge", 24.88, 30)],
+}
+for _size in FIT_FONT_SIZES:
+    if _size not in CLASS_FONT_SIZES: raise ValueError(f"FIT_FONT_SIZES: unsupported size '{_size}' (use {', '.join(CLASS_FONT_SIZES)})")
+
+class FitSettings(NamedTuple):
+    font_size: str       # class size to set the body in, e.g. "11pt" (a key of CLASS_FONT_SIZES)
+    compression: float   # 0 = template spacing, 1 = tightest allowed spacing
+
+    def describe(self, base_stretch: float) -> str:
+        return f"font={self.font_size};stretch={stretch_for(self, base_stretch):.3f};itemsep_shrink={self.compression * FIT_MAX_ITEMSEP_SHRINK_MM:.2f}mm"
+
+class FitMeasurement(NamedTuple):
+    pages: int
+    slack_pt: float      # free vertical space left on the last page
+    overflow_pt: float   # how far the content runs past one page (0 when it fits)
+
+    @property
+    def fits(self) -> bool:
+        return self.pages == 1
+
+class FitOutcome(NamedTuple):
+    status: str          # "fits" (untouched), "compressed" (knobs applied) or "overflow" (tightest still too long)
+    settings: FitSettings
+    measurement: FitMeasurement
+    result: Any          # whatever the evaluate callback returned alongside the measurement (the PDF)
+    evaluated: int       # candidates handed to the evaluate callback (it may serve some from a cache)
+
+def template_stretch(latex_source: str) -> float:
+    match = SETSTRETCH_PATTERN.search(latex_source)
+    return float(match.group(1)) if match else 1.0
+
+def template_font_size(latex_source: str) -> str:
+    # The \documentclass size option; the standard classes default to 10pt
+    match = DOCUMENTCLASS_PATTERN.search(latex_source)
+    size = FONT_SIZE_OPTION_PATTERN.search(match.group(2) or "") if match else None
+    return size.group() if size else "10pt"
+
+def font_size_commands(font_size: str) -> str:
+    sizes = "".join(f"\\renewcommand\\{name}{{\\@setfontsize\\{name}{{{size}}}{{{skip}}}}}\n" for name, size, skip in CLASS_FONT_SIZES[font_size])
+    return f"\\makeatletter\n{sizes}\\makeatother\n\\normalsize\n"
+
+def stretch_for(settings: FitSettings, base_stretch: float) -> float:
+    return base_stretch * (1 - settings.compression * (1 - FIT_MIN_STRETCH))
+
+def is_untouched(latex_source: str, settings: FitSettings) -> bool:
+    return settings.compression == 0 and settings.font_size == template_font_size(latex_source)
+
+def apply_settings(latex_source: str, settings: FitSettings) -> str:
+    # Rewrites the body of a populated template for one candidate (the preamble is left alone): the
+    # size commands when the font size differs from the class's, a \linespread override right after
+    # \begin{document}, tighter itemsep= values, and a \typeout of the last page's fill level.
+    # Settings that change nothing return the source as is, so that candidate is the very document
+    # /generate_pdf compiles and shares its PDF cache entry.
+    if is_untouched(latex_source, settings): return latex_source
+    def shrink_itemsep(match):
+        shrink = settings.compression * FIT_MAX_ITEMSEP_SHRINK_MM * (1 if match.group(2) == "mm" else PT_PER_MM)
+        return f"itemsep={float(match.group(1).replace(' ', '')) - shrink:.2f}{match.group(2)}"
+
+    stretch = stretch_for(settings, template_stretch(latex_source))
+    sizes = font_size_commands(settings.font_size) if settings.font_size != template_font_size(latex_source) else ""
+    if settings.compression > 0: latex_source = ITEMSEP_PATTERN.sub(shrink_itemsep, latex_source)
+    latex_source = latex_source.replace("\\begin{document}", f"\\begin{{document}}\n{sizes}\\linespread{{{stretch:.4f}}}\\selectfont\n", 1)
+    metrics = f"\\par\\typeout{{{METRICS_MARKER} total=\\the\\pagetotal\\space goal=\\the\\pagegoal\\space height=\\the\\textheight}}\n"
+    end = latex_source.rfind("\\end{document}")
+    return latex_source[:end] + metrics + latex_source[end:]
+
+def page_count(log_content: str) -> int:
+    # From pdfTeX's summary line; 0 when the log has none
+    pages_match = PAGES_PATTERN.search(log_content)
+    return int(pages_match.group(1)) if pages_match else 0
+
+def pages_only(pages: int) -> FitMeasurement:
+    # What is known about a document compiled without our \typeout (slack_pt is NaN: not measured)
+    return FitMeasurement(pages=pages, slack_pt=float("nan"), overflow_pt=0.0 if pages == 1 else float("inf"))
+
+def measure(log_content: str) -> FitMeasurement:
+    # Page count from pdfTeX's summary line, fill level of the last page from our \typeout.
+    pages = page_count(log_content)
+    metrics = METRICS_PATTERN.search(log_content)
+    if not metrics: return pages_only(pages)
+    total, goal, textheight = (float(value) for value in metrics.groups())
+    if goal >= MAX_DIMEN_PT: total, goal = 0.0, textheight
+    if pages <= 1: return FitMeasurement(pages=pages, slack_pt=goal - total, overflow_pt=0.0)
+    return FitMeasurement(pages=pages, slack_pt=goal - total, overflow_pt=(pages - 2) * textheight + total)
+
+Evaluate = Callable[[FitSettings], Awaitable[Tuple[FitMeasurement, Any]]]
+
+async def solve(evaluate: Evaluate) -> FitOutcome:
+    # Finds the least compression that still fits on one page. The untouched resume is evaluated on
+    # its own first and is the answer whenever it fits, which is the common case. Only when it
+    # overflows, the tightest setting of every font size is compiled side by side; then, for the first
+    # (largest) font size whose tightest setting fits, a FIT_PARALLELISM-ary search over the
+    # compression runs for FIT_SEARCH_ROUNDS rounds. At most 1 + len(FIT_FONT_SIZES) +
+    # FIT_PARALLELISM * FIT_SEARCH_ROUNDS evaluations, in 2 + FIT_SEARCH_ROUNDS sequential steps.
+    evaluated = 0
+
+    async def run(candidates: List[FitSettings]):
+        nonlocal evaluated
+        evaluated += len(candidates)
+        return list(zip(candidates, await asyncio.gather(*(evaluate(settings) for settings in candidates))))
+
+    untouched = FitSettings(FIT_FONT_SIZES[0], 0.0)
+    [(_, (measurement, result))] = await run([untouched])
+    if measurement.fits: return FitOutcome("fits", untouched, measurement, result, evaluated)
+    tightest = await run([FitSettings(size, 1.0) for size in FIT_FONT_SIZES])
+
+    fitting = next(((settings, evaluated) for settings, evaluated in tightest if evaluated[0].fits), None)
+    if fitting is None:
+        # Nothing fits even at the tightest setting: hand back the shortest attempt
+        settings, (measurement, result) = min(tightest, key=lambda item: (item[1][0].pages, item[1][0].overflow_pt))
+        return FitOutcome("overflow", settings, measurement, result, evaluated)
+
+    best_settings, (best_measurement, best_result) = fitting
+    font_size = best_settings.font_size
+    low = 0.0 if font_size == FIT_FONT_SIZES[0] else -1.0   # -1: this size's untouched spacing is still untested
+    high = 1.0
+    for _ in range(FIT_SEARCH_ROUNDS):
+        step = (high - low) / (FIT_PARALLELISM + 1)
+        points = [max(0.0, low + step * (i + 1)) for i in range(FIT_PARALLELISM)]
+        candidates = [FitSettings(font_size, round(point, 4)) for point in dict.fromkeys(points) if point < high]
+        if not candidates: break
+        results = await run(candidates)
+        fitting_here = [(settings, evaluated) for settings, evaluated in results if evaluated[0].fits]
+        if fitting_here:
+            best_settings, (best_measurement, best_result) = min(fitting_here, key=lambda item: item[0].compression)
+            high = best_settings.compression
+        below = [settings.compression for settings, evaluated in results if not evaluated[0].fits and settings.compression < high]
+        low = max(below) if below else low
+        if high <= 0.0: break
+    return FitOutcome("compressed", best_settings, best_measurement, best_result, evaluated)
@@ -0,0 +1,40 @@
+# gunicorn.conf.py (multi-process deployment: gunicorn managing uvicorn workers)
+#   gunicorn -c gunicorn.conf.py main:app
+# One worker per CPU by default (WEB_CONCURRENCY overrides). Each worker is a full copy of the app
+# with its own event loop, warm TeX pool and compile threads, so the per-process defaults below are
+# scaled down to keep the host-wide totals where a single process would put them. Shared between
+# workers: the PDF cache's disk tier, the AI response cache (SQLite), the LaTeX formats and the
+# job queue. Per worker: the in-memory LRUs, preview supersession and incremental build sessions
+# (a session whose next request lands on another worker just gets a full build).
+import math
+import os
+
+cpu_count = os.cpu_count() or 1
+workers = int(os.getenv("WEB_CONCURRENCY", str(cpu_count)))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))   # longest compile or AI call plus headroom
+graceful_timeout = 30
+keepalive = 5
+
+# Read by the app at import time in each worker, which inherits the master's environment.
+# Explicit settings always win.
+if workers > 1:
+    os.environ.setdefault("AI_CACHE_BACKEND", "sqlite")   # one cache for all workers instead of N cold ones
+    os.environ.setdefault("MAX_CONCURRENT_COMPILES", str(max(1, math.ceil(cpu_count / workers))))
+    # Long-lived connections are not spread evenly across workers, so keep the host-wide queue depth
+    # per worker rather than shedding load from a busy worker while another one idles
+    os.environ.setdefault("MAX_COMPILE_QUEUE", str(4 * cpu_count))
+    os.environ.setdefault("LATEX_POOL_SIZE", "1")
+    # The opt-in LuaTeX engine compiles cold per worker unless it is the default renderer
+    os.environ.setdefault("LUALATEX_POOL_SIZE", "1" if os.getenv("RENDERER") == "lualatex" else "0")
+    os.environ.setdefault("PDF_CACHE_MEMORY_MAX_BYTES", str(max(8 * 1024 * 1024, 64 * 1024 * 1024 // workers)))
+    os.environ.setdefault("JOB_WORKERS", "1")
+    # Every worker may run one /bulk/pdf export at a time; split the bulk half of the host between them
+    os.environ.setdefault("BULK_HTTP_WORKERS", str(max(1, cpu_count // 2 // workers)))
+
+def on_starting(server):
+    # Build (or find) the template formats once in the master, before the workers race to do it
+    from latex_compiler import build_formats
+    from template_registry import template_registry
+    build_formats(template_registry.sources())
@@ -0,0 +1,56 @@
+# incremental.py (per-session build history: which sections changed since the last build)
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from caching import LRUCache
+
+INCREMENTAL_MAX_SESSIONS = int(os.getenv("INCREMENTAL_MAX_SESSIONS", "2048"))
+
+class BuildFingerprint(NamedTuple):
+    # layout_key hashes everything that can move content between pages or change the page frame:
+    # renderer, body template, header and its data, and the order of the non-empty sections.
+    # sections maps each rendered section to the digest of its data.
+    layout_key: str
+    sections: Dict[str, str]
+
+class BuildPlan(NamedTuple):
+    changed: List[str]              # sections whose content differs from the previous build
+    reason: str
+    layout_changed: bool = True     # False when only section contents differ from the previous build
+
+class BuildSessions:
+    # Remembers the last build of each editing session (bounded LRU) and reports what the next one
+    # changes, so the editor can tell which sections a new PDF differs in. Every compile is still a
+    # full one: the resumes are single-pass documents, so a checkpointed .aux has nothing to save,
+    # and seeding one would keep the compile off the warm pool, whose workers start before the job.
+    # Adding, removing or reordering sections, or touching the header or template, marks the whole
+    # layout as changed.
+    def __init__(self, max_sessions: int = INCREMENTAL_MAX_SESSIONS):
+        self._sessions = LRUCache(max_items=max_sessions)
+        self._lock = threading.Lock()
+        self.compiles = 0
+        self.section_edit_compiles = 0
+
+    def plan(self, session_id: Optional[str], fingerprint: BuildFingerprint) -> BuildPlan:
+        previous = self._sessions.get(session_id) if session_id else None
+        if previous is None:
+            return BuildPlan(changed=list(fingerprint.sections), reason="first build")
+        if previous.layout_key != fingerprint.layout_key:
+            return BuildPlan(changed=list(fingerprint.sections), reason="layout changed")
+        changed = [key for key, digest in fingerprint.sections.items() if previous.sections.get(key) != digest]
+        return BuildPlan(changed=changed, reason="sections changed", layout_changed=False)
+
+    def record(self, session_id: Optional[str], fingerprint: BuildFingerprint, plan: BuildPlan, compiled: bool) -> None:
+        # compiled is False when the response came from a cache, which is not counted as a build
+        if compiled:
+            with self._lock:
+                self.compiles += 1
+                if not plan.layout_changed: self.section_edit_compiles += 1
+        if session_id: self._sessions.put(session_id, fingerprint)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "compiles": self.compiles, "section_edit_compiles": self.section_edit_compiles}
+
+build_sessions = BuildSessions()
@@ -0,0 +1,236 @@
+# job_queue.py (persistent PDF job queue drained by in-process workers)
+import os
+import json
+import time
+import uuid
+import asyncio
+import socket
+import sqlite3
+import ipaddress
+import traceback
+from contextlib import closing, contextmanager
+from typing import Awaitable, Callable, Iterator, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Job Queue Configuration ---
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(BACKEND_DIR, ".jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))                       # jobs this process runs at once
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))       # idle workers look for jobs queued by other processes
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))       # a running job not finished by then is handed out again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", str(24 * 3600)))    # finished jobs (and their PDFs) are kept this long
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "2.0"))           # back-off when the compile queue is full
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+# Comma-separated hosts webhooks may be sent to; when empty, any host that resolves to public addresses only
+JOB_WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()}
+
+# Lower runs first: interactive previews jump ahead of bulk exports queued earlier
+JOB_PRIORITIES = {"interactive": 0, "bulk": 10}
+
+class JobRetry(Exception):
+    # Raised by a job's process callback when it should be run again later (e.g. the compile queue is full)
+    pass
+
+def check_webhook_url(url: str) -> None:
+    # Raises ValueError unless url is an http(s) URL on an allowed host. Without an allowlist every
+    # address the host resolves to must be public, so a client can't make the server POST to
+    # loopback, private-network or link-local (cloud metadata) addresses. Resolves DNS, so it blocks.
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname: raise ValueError("webhook_url must be an http(s) URL")
+    host = parts.hostname.lower()
+    if JOB_WEBHOOK_ALLOWED_HOSTS:
+        if host not in JOB_WEBHOOK_ALLOWED_HOSTS: raise ValueError(f"webhook host '{host}' is not allowed")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80), proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"webhook host '{host}' does not resolve: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if getattr(ip, "ipv4_mapped", None): ip = ip.ipv4_mapped
+        if not ip.is_global:
+            raise ValueError(f"webhook host '{host}' resolves to a non-public address")
+
+class Job(NamedTuple):
+    id: str
+    payload: dict
+    webhook_url: Optional[str]
+    attempts: int
+
+class JobQueue:
+    # Jobs live in SQLite, so they survive restarts and every worker process on the host drains the
+    # same queue. Claiming a job leases it for JOB_LEASE_SECONDS; a worker that dies mid-job leaves an
+    # expired lease behind and the job is picked up again, up to JOB_MAX_ATTEMPTS times. Submitting a
+    # job whose dedup key matches a queued, running or still-kept finished job returns that job (the
+    # duplicate's webhook is not registered).
+    TRIM_EVERY = 100
+
+    def __init__(self, path: str = JOB_DB_PATH, workers: int = JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.completed = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self._submits = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, dedup_key TEXT NOT NULL, priority INTEGER NOT NULL, "
+                         "status TEXT NOT NULL, payload TEXT NOT NULL, result BLOB, error TEXT, webhook_url TEXT, "
+                         "attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, not_before REAL NOT NULL, "
+                         "started REAL, lease_until REAL, finished REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One transaction on a fresh connection, closed afterwards (sqlite3's own context manager
+        # only commits or rolls back and leaves the connection open until garbage collection)
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            yield conn
+
+    def submit(self, dedup_key: str, payload: dict, priority: str = "interactive", webhook_url: Optional[str] = None):
+        # Returns (job_id, deduplicated). A duplicate submitted at a more urgent priority promotes the queued job.
+        now = time.time()
+        rank = JOB_PRIORITIES[priority]
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, priority FROM jobs WHERE dedup_key = ? AND status != 'failed' ORDER BY created DESC LIMIT 1",
+                               (dedup_key,)).fetchone()
+            if row is not None:
+                if rank < row[1]: conn.execute("UPDATE jobs SET priority = ? WHERE id = ? AND status = 'queued'", (rank, row[0]))
+                self.deduplicated += 1
+                return row[0], True
+            job_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO jobs (id, dedup_key, priority, status, payload, webhook_url, created, not_before) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                         (job_id, dedup_key, rank, json.dumps(payload), webhook_url, now, now))
+        self._submits += 1
+        if self._submits % self.TRIM_EVERY == 0: self.trim()
+        return job_id, False
+
+    def wake(self) -> None:
+        # Called on the event loop after a submit so an idle worker starts right away instead of at its next poll
+        if self._wake is not None: self._wake.set()
+
+    def claim(self) -> Optional[Job]:
+        # Most urgent, oldest runnable job: queued and due, or running with an expired lease
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            while True:
+                row = conn.execute("SELECT id, payload, webhook_url, attempts FROM jobs WHERE (status = 'queued' AND not_before <= ?) "
+                                   "OR (status = 'running' AND lease_until < ?) ORDER BY priority, created LIMIT 1", (now, now)).fetchone()
+                if row is None: return None
+                job_id, payload, webhook_url, attempts = row
+                if attempts < JOB_MAX_ATTEMPTS: break
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                             (f"Gave up after {attempts} attempts", now, job_id))
+            conn.execute("UPDATE jobs SET status = 'running', started = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                         (now, now + JOB_LEASE_SECONDS, job_id))
+        return Job(job_id, json.loads(payload), webhook_url, attempts + 1)
+
+    def complete(self, job_id: str, result: bytes) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'done', result = ?, error = NULL, finished = ? WHERE id = ?", (result, time.time(), job_id))
+        self.completed += 1
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?", (error, time.time(), job_id))
+        self.failed += 1
+
+    def retry_later(self, job_id: str, delay: float = JOB_RETRY_DELAY) -> None:
+        # Back to the queue without using up an attempt
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', not_before = ?, attempts = attempts - 1 WHERE id = ?", (time.time() + delay, job_id))
+
+    def status(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT status, priority, attempts, error, created, started, finished FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None: return None
+        status, priority, attempts, error, created, started, finished = row
+        names = {rank: name for name, rank in JOB_PRIORITIES.items()}
+        return {"id": job_id, "status": status, "priority": names.get(priority, priority), "attempts": attempts, "error": error,
+                "created": created, "started": started, "finished": finished}
+
+    def result(self, job_id: str) -> Optional[bytes]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT result FROM jobs WHERE id = ? AND status = 'done'", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def trim(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (time.time() - JOB_RESULT_TTL,))
+
+    def notify(self, job: Job) -> None:
+        # POSTs the job's final status to its webhook; delivery is best effort, polling stays authoritative.
+        # The URL is checked again here (DNS may have changed since submit) and redirects aren't followed.
+        try:
+            check_webhook_url(job.webhook_url)
+            response = requests.post(job.webhook_url, json=self.status(job.id), timeout=JOB_WEBHOOK_TIMEOUT, allow_redirects=False)
+            response.raise_for_status()
+        except (ValueError, requests.RequestException) as e:
+            print(f"--- JOB {job.id} WEBHOOK FAILED ---: {e}")
+
+    # --- Workers ---
+    def start(self, process: Callable[[dict], Awaitable[bytes]]) -> None:
+        # Starts self.workers asyncio tasks on the running loop; each awaits process(payload) per job
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._work(process)) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Jobs interrupted here keep their lease and are picked up again once it expires
+        for task in self._tasks: task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, process: Callable[[dict], Awaitable[bytes]]) -> None:
+        # One iteration per job; an error anywhere in it (claiming, recording the outcome) is logged
+        # and the worker carries on, since a dead task would shrink the pool until the next restart.
+        # A job whose outcome could not be recorded keeps its lease and is handed out again later.
+        while True:
+            try:
+                await self._step(process)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print("--- JOB QUEUE WORKER ERROR ---"); traceback.print_exc(); print("-------------------------")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def _step(self, process: Callable[[dict], Awaitable[bytes]]) -> None:
+        self._wake.clear()
+        job = await asyncio.to_thread(self.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            return
+        await self._run(job, process)
+
+    async def _run(self, job: Job, process: Callable[[dict], Awaitable[bytes]]) -> None:
+        try:
+            result = await process(job.payload)
+        except JobRetry:
+            await asyncio.to_thread(self.retry_later, job.id)
+            return
+        except Exception as e:
+            print(f"--- JOB {job.id} FAILED (attempt {job.attempts}) ---"); traceback.print_exc(); print("-------------------------")
+            await asyncio.to_thread(self.fail, job.id, str(e))
+        else:
+            await asyncio.to_thread(self.complete, job.id, result)
+        if job.webhook_url: await asyncio.to_thread(self.notify, job)
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        # Status counts cover every process sharing the database; the rest is this process's own work
+        return {**{status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")}, "workers": len(self._tasks),
+                "completed_here": self.completed, "failed_here": self.failed, "deduplicated": self.deduplicated}
+
+job_queue = JobQueue()
@@ -0,0 +1,700 @@
+# latex_compiler.py (pdflatex compilation: warm worker pool, cold fallback, scratch dirs)
+import os
+import re
+import asyncio
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import hashlib
+import functools
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from metrics import stage
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Pool Configuration (all overridable from the environment) ---
+LATEX_POOL_SIZE = int(os.getenv("LATEX_POOL_SIZE", "2"))                      # warm workers kept per template, 0 disables the pool
+LATEX_POOL_WARMUP_TIMEOUT = float(os.getenv("LATEX_POOL_WARMUP_TIMEOUT", "30")) # seconds a worker may take to load its preamble
+LATEX_POOL_JOB_TIMEOUT = float(os.getenv("LATEX_POOL_JOB_TIMEOUT", "30"))       # seconds before a typesetting job counts as stuck
+LATEX_POOL_MAX_IDLE = float(os.getenv("LATEX_POOL_MAX_IDLE", "1800"))           # recycle idle workers older than this
+LATEX_POOL_HEALTH_INTERVAL = float(os.getenv("LATEX_POOL_HEALTH_INTERVAL", "5"))
+LATEX_MAX_PASSES = int(os.getenv("LATEX_MAX_PASSES", "3"))                      # hard cap on pdflatex passes per job
+
+# --- Scratch Directory Configuration ---
+def default_scratch_root() -> str:
+    # Prefer tmpfs so .tex/.aux/.log/.pdf churn never touches the container disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK): return os.path.join("/dev/shm", "resume-scratch")
+    return os.path.join(tempfile.gettempdir(), "resume-scratch")
+
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT", default_scratch_root())
+SCRATCH_MAX_AGE = float(os.getenv("SCRATCH_MAX_AGE", "600"))                     # job dirs older than this are orphans
+SCRATCH_MAX_BYTES = int(os.getenv("SCRATCH_MAX_BYTES", str(256 * 1024 * 1024)))  # evict oldest job dirs above this total
+SCRATCH_MIN_AGE = float(os.getenv("SCRATCH_MIN_AGE", "120"))                     # never size-evict dirs younger than this
+SCRATCH_JANITOR_INTERVAL = float(os.getenv("SCRATCH_JANITOR_INTERVAL", "60"))
+
+# --- Precompiled Format Configuration ---
+LATEX_FORMATS = os.getenv("LATEX_FORMATS", "1").lower() in ("1", "true", "yes")   # dump a .fmt per template preamble
+LATEX_FORMAT_DIR = os.getenv("LATEX_FORMAT_DIR", os.path.join(BACKEND_DIR, ".latex_formats"))
+LATEX_FORMAT_BUILD_TIMEOUT = float(os.getenv("LATEX_FORMAT_BUILD_TIMEOUT", "120"))
+
+# --- Concurrency Configuration ---
+MAX_CONCURRENT_COMPILES = int(os.getenv("MAX_CONCURRENT_COMPILES", str(os.cpu_count() or 2)))
+MAX_COMPILE_QUEUE = int(os.getenv("MAX_COMPILE_QUEUE", str(4 * MAX_CONCURRENT_COMPILES)))  # waiting jobs before we answer 503
+
+BEGIN_DOCUMENT = "\\begin{document}"
+END_DOCUMENT = "\\end{document}"
+READY_MARKER = "RESUME-POOL-READY"
+WORKER_JOBNAME = "job"
+WORKER_BODY_FILE = "body.tex"
+JOB_NAME = "resume"
+JOB_DIR_PREFIX = "job-"
+WORKER_DIR_PREFIX = "worker-"
+FORMAT_PREFIX = "resume-"
+FORMAT_DIR_PREFIX = "format-"
+# mylatexformat dumps everything up to \endofdump; \csname keeps the marker a no-op without the format
+END_OF_DUMP = "\\csname endofdump\\endcsname\n"
+
+# Messages LaTeX and common packages (hyperref, rerunfilecheck) print when the output is stale
+RERUN_PATTERN = re.compile(r"Rerun to get|Please rerun LaTeX|Rerun LaTeX|Label\(s\) may have changed")
+# .aux lines that feed back into the next pass; boilerplate such as \relax or hyperref's
+# \providecommand preamble is written on every run and never requires a rerun by itself
+AUX_REFERENCE_PATTERN = re.compile(r"^\\(newlabel|bibcite|@writefile|zref@newlabel)\b")
+# hyperref patches too much at \begin{document} to survive a dump, so the format stops right before it
+DUMP_STOP_PATTERN = re.compile(r"^[ \t]*\\usepackage(\[[^\]]*\])?\{[^}]*\bhyperref\b", re.MULTILINE)
+FORMAT_ERROR_PATTERN = re.compile(r"Fatal format file error|I can't find the format file|---! .* was written by")
+
+class LatexPoolError(Exception):
+    pass
+
+class CompileQueueFull(Exception):
+    pass
+
+class CompileCancelled(Exception):
+    pass
+
+class CompileResult(NamedTuple):
+    passes: int                   # number of pdflatex passes the job needed
+    warm: bool                    # True when the first pass ran on a warm pool worker
+    log: Optional[str] = None     # final .log, only read when the caller asks for it
+
+def split_document(latex_source: str):
+    # Splits a populated template into (preamble, body). The preamble is everything before
+    # \begin{document}; the body is what sits between \begin{document} and \end{document}.
+    start = latex_source.find(BEGIN_DOCUMENT)
+    end = latex_source.rfind(END_DOCUMENT)
+    if start == -1 or end == -1 or end < start:
+        return None, None
+    return latex_source[:start], latex_source[start + len(BEGIN_DOCUMENT):end]
+
+def preamble_key(preamble: str) -> str:
+    return hashlib.sha256(preamble.encode("utf-8")).hexdigest()[:16]
+
+def latex_env(workdir: Optional[str] = None) -> dict:
+    # Templates reference assets such as iitb_logo.png relative to the backend directory,
+    # so it always has to be on the TeX search path (the trailing separator keeps the defaults).
+    search_path = [BACKEND_DIR, ""]
+    if workdir: search_path.insert(0, workdir)
+    env = os.environ.copy()
+    env["TEXINPUTS"] = os.pathsep.join(search_path)
+    env["TEXFORMATS"] = os.pathsep.join([LATEX_FORMAT_DIR, ""])
+    return env
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(engine: str = "pdflatex") -> str:
+    # First line of `<engine> --version`; part of the PDF cache key so a TeX upgrade (or a different
+    # engine) invalidates it.
+    try:
+        result = subprocess.run([engine, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=10)
+        return result.stdout.splitlines()[0].strip() if result.stdout else "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+# --- Cancellation ---
+# The compile thread carries the cancel event of the job it is running, so the TeX processes it
+# waits on can be killed without threading an extra argument through every renderer.
+_job_state = threading.local()
+CANCEL_POLL_INTERVAL = 0.05
+
+@contextlib.contextmanager
+def cancellable(cancel: Optional[threading.Event]):
+    # Nested use keeps the outer event when the inner one is None
+    previous = getattr(_job_state, "cancel", None)
+    _job_state.cancel = cancel or previous
+    try:
+        raise_if_cancelled()
+        yield
+    finally:
+        _job_state.cancel = previous
+
+def raise_if_cancelled() -> None:
+    cancel = getattr(_job_state, "cancel", None)
+    if cancel is not None and cancel.is_set(): raise CompileCancelled("Compile was superseded")
+
+def wait_for_process(process: subprocess.Popen, timeout: Optional[float] = None) -> int:
+    # Like process.wait(timeout), but kills the process and raises CompileCancelled as soon as the
+    # current job is cancelled.
+    cancel = getattr(_job_state, "cancel", None)
+    if cancel is None: return process.wait(timeout=timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        if cancel.is_set():
+            process.kill()
+            process.wait()
+            raise CompileCancelled("Compile was superseded")
+        step = CANCEL_POLL_INTERVAL if deadline is None else min(CANCEL_POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+        try:
+            return process.wait(timeout=step)
+        except subprocess.TimeoutExpired:
+            if deadline is not None and time.monotonic() >= deadline: raise
+
+# --- Rerun Detection ---
+def aux_signature(aux_filepath: str) -> str:
+    # Hash of the cross-reference lines in an .aux file; a missing file counts as empty.
+    lines = []
+    if os.path.exists(aux_filepath):
+        with open(aux_filepath, "r", encoding='utf-8', errors='replace') as f:
+            lines = [line for line in f if AUX_REFERENCE_PATTERN.match(line)]
+    return hashlib.sha256("".join(lines).encode("utf-8")).hexdigest()
+
+def needs_rerun(log_filepath: str, aux_before: str, aux_after: str) -> bool:
+    if aux_before != aux_after: return True
+    if not os.path.exists(log_filepath): return False
+    with open(log_filepath, "r", encoding='utf-8', errors='replace') as f:
+        return RERUN_PATTERN.search(f.read()) is not None
+
+# --- Scratch Directories ---
+def make_scratch_dir(prefix: str = JOB_DIR_PREFIX) -> str:
+    os.makedirs(SCRATCH_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_ROOT)
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass
+    return total
+
+class ScratchJanitor:
+    # Removes scratch dirs left behind by crashed requests or killed workers: anything past its
+    # maximum age, then the oldest job dirs while the scratch root is over SCRATCH_MAX_BYTES.
+    # Live pool workers are protected by their own, longer, age limit.
+    def __init__(self, root: str = SCRATCH_ROOT):
+        self.root = root
+        self.removed = 0
+        self._stop = threading.Event()
+
+    def _max_age(self, name: str) -> float:
+        if name.startswith(WORKER_DIR_PREFIX): return LATEX_POOL_MAX_IDLE + LATEX_POOL_WARMUP_TIMEOUT + 2 * LATEX_POOL_JOB_TIMEOUT
+        return SCRATCH_MAX_AGE
+
+    def sweep(self) -> None:
+        if not os.path.isdir(self.root): return
+        now = time.time()
+        job_dirs = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try: age = now - os.path.getmtime(path)
+            except OSError: continue
+            if age > self._max_age(name):
+                self._remove(path)
+            elif name.startswith(JOB_DIR_PREFIX):
+                job_dirs.append((age, path))
+
+        sizes = [(age, path, dir_size(path)) for age, path in job_dirs]
+        total = sum(size for _, _, size in sizes)
+        for age, path, size in sorted(sizes, reverse=True):
+            if total <= SCRATCH_MAX_BYTES: break
+            if age < SCRATCH_MIN_AGE: continue
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path: str) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+        self.removed += 1
+
+    def _loop(self) -> None:
+        while not self._stop.wait(SCRATCH_JANITOR_INTERVAL):
+            self.sweep()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self.sweep()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+janitor = ScratchJanitor()
+
+# --- Precompiled Formats (one .fmt per template preamble, built with mylatexformat) ---
+def mark_end_of_dump(preamble: str) -> str:
+    # Puts the \endofdump marker in front of hyperref, or at the end of the preamble if there is none.
+    match = DUMP_STOP_PATTERN.search(preamble)
+    if match is None: return preamble + END_OF_DUMP
+    return preamble[:match.start()] + END_OF_DUMP + preamble[match.start():]
+
+class FormatStore:
+    # Keeps a pdflatex format file per template preamble in LATEX_FORMAT_DIR, named after a hash of
+    # the preamble and the compiler version, so editing a template (or upgrading TeX) simply yields a
+    # new name that gets built on first sight. A compile loading such a format skips everything in the
+    # preamble up to the \endofdump marker and only reads what follows (hyperref onwards).
+    def __init__(self, format_dir: str = LATEX_FORMAT_DIR, enabled: bool = LATEX_FORMATS):
+        self.format_dir = format_dir
+        self._enabled = enabled
+        self._formats: Dict[str, str] = {}   # preamble key -> format name, only for formats that built
+        self._failed: Dict[str, str] = {}    # preamble key -> reason, never retried until restart
+        self._building: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def enabled(self) -> bool:
+        if not self._enabled or shutil.which('pdflatex') is None: return False
+        try:
+            found = subprocess.run(['kpsewhich', 'mylatexformat.ltx'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            return False
+        return bool(found.stdout.strip())
+
+    def format_name(self, preamble: str) -> str:
+        digest = hashlib.sha256((compiler_version() + "\n" + preamble).encode("utf-8")).hexdigest()[:16]
+        return f"{FORMAT_PREFIX}{digest}"
+
+    def lookup(self, preamble: str) -> Optional[str]:
+        # Format name for a preamble that is already built; never blocks on a build.
+        with self._lock: return self._formats.get(preamble_key(preamble))
+
+    def ensure(self, preamble: str) -> Optional[str]:
+        # Returns the format name for this preamble, building it first if needed. Concurrent callers
+        # for the same preamble wait for a single build.
+        key = preamble_key(preamble)
+        with self._lock:
+            if key in self._formats: return self._formats[key]
+            if key in self._failed or not self.enabled: return None
+            pending = self._building.get(key)
+            owner = pending is None
+            if owner: pending = self._building[key] = threading.Event()
+        if not owner:
+            pending.wait(LATEX_FORMAT_BUILD_TIMEOUT)
+            return self.lookup(preamble)
+        try:
+            name = self._build(preamble)
+            with self._lock: self._formats[key] = name
+            return name
+        except LatexPoolError as e:
+            print(f"--- LaTeX format build failed, compiling without it: {e} ---")
+            with self._lock: self._failed[key] = str(e)
+            return None
+        finally:
+            with self._lock: del self._building[key]
+            pending.set()
+
+    def ensure_in_background(self, preamble: str) -> None:
+        key = preamble_key(preamble)
+        with self._lock:
+            if key in self._formats or key in self._failed or key in self._building: return
+        threading.Thread(target=self.ensure, args=(preamble,), daemon=True).start()
+
+    def _build(self, preamble: str) -> str:
+        name = self.format_name(preamble)
+        target = os.path.join(self.format_dir, f"{name}.fmt")
+        if os.path.exists(target): return name   # built by an earlier run or at image build time
+        workdir = make_scratch_dir(prefix=FORMAT_DIR_PREFIX)
+        try:
+            with open(os.path.join(workdir, "preamble.tex"), "w", encoding='utf-8') as f:
+                f.write(mark_end_of_dump(preamble) + BEGIN_DOCUMENT + "\n" + END_DOCUMENT + "\n")
+            try:
+                subprocess.run(['pdflatex', '-ini', '-interaction=nonstopmode', f'-jobname={name}', '&pdflatex', 'mylatexformat.ltx', 'preamble.tex'],
+                               cwd=workdir, env=latex_env(workdir), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               timeout=LATEX_FORMAT_BUILD_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                raise LatexPoolError(f"format build exceeded {LATEX_FORMAT_BUILD_TIMEOUT}s")
+            built = os.path.join(workdir, f"{name}.fmt")
+            if not os.path.exists(built): raise LatexPoolError(f"pdflatex -ini did not write {name}.fmt")
+            os.makedirs(self.format_dir, exist_ok=True)
+            # Scratch usually lives on tmpfs, so copy next to the target first; the rename is atomic and
+            # a concurrent compile never loads a half-written file
+            partial = f"{target}.{os.getpid()}.tmp"
+            shutil.copyfile(built, partial)
+            os.replace(partial, target)
+            print(f"--- LaTeX format {name} built ---")
+            return name
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def discard(self, preamble: str, reason: str) -> None:
+        # Called when a compile could not load the format; stop using it until the next restart.
+        key = preamble_key(preamble)
+        with self._lock:
+            name = self._formats.pop(key, None)
+            self._failed[key] = reason
+        if name:
+            print(f"--- LaTeX format {name} unusable ({reason}), compiling without it ---")
+            try: os.remove(os.path.join(self.format_dir, f"{name}.fmt"))
+            except OSError: pass
+
+    def prune(self, keep: List[str]) -> None:
+        # Deletes format files of preambles that are no longer in use (edited or removed templates).
+        if not os.path.isdir(self.format_dir): return
+        wanted = {f"{name}.fmt" for name in keep}
+        for filename in os.listdir(self.format_dir):
+            if filename.startswith(FORMAT_PREFIX) and filename.endswith(".fmt") and filename not in wanted:
+                try: os.remove(os.path.join(self.format_dir, filename))
+                except OSError: pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "formats": dict(self._formats), "failed": dict(self._failed), "building": len(self._building)}
+
+formats = FormatStore()
+
+def build_formats(template_sources: List[str]) -> None:
+    # Builds (or finds on disk) the format of every template and removes stale ones.
+    if not formats.enabled:
+        print("--- LaTeX formats disabled (LATEX_FORMATS=0, or pdflatex/mylatexformat missing) ---")
+        return
+    names = []
+    for template in template_sources:
+        preamble, _ = split_document(template)
+        if preamble is None: continue
+        name = formats.ensure(preamble)
+        if name: names.append(name)
+    formats.prune(names)
+
+def format_failed(log_filepath: str) -> bool:
+    if not os.path.exists(log_filepath): return False
+    with open(log_filepath, "r", encoding='utf-8', errors='replace') as f:
+        return FORMAT_ERROR_PATTERN.search(f.read()) is not None
+
+# --- Cold Path (one fresh pdflatex process per pass) ---
+def compile_cold(tex_filepath: str, passes_done: int = 0, fmt: Optional[str] = None, engine: str = "pdflatex") -> int:
+    # Runs pdflatex until neither the log nor the .aux asks for another pass, capped at
+    # LATEX_MAX_PASSES. The shipped templates have no \ref/\label, so one pass is the norm.
+    workdir, tex_filename = os.path.split(os.path.abspath(tex_filepath))
+    base = os.path.splitext(tex_filepath)[0]
+    aux_filepath, log_filepath = f"{base}.aux", f"{base}.log"
+    command = [engine, '-interaction=nonstopmode', tex_filename]
+    if fmt: command.insert(1, f'-fmt={fmt}')
+    passes = passes_done
+    while passes < LATEX_MAX_PASSES:
+        aux_before = aux_signature(aux_filepath)
+        with stage(f"pass{passes + 1}"):
+            # The terminal output duplicates the .log, so it is discarded rather than piped
+            process = subprocess.Popen(command, cwd=workdir, env=latex_env(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wait_for_process(process)
+        passes += 1
+        if not needs_rerun(log_filepath, aux_before, aux_signature(aux_filepath)): break
+    return passes
+
+# --- Warm Worker ---
+class WarmWorker:
+    # A TeX process (pdflatex unless the pool says otherwise) that has already digested a template's preamble and \begin{document},
+    # and is now blocked on \read waiting for the name of the body file to typeset.
+    # Each worker serves exactly one job (pdflatex writes one PDF per run) and is then replaced.
+
+    def __init__(self, preamble: str, fmt: Optional[str] = None, engine: str = "pdflatex"):
+        self.preamble = preamble
+        self.engine = engine
+        self.fmt = fmt   # precompiled format to load instead of digesting the preamble, if one is built
+        self.key = preamble_key(preamble)
+        self.workdir = make_scratch_dir(prefix=f"{WORKER_DIR_PREFIX}{self.key}-")
+        self.started_at = time.monotonic()
+        self.ready = threading.Event()
+        self.output: List[str] = []
+        self.process: Optional[subprocess.Popen] = None
+
+    def driver_source(self) -> str:
+        return (
+            (mark_end_of_dump(self.preamble) if self.fmt else self.preamble)
+            + BEGIN_DOCUMENT + "\n"
+            + "\\typeout{" + READY_MARKER + "}\n"
+            + "{\\endlinechar=-1 \\global\\read-1 to \\resumebodyfile}\n"
+            + "\\input{\\resumebodyfile}\n"
+            + END_DOCUMENT + "\n"
+        )
+
+    def start(self) -> None:
+        driver_path = os.path.join(self.workdir, "driver.tex")
+        with open(driver_path, "w", encoding='utf-8') as f: f.write(self.driver_source())
+        # scrollmode (not nonstopmode) so TeX is allowed to \read from the terminal.
+        command = [self.engine, '-interaction=scrollmode', f'-jobname={WORKER_JOBNAME}', 'driver.tex']
+        if self.fmt: command.insert(1, f'-fmt={self.fmt}')
+        self.process = subprocess.Popen(
+            command,
+            cwd=self.workdir, env=latex_env(self.workdir),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding='utf-8', errors='replace',
+        )
+        threading.Thread(target=self._read_output, daemon=True).start()
+
+    def _read_output(self) -> None:
+        for line in self.process.stdout:
+            self.output.append(line)
+            if READY_MARKER in line: self.ready.set()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def is_healthy(self) -> bool:
+        if not self.is_alive(): return False
+        age = time.monotonic() - self.started_at
+        if not self.ready.is_set(): return age < LATEX_POOL_WARMUP_TIMEOUT
+        return age < LATEX_POOL_MAX_IDLE
+
+    def run(self, body: str, pdf_filepath: str, log_filepath: str, aux_filepath: str) -> None:
+        if not self.ready.is_set() or not self.is_alive(): raise LatexPoolError("Worker is not ready")
+        with open(os.path.join(self.workdir, WORKER_BODY_FILE), "w", encoding='utf-8') as f: f.write(body)
+        try:
+            # Closing stdin right away means any unexpected prompt hits EOF and aborts the run
+            # instead of hanging forever.
+            with stage("pass1"):
+                self.process.stdin.write(WORKER_BODY_FILE + "\n")
+                self.process.stdin.close()
+                wait_for_process(self.process, timeout=LATEX_POOL_JOB_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise LatexPoolError(f"Worker exceeded the {LATEX_POOL_JOB_TIMEOUT}s job timeout")
+        except (BrokenPipeError, OSError) as e:
+            raise LatexPoolError(f"Worker died before accepting the job: {e}")
+
+        worker_log = os.path.join(self.workdir, f"{WORKER_JOBNAME}.log")
+        if os.path.exists(worker_log): shutil.copyfile(worker_log, log_filepath)
+        worker_aux = os.path.join(self.workdir, f"{WORKER_JOBNAME}.aux")
+        if os.path.exists(worker_aux): shutil.copyfile(worker_aux, aux_filepath)
+        worker_pdf = os.path.join(self.workdir, f"{WORKER_JOBNAME}.pdf")
+        if not os.path.exists(worker_pdf): raise LatexPoolError("Worker finished without producing a PDF")
+        shutil.move(worker_pdf, pdf_filepath)
+
+    def stop(self) -> None:
+        if self.is_alive():
+            self.process.kill()
+            try: self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired: pass
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+# --- Worker Pool ---
+class LatexPool:
+    def __init__(self, size: int = LATEX_POOL_SIZE, engine: str = "pdflatex"):
+        self.size = size
+        self.engine = engine
+        self._workers: Dict[str, List[WarmWorker]] = {}
+        self._preambles: Dict[str, str] = {}
+        self._spawning: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        self._has_engine = shutil.which(engine) is not None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and self._has_engine
+
+    def start(self, template_sources: List[str]) -> None:
+        if not self.enabled:
+            print(f"--- LaTeX pool for {self.engine} disabled (pool size 0 or {self.engine} missing); using cold compiles ---")
+            return
+        self._stop.clear()
+        for template in template_sources:
+            preamble, _ = split_document(template)
+            if preamble is not None: self.register(preamble)
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    def register(self, preamble: str) -> None:
+        key = preamble_key(preamble)
+        with self._lock:
+            if key in self._preambles: return
+            self._preambles[key] = preamble
+            self._workers[key] = []
+            self._spawning[key] = 0
+        self._top_up(key)
+
+    def _spawn(self, key: str) -> Optional[WarmWorker]:
+        preamble = self._preambles[key]
+        fmt = formats.lookup(preamble) if self.engine == "pdflatex" else None   # formats are dumped by pdflatex
+        worker = WarmWorker(preamble, fmt=fmt, engine=self.engine)
+        try:
+            worker.start()
+        except OSError as e:
+            print(f"--- LaTeX pool could not start a worker: {e} ---")
+            worker.stop()
+            return None
+        return worker
+
+    def _top_up(self, key: str) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._workers[key]) + self._spawning[key] >= self.size: return
+                self._spawning[key] += 1
+            worker = self._spawn(key)
+            with self._lock:
+                self._spawning[key] -= 1
+                if worker is not None: self._workers[key].append(worker)
+            if worker is None: return
+
+    def _checkout(self, key: str) -> Optional[WarmWorker]:
+        with self._lock:
+            for worker in self._workers.get(key, []):
+                if worker.ready.is_set() and worker.is_alive():
+                    self._workers[key].remove(worker)
+                    return worker
+        return None
+
+    def compile(self, latex_source: str, pdf_filepath: str, log_filepath: str, aux_filepath: str) -> bool:
+        # Returns True when a warm worker produced the PDF, False when the caller should use the
+        # cold path (pool disabled, unknown preamble, no ready worker, or the worker failed).
+        if not self.enabled: return False
+        preamble, body = split_document(latex_source)
+        if preamble is None: return False
+        key = preamble_key(preamble)
+        if key not in self._preambles:
+            # A template we haven't seen (e.g. hot-reloaded in dev): warm it up for next time
+            threading.Thread(target=self.register, args=(preamble,), daemon=True).start()
+            return False
+
+        worker = self._checkout(key)
+        # Replace the worker we just took before typesetting, so the next request finds a warm one.
+        threading.Thread(target=self._top_up, args=(key,), daemon=True).start()
+        if worker is None: return False
+        try:
+            worker.run(body, pdf_filepath, log_filepath, aux_filepath)
+            return True
+        except LatexPoolError as e:
+            print(f"--- LaTeX pool job failed, falling back to a cold compile: {e} ---")
+            return False
+        finally:
+            worker.stop()
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(LATEX_POOL_HEALTH_INTERVAL):
+            self.check_health()
+
+    def check_health(self) -> None:
+        # Drop crashed workers, workers stuck while loading their preamble, and workers idle too
+        # long (their temp dirs may have been swept), then refill every template back to size.
+        unhealthy = []
+        with self._lock:
+            for key, workers in self._workers.items():
+                for worker in list(workers):
+                    if not worker.is_healthy():
+                        workers.remove(worker)
+                        unhealthy.append(worker)
+            keys = list(self._workers)
+        for worker in unhealthy:
+            print(f"--- LaTeX pool restarting unhealthy worker {worker.key} ---")
+            worker.stop()
+        for key in keys: self._top_up(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "engine": self.engine,
+                "size": self.size,
+                "enabled": self.enabled,
+                "templates": {key: {"workers": len(ws), "ready": sum(1 for w in ws if w.ready.is_set())} for key, ws in self._workers.items()},
+            }
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        with self._lock:
+            workers = [w for ws in self._workers.values() for w in ws]
+            self._workers = {key: [] for key in self._workers}
+        for worker in workers: worker.stop()
+
+pool = LatexPool()
+
+def write_job_source(latex_source: str, tex_filepath: str) -> Optional[str]:
+    # Writes the job's .tex and returns the precompiled format to compile it with, if there is one.
+    # With a format the source gets the \endofdump marker so TeX knows where the dumped part ends.
+    preamble, _ = split_document(latex_source)
+    fmt = None
+    if preamble is not None and formats.enabled:
+        fmt = formats.lookup(preamble)
+        if fmt is None: formats.ensure_in_background(preamble)   # e.g. a hot-reloaded template
+        else: latex_source = mark_end_of_dump(preamble) + latex_source[len(preamble):]
+    with open(tex_filepath, "w", encoding='utf-8') as f: f.write(latex_source)
+    return fmt
+
+def compile_with_format(latex_source: str, tex_filepath: str, passes_done: int = 0) -> int:
+    fmt = write_job_source(latex_source, tex_filepath)
+    passes = compile_cold(tex_filepath, passes_done=passes_done, fmt=fmt)
+    pdf_filepath, log_filepath = os.path.splitext(tex_filepath)[0] + ".pdf", os.path.splitext(tex_filepath)[0] + ".log"
+    if fmt and not os.path.exists(pdf_filepath) and format_failed(log_filepath):
+        # The format could not be loaded (corrupt file, TeX upgraded underneath us): drop it and redo plainly
+        formats.discard(split_document(latex_source)[0], "pdflatex could not load it")
+        with open(tex_filepath, "w", encoding='utf-8') as f: f.write(latex_source)
+        passes = compile_cold(tex_filepath, passes_done=passes_done)
+    return passes
+
+def compile_latex(latex_source: str, workdir: str) -> CompileResult:
+    # Produces resume.pdf (and .log/.aux) inside workdir, preferring a warm worker, then a cold
+    # compile from the template's precompiled format, then a plain cold compile.
+    pdf_filepath, log_filepath, aux_filepath, tex_filepath = job_paths(workdir)
+    if pool.compile(latex_source, pdf_filepath, log_filepath, aux_filepath):
+        # A warm worker starts from an empty .aux, so only follow up if its pass left references behind
+        if not needs_rerun(log_filepath, aux_signature(""), aux_signature(aux_filepath)):
+            return CompileResult(passes=1, warm=True)
+        return CompileResult(passes=compile_with_format(latex_source, tex_filepath, passes_done=1), warm=True)
+
+    return CompileResult(passes=compile_with_format(latex_source, tex_filepath), warm=False)
+
+def job_paths(workdir: str):
+    # (pdf, log, aux, tex) paths of a compile job inside its scratch dir
+    return tuple(os.path.join(workdir, f"{JOB_NAME}.{ext}") for ext in ("pdf", "log", "aux", "tex"))
+
+# --- Non-blocking Entry Point ---
+class CompileLimiter:
+    # Runs blocking compile work on a dedicated thread pool so the event loop keeps serving other
+    # requests. At most max_concurrent jobs run at once; once max_queue more are waiting, new
+    # jobs are refused with CompileQueueFull instead of piling up behind the semaphore.
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_COMPILES, max_queue: int = MAX_COMPILE_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="latex-compile")
+        self._semaphore: Optional[asyncio.Semaphore] = None  # created lazily inside the running loop
+
+    async def run(self, func, *args):
+        if self._semaphore is None: self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self.in_flight >= self.max_concurrent and self.waiting >= self.max_queue:
+            raise CompileQueueFull(f"{self.in_flight} compiles running and {self.waiting} queued")
+        self.waiting += 1
+        try:
+            with stage("compile_queue"):
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        # The job runs in the request's context, so its stage timings land in the request's Server-Timing
+        job = self._executor.submit(contextvars.copy_context().run, func, *args)
+        release_later = False
+        try:
+            return await asyncio.wrap_future(job)
+        except asyncio.CancelledError:
+            # A running thread keeps going until the job notices its cancel event; hold the slot until then
+            release_later = True
+            job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+            raise
+        finally:
+            if not release_later: self._release()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "max_concurrent": self.max_concurrent, "max_queue": self.max_queue}
+
+compile_limiter = CompileLimiter()
+
+if __name__ == "__main__":
+    # Builds the template formats ahead of time, e.g. during `docker build`:  python latex_compiler.py
+    from template_registry import template_registry
+    build_formats(template_registry.sources())
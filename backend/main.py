@@ -1,17 +1,38 @@
 # main.py (Final Stable Version with Corrected Spacing)
-import subprocess
-import uuid
 import os
-import re
+import io
+import json
+import math
+import hashlib
+import asyncio
+import shutil
+import tempfile
+import time
+import threading
 import requests
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
 import traceback
+from contextlib import asynccontextmanager
+from latex_compiler import janitor as scratch_janitor, formats as latex_formats, compile_limiter, CompileQueueFull, CompileCancelled, cancellable, make_scratch_dir, job_paths
+from renderers import Renderer, RendererUnavailable, RENDERERS, DEFAULT_RENDERER, get_renderer, start_renderers, shutdown_renderers
+from caching import LRUCache, pdf_cache, ai_cache
+from template_registry import template_registry
+from resume_latex import Experience, Project, ResumeData, build_resume_latex, bulk_resume_latex, section_data_digest, section_fragment_cache
+from incremental import BuildFingerprint, BuildPlan, build_sessions
+from fit_solver import FitSettings, apply_settings, measure as measure_fit, page_count, pages_only, solve as solve_fit, template_stretch
+import text_metrics
+from job_queue import JOB_PRIORITIES, JobRetry, check_webhook_url, job_queue
+from bulk import BULK_HTTP_NICE, BULK_HTTP_WORKERS, BULK_MAX_RECORD_BYTES, BULK_MAX_RECORDS, BulkStats, read_records, run_bulk, stream_zip
+from metrics import StageTimingMiddleware, registry as metrics_registry, stage
+from preview import PREVIEW_DPI, PREVIEW_MAX_DPI, PreviewUnavailable, preview_formats, rasterize_first_page, preview_cache, preview_sessions
 
 # --- AI Feature Code ---
 load_dotenv()
@@ -19,36 +40,46 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in .env file")
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-flash')
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+model = genai.GenerativeModel(GEMINI_MODEL_NAME)
 
 class ImproveTextRequest(BaseModel):
     text: str
+    body_id: Optional[str] = None  # when set, the reply says whether the rewrite fits on one line of this template
+    fit: bool = False              # pick the best of several candidates by measured width in body_id (see run_ai_fit_rewrite)
 
 class AdjustTextRequest(BaseModel):
     text: str
+    body_id: Optional[str] = None
+    fit: bool = False
+
+class MeasureTextRequest(BaseModel):
+    texts: List[str] = []
+    text: Optional[str] = None
+    body_id: str = "iitb_one_page.tex"
+
+# A curated list of "gold standard" examples provided by the user.
+GOLD_STANDARD_EXAMPLES = [
+    "Leading an IIT-B intern team to audit Agentic AI frameworks, automating IB tasks to project a 25% cost reduction",
+    "Authored a VC-grade market analysis defining a 269 Cr obtainable market using the TAM-SAM-SOM framework",
+    "Engineered the MVP, an AI agent on n8n, automating resume data extraction via Google Gemini and OCR API's",
+    "Trained a predictive FinBERT NLP model to predict stock trends from 25,000+ news articles, reaching 73% accuracy",
+    "Architected a scalable AI platform to consolidate analyst insights and eliminating redundant research duplication",
+    "Implemented semantic de-duplication with Sentence Transformers and a custom AI similarity matching engine",
+    "Helped 700+ final-year students in connecting with 250+ alumni mentors via the Placement Mentoring Program",
+    "Managed the estate vertical solely and was overseeing an annual amenities budget of INR 1M+ for new initiatives",
+    "Spearheaded the installation of 20+ lights on hostel grounds while managing a budget of INR 0.1M for the project",
+    "Led the hostel cycle auction, coordinating with the warden and the security office to sell 400+ unclaimed cycles"
+]
+GOLD_STANDARD_EXAMPLE_STRING = "\n".join([f"- \"{ex}\"" for ex in GOLD_STANDARD_EXAMPLES])
 
 def generate_ai_prompt(text: str) -> str:
-    # A curated list of "gold standard" examples provided by the user.
-    examples = [
-        "Leading an IIT-B intern team to audit Agentic AI frameworks, automating IB tasks to project a 25% cost reduction",
-        "Authored a VC-grade market analysis defining a 269 Cr obtainable market using the TAM-SAM-SOM framework",
-        "Engineered the MVP, an AI agent on n8n, automating resume data extraction via Google Gemini and OCR API's",
-        "Trained a predictive FinBERT NLP model to predict stock trends from 25,000+ news articles, reaching 73% accuracy",
-        "Architected a scalable AI platform to consolidate analyst insights and eliminating redundant research duplication",
-        "Implemented semantic de-duplication with Sentence Transformers and a custom AI similarity matching engine",
-        "Helped 700+ final-year students in connecting with 250+ alumni mentors via the Placement Mentoring Program",
-        "Managed the estate vertical solely and was overseeing an annual amenities budget of INR 1M+ for new initiatives",
-        "Spearheaded the installation of 20+ lights on hostel grounds while managing a budget of INR 0.1M for the project",
-        "Led the hostel cycle auction, coordinating with the warden and the security office to sell 400+ unclaimed cycles"
-    ]
-    example_string = "\n".join([f"- \"{ex}\"" for ex in examples])
-
     return f"""
     You are an expert resume writing assistant for students at a top-tier engineering college like an IIT in India.
     Your task is to take a user-written bullet point and rewrite it to match the high-quality, dense, and metric-driven style of the examples provided below.
 
     --- EXAMPLES OF PERFECT OUTPUT STYLE ---
-    {example_string}
+    {GOLD_STANDARD_EXAMPLE_STRING}
     --- END OF EXAMPLES ---
 
     Follow these rules strictly:
@@ -87,41 +118,82 @@ def generate_shorten_prompt(text: str) -> str:
     Rewritten, Shorter Text (110-120 characters):
     """
 
+AI_SINGLE_PROMPTS = {
+    "improve": generate_ai_prompt,
+    "lengthen": generate_lengthen_prompt,
+    "shorten": generate_shorten_prompt,
+}
+# Bump an operation's version whenever its prompt changes, so cached rewrites from the old prompt are ignored
+AI_PROMPT_VERSIONS = {
+    "improve": 1,
+    "lengthen": 1,
+    "shorten": 1,
+}
+
+# --- Batch Prompts (one model call for a whole section) ---
+BATCH_INSTRUCTIONS = {
+    "improve": f"""
+    You are an expert resume writing assistant for students at a top-tier engineering college like an IIT in India.
+    Your task is to rewrite user-written bullet points to match the high-quality, dense, and metric-driven style of the examples provided below.
+
+    --- EXAMPLES OF PERFECT OUTPUT STYLE ---
+    {GOLD_STANDARD_EXAMPLE_STRING}
+    --- END OF EXAMPLES ---
+
+    Follow these rules strictly for every bullet point:
+    1. Start with a strong, impressive action verb.
+    2. Use the STAR (Situation, Task, Action, Result) method. Focus on quantifiable results.
+    3. Keep the tone highly professional and concise.
+    4. CRITICAL RULE 1: Each rewritten point must be a single, unbroken line of text strictly between 110 and 120 characters.
+    5. CRITICAL RULE 2: Do not use any Markdown formatting or personal pronouns like "I" or "we".
+    """,
+    "lengthen": """
+    You are a professional copy-editor. The following resume bullet points are too short to fill the line.
+    Your task is to rewrite each one to be longer, specifically aiming for a length between 110 and 120 characters.
+    You must do this by adding relevant professional detail or more descriptive language, without losing the core meaning or metrics.
+    Do not use any Markdown formatting.
+    """,
+    "shorten": """
+    You are a professional copy-editor. The following resume bullet points are too long and wrap to a second line.
+    Your task is to rewrite each one to be more concise, specifically aiming for a length between 110 and 120 characters.
+    You must preserve the key metrics and accomplishments.
+    Do not use any Markdown formatting.
+    """,
+}
+
+def generate_batch_prompt(operation: str, points: List[str]) -> str:
+    numbered_points = "\n".join([f"    {i + 1}. \"{point}\"" for i, point in enumerate(points)])
+    return f"""
+    {BATCH_INSTRUCTIONS[operation]}
+    Rewrite each of the following {len(points)} bullet points independently.
+    Return ONLY a JSON array of exactly {len(points)} strings, in the same order as the input, with no other text.
+
+{numbered_points}
+
+    JSON array:
+    """
+
+def generate_candidates_prompt(operation: str, text: str, count: int, feedback: str = "") -> str:
+    # Several alternative rewrites of one point in a single call, scored locally by measured width
+    return f"""
+    {BATCH_INSTRUCTIONS[operation]}
+    Write {count} different rewrites of the following bullet point, varying the wording and length slightly.
+    {feedback}
+    Return ONLY a JSON array of {count} strings, with no other text.
+
+    Original Text: "{text}"
+
+    JSON array:
+    """
+
 # --- Pydantic Models ---
-class PersonalDetails(BaseModel):
-    name: str = ""
-    branch: str = ""
-    institution: str = ""
-    email: Optional[str] = ""
-    phone: Optional[str] = ""
-    linkedin_url: Optional[str] = ""
-    github_url: Optional[str] = ""
-    location: Optional[str] = ""
-    cpi: str = ""
-    grad_year: Optional[str] = ""
-    roll_no: Optional[str] = ""
-    dob: Optional[str] = ""
-    gender: Optional[str] = ""
-class ScholasticAchievement(BaseModel): text: str = ""
-class Experience(BaseModel): company: str = ""; role: str = ""; dates: str = ""; description: str = ""; points: List[str] = []
-class Project(BaseModel): name: str = ""; subtitle: str = ""; dates: str = ""; description: str = ""; points: List[str] = []
-class Responsibility(BaseModel): role: str = ""; organization: str = ""; dates: str = ""; description: str = ""; points: List[str] = []
-class ExtraCurricular(BaseModel): text: str = ""; date: str = ""
-class TechnicalSkill(BaseModel):
-    category: str = ""
-    skills: str = ""
-
-class ResumeData(BaseModel):
-    header_id: str
-    body_id: str
-    sectionOrder: List[str]
-    personalDetails: PersonalDetails
-    scholasticAchievements: List[ScholasticAchievement]
-    professionalExperience: List[Experience]
-    keyProjects: List[Project]
-    positionsOfResponsibility: List[Responsibility]
-    extraCurriculars: List[ExtraCurricular] = []
-    technicalSkills: List[TechnicalSkill] = []
+# The resume models themselves live in resume_latex.py
+class BatchTextRequest(BaseModel):
+    # Either a plain list of points, or a whole Experience/Project whose points are rewritten
+    points: List[str] = []
+    experience: Optional[Experience] = None
+    project: Optional[Project] = None
+    body_id: Optional[str] = None
 
 class FunnelSubmitData(BaseModel):
     resumeData: dict
@@ -129,669 +201,821 @@ class FunnelSubmitData(BaseModel):
 class WaitlistEntry(BaseModel):
     email: str
 
-def sanitize_and_format(text: str) -> str:
-    # This function handles both sanitization and Markdown-style bolding.
-    
-    def sanitize_plain_text(s: str) -> str:
-        # The order of replacement is critical. Backslash must be handled first.
-        s = s.replace('\\', r'\textbackslash{}')
-        s = s.replace('&', r'\&')
-        s = s.replace('%', r'\%') # This is the original, correct escape for %
-        s = s.replace('$', r'\$')
-        s = s.replace('#', r'\#')
-        s = s.replace('_', r'\_')
-        s = s.replace('{', r'\{')
-        s = s.replace('}', r'\}')
-        s = s.replace('[', r'{[}')
-        s = s.replace(']', r'{]}')
-        s = s.replace('~', r'\textasciitilde{}')
-        s = s.replace('^', r'\textasciicircum{}')
-        return s
-
-    # Split the string by the bold delimiter (**), keeping the delimiters
-    parts = re.split(r'(\*\*.*?\*\*)', text)
-    
-    processed_parts = []
-    for part in parts:
-        if part.startswith('**') and part.endswith('**'):
-            # This is a bolded part. Extract content, sanitize it, and wrap in \textbf{}
-            content = part[2:-2]
-            processed_parts.append(f"\\textbf{{{sanitize_plain_text(content)}}}")
-        else:
-            # This is a normal part. Just sanitize it.
-            processed_parts.append(sanitize_plain_text(part))
-            
-    return "".join(processed_parts)
-
-# --- FINAL, STABLE LaTeX Generation Functions ---
-def generate_iitb_header_latex(details: PersonalDetails) -> str:
-    # This function now perfectly replicates the structured IITB header with the logo.
-    return f"""
-\\begin{{tabular*}}{{\\textwidth}}{{l@{{\\extracolsep{{\\fill}}}}cr}}
-    % Column 1: IITB Logo (larger and left-aligned)
-    \\begin{{tabular}}[b]{{l}}
-        \\hspace*{{-14.11mm}}\\includegraphics[height=1.8cm]{{iitb_logo.png}}
-    \\end{{tabular}} &
-    % Column 2: Name and Institution (Center Aligned)
-    \\begin{{tabular}}[b]{{c}}
-        \\textbf{{\\Large {sanitize_and_format(details.name)}}} \\\\
-        {sanitize_and_format(details.branch)} \\\\
-        {sanitize_and_format(details.institution)}
-    \\end{{tabular}} &
-    % Column 3: Key Stats (Right Aligned)
-    \\begin{{tabular}}[b]{{l}}
-        \\textbf{{{sanitize_and_format(details.roll_no)}}} \\\\
-        B.Tech \\\\
-        Gender: {sanitize_and_format(details.gender)} \\\\
-        DOB: {sanitize_and_format(details.dob)}
-    \\end{{tabular}}
-\\end{{tabular*}}
-\\vspace{{2mm}}
-\\begin{{tabular*}}{{\\textwidth}}{{@{{\\extracolsep{{\\fill}}}}lcrr}}
-    \\hline
-    \\textbf{{Examination}} & \\textbf{{Institute}} & \\textbf{{Year}} & \\textbf{{CPI / \\%}} \\\\ \\hline
-    Graduation & {sanitize_and_format(details.institution)} & 2027 & {sanitize_and_format(details.cpi)} \\\\ \\hline
-\\end{{tabular*}}
-
-\\vspace{{-20pt}} % Pulls the next section up
-"""
-
-def generate_personal_details_latex(details: PersonalDetails) -> str:
-    # This function creates the final, multi-column header using minipages for perfect alignment.
-    contact_parts = []
-    if details.email:
-        contact_parts.append(f"\\faEnvelope \\hspace{{1mm}} \\href{{mailto:{details.email}}}{{{sanitize_and_format(details.email)}}}")
-    if details.phone:
-        contact_parts.append(f"\\faPhone \\hspace{{1mm}} {sanitize_and_format(details.phone)}")
-    if details.linkedin_url:
-        contact_parts.append(f"\\faLinkedin \\hspace{{1mm}} \\href{{{details.linkedin_url}}}{{LinkedIn}}")
-    if details.github_url:
-        contact_parts.append(f"\\faGithub \\hspace{{1mm}} \\href{{{details.github_url}}}{{GitHub}}")
-    contact_block = " \\\\ \n".join(contact_parts)
-    return f"""
-\\begin{{minipage}}[t]{{0.3\\textwidth}}
-    \\raggedright
-    {contact_block}
-\\end{{minipage}}%
-\\begin{{minipage}}[t]{{0.4\\textwidth}}
-    \\centering
-    \\vspace*{{2mm}}
-    \\textbf{{\\LARGE \\textcolor{{Blue}}{{{sanitize_and_format(details.name)}}}}} \\\\
-    \\normalsize {sanitize_and_format(details.branch)} \\\\
-    \\normalsize {sanitize_and_format(details.institution)}
-\\end{{minipage}}%
-\\begin{{minipage}}[t]{{0.3\\textwidth}}
-    \\raggedleft
-    \\textbf{{CPI:}} {sanitize_and_format(details.cpi)} \\\\
-    \\textbf{{Graduation:}} {sanitize_and_format(details.grad_year)} \\\\
-    \\textbf{{Location:}} {sanitize_and_format(details.location)}
-\\end{{minipage}}
-\\vspace{{4mm}}
-\\rule{{\\textwidth}}{{0.4pt}}
-"""
-
-def generate_universal_header_latex(details: PersonalDetails) -> str:
-    # This function creates the final, multi-column header using minipages for perfect alignment.
-    
-    contact_parts = []
-    if details.email:
-        contact_parts.append(f"\\faEnvelope \\hspace{{1mm}} \\href{{mailto:{details.email}}}{{{sanitize_and_format(details.email)}}}")
-    if details.phone:
-        contact_parts.append(f"\\faPhone \\hspace{{1mm}} {sanitize_and_format(details.phone)}")
-    if details.linkedin_url:
-        contact_parts.append(f"\\faLinkedin \\hspace{{1mm}} \\href{{{details.linkedin_url}}}{{LinkedIn}}")
-    if details.github_url:
-        contact_parts.append(f"\\faGithub \\hspace{{1mm}} \\href{{{details.github_url}}}{{GitHub}}")
-        
-    contact_block = " \\\\ \n".join(contact_parts)
+# --- Build Sessions ---
+def resume_fingerprint(resume_data: ResumeData, renderer_name: str) -> BuildFingerprint:
+    # What incremental builds compare between a session's consecutive requests (see incremental.py)
+    sections = {key: section_data_digest(getattr(resume_data, key)) for key in resume_data.sectionOrder if getattr(resume_data, key, None)}
+    layout = json.dumps([renderer_name, resume_data.body_id, resume_data.header_id, resume_data.personalDetails.model_dump(), list(sections)],
+                        sort_keys=True, ensure_ascii=False)
+    return BuildFingerprint(hashlib.sha256(layout.encode('utf-8')).hexdigest(), sections)
 
-    return f"""
-% Using minipages for a robust 3-column layout
-\\begin{{minipage}}[t]{{0.3\\textwidth}}
-    \\raggedright
-    {contact_block}
-\\end{{minipage}}%
-\\begin{{minipage}}[t]{{0.4\\textwidth}}
-    \\centering
-    \\vspace*{{2mm}} % Artificially lower the center block for visual balance
-    \\textbf{{\\LARGE \\textcolor{{Blue}}{{{sanitize_and_format(details.name)}}}}} \\\\
-    \\normalsize {sanitize_and_format(details.branch)} \\\\
-    \\normalsize {sanitize_and_format(details.institution)}
-\\end{{minipage}}%
-\\begin{{minipage}}[t]{{0.3\\textwidth}}
-    \\raggedleft
-    \\textbf{{CPI:}} {sanitize_and_format(details.cpi)} \\\\
-    \\textbf{{Graduation:}} {sanitize_and_format(details.grad_year)} \\\\
-    \\textbf{{Location:}} {sanitize_and_format(details.location)}
-\\end{{minipage}}
-
-\\vspace{{4mm}}
-\\rule{{\\textwidth}}{{0.4pt}}
-\\vspace{{-28pt}} % Pulls the next section up
-"""
-
-def generate_blank_header_latex() -> str:
-    # This function generates a vertical space of 3.5cm.
-    # This value can be adjusted later if the placement cell requires a different size.
-    return "\\vspace*{3.5cm}\n"
-
-def generate_iitb_official_2_header(details: PersonalDetails) -> str:
-    # This generates the header using nested tabular environments for robust layout
-    # Personal Details Section (Mimicking structure of generate_iitb_header_latex)
-    personal_details_latex = f"""
-\\begin{{tabular*}}{{\\textwidth}}{{l@{{\\extracolsep{{\\fill}}}}cr}}
-    % Column 1: Logo
-    \\begin{{tabular}}[b]{{l}}
-        \\includegraphics[width=0.15\\textwidth]{{iitb_logo.png}}
-    \\end{{tabular}} &
-    % Column 2: Name, Branch, Institute, Email (Left Aligned within center block)
-    \\begin{{tabular}}[b]{{l}} % Changed alignment to 'l'
-        \\textbf{{{sanitize_and_format(details.name)}}} \\\\
-        \\textbf{{{sanitize_and_format(details.branch)}}} \\\\
-        \\textbf{{{sanitize_and_format(details.institution)}}} \\\\
-        \\textbf{{{sanitize_and_format(details.email)}}}
-    \\end{{tabular}} &
-    % Column 3: Roll No, BTech, Gender, DOB (Left Aligned within right block)
-    \\begin{{tabular}}[b]{{l}} % Changed alignment to 'l'
-        \\textbf{{{sanitize_and_format(details.roll_no)}}} \\\\
-        \\textbf{{B.Tech.}} \\\\
-        \\textbf{{Gender: {sanitize_and_format(details.gender)}}} \\\\
-        \\textbf{{DOB: {sanitize_and_format(details.dob)}}}
-    \\end{{tabular}}
-\\end{{tabular*}}
-\\vspace{{0.7cm}} % Space before the academic table line
-\\hrule % First horizontal line
-"""
-
-    # Academic Table Section (Single tabular* with aligned columns)
-    academic_table_latex = f"""
-\\vspace{{1mm}} % Space after first hrule
-\\hrule % Top horizontal line
-\\vspace{{1mm}} % Space before table
-\\hspace*{{-7mm}} % Shift table left\n\\n
-\\begin{{tabular*}}{{\\textwidth}}{{@{{\\extracolsep{{\\fill}}}} l l l c c }}
-    \\textbf{{Examination}} & \\textbf{{University}} & \\textbf{{Institute}} & \\textbf{{Year}} & \\textbf{{CPI / \\%}} \\\\
-    \\hline
-    Graduation & IIT Bombay & {sanitize_and_format(details.institution)} & {sanitize_and_format(details.grad_year)} & {sanitize_and_format(details.cpi)} \\\\
-\\end{{tabular*}}
-\\vspace{{0.1cm}} % Space before final hrule
-\\hrule % Bottom horizontal line
-\\vspace{{-5mm}} % Pulls the next section up
-"""
-
-    return personal_details_latex + academic_table_latex
-
-def generate_scholastic_latex(achievements: List[ScholasticAchievement]) -> str:
-    if not achievements: return ""
-    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Scholastic Achievements} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
-    items = "".join([f"    \\item {sanitize_and_format(ach.text)}\n" for ach in achievements])
-    latex_string += f"\\begin{{itemize}}[itemsep=-1.55mm,leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_experience_latex(experiences: List[Experience]) -> str:
-    if not experiences: return ""
-    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Professional Experience} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
-    for i, exp in enumerate(experiences):
-        if i > 0: latex_string += "\\vspace{-10pt}\n"
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in exp.points if point.strip()])
-        description_latex = f"\\vspace{{-1.5mm}}\n\\textit{{{sanitize_and_format(exp.description)}}}\n\\vspace{{-1mm}}" if exp.description else ""
-        latex_string += f"""
-\\noindent \\textbf{{\\large {sanitize_and_format(exp.company)}}}
-| \\textbf{{\\large   {sanitize_and_format(exp.role)}}}
-\\hfill{{\\textit{{{sanitize_and_format(exp.dates)}}}}}
-\\vspace{{-3mm}}
-\\\\ \\rule{{\\textwidth}}{{0.2mm}}
-{description_latex}
-\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]
-{points_latex}\\end{{itemize}}
-"""
-    if experiences: latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_projects_latex(projects: List[Project]) -> str:
-    if not projects: return ""
-    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Key Projects} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
-    for i, proj in enumerate(projects):
-        if i > 0: latex_string += "\\vspace{-10pt}\n"
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in proj.points if point.strip()])
-        description_latex = f"\\vspace{{-1.5mm}}\n\\textit{{{sanitize_and_format(proj.description)}}}\n\\vspace{{-1mm}}" if proj.description else ""
-        latex_string += f"""
-\\noindent \\textbf{{\\large {sanitize_and_format(proj.name)}}}
-\\textit{{| {sanitize_and_format(proj.subtitle)} }}
-\\hfill{{\\textit{{{sanitize_and_format(proj.dates)}}}}}
-\\vspace{{-3mm}}
-\\\\ \\rule{{\\textwidth}}{{0.2mm}}
-{description_latex}
-\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]
-{points_latex}\\end{{itemize}}
-"""
-    if projects: latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_por_latex(pors: List[Responsibility]) -> str:
-    if not pors: return ""
-    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Positions of Responsibility} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
-    for i, por in enumerate(pors):
-        if i > 0: latex_string += "\\vspace{-8pt}\n"
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in por.points if point.strip()])
-        latex_string += f"""
-\\noindent \\textbf{{\\large {sanitize_and_format(por.role)}}} | {sanitize_and_format(por.organization)} \\hfill{{\\textit{{{sanitize_and_format(por.dates)}}}}} 
-\\vspace{{-3mm}}
-\\\\ \\rule{{\\textwidth}}{{0.2mm}}
-\\vspace{{-1.5mm}}
-\\textit{{{sanitize_and_format(por.description)}}}
-\\vspace{{-1mm}}
-\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]
-{points_latex}\\end{{itemize}}
-"""
-    if pors: latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_extracurricular_latex(extracurriculars: List[ExtraCurricular]) -> str:
-    if not extracurriculars: return ""
-    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Extra-Curricular Activities} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
-    items = "".join([f"    \\item {sanitize_and_format(ec.text)} \\hfill {{\\sl \\small [{sanitize_and_format(ec.date)}]}}\n" for ec in extracurriculars if ec.text.strip()])
-    latex_string += f"\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-28pt}\n" # Pulls the next section up
-    return latex_string
-
-# --- NEW: Dense Blue Style LaTeX Generation Functions ---
-
-def generate_dense_scholastic_latex(achievements: List[ScholasticAchievement]) -> str:
-    if not achievements: return ""
-    latex_string = "\\section*{\\LARGE \\color{myblue}Scholastic Achievements\\xfilll[0pt]{0.5pt}}\n\\vspace{-12pt}\n"
-    items = "".join([f"    \\item {sanitize_and_format(ach.text)}\n" for ach in achievements])
-    latex_string += f"\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_dense_experience_latex(experiences: List[Experience]) -> str:
-    if not experiences: return ""
-    latex_string = "\\section*{\\LARGE \\color{myblue}Professional Experience\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
-    for i, exp in enumerate(experiences):
-        if i > 0: latex_string += "\\vspace{-10pt}\n"
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in exp.points if point.strip()])
-        description_latex = f"\\textit{{{sanitize_and_format(exp.description)}}}" if exp.description else ""
-        latex_string += f"""
-\\noindent {{\\large \\textbf{{{sanitize_and_format(exp.company)}}}}} | {{\\large \\textbf{{{sanitize_and_format(exp.role)}}}}} \\hfill{{{sanitize_and_format(exp.dates)}}}
-\\\\  
-\\hfill{{{description_latex}}}
-\\vspace{{-12pt}}
-\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]
-{points_latex}\\end{{itemize}}
-"""
-    if experiences: latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_dense_projects_latex(projects: List[Project]) -> str:
-    if not projects: return ""
-    latex_string = "\\section*{\\LARGE \\color{myblue}Key Projects\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
-    for i, proj in enumerate(projects):
-        if i > 0: latex_string += "\\vspace{-10pt}\n"
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in proj.points if point.strip()])
-        
-        # --- Corrected Logic ---
-        # Format subtitle to match the "Company | Role" style
-        subtitle_latex = f"| {{\\large \\textbf{{{sanitize_and_format(proj.subtitle)}}}}}" if proj.subtitle else ""
-        # Format description to match the "perfect" experience model
-        description_latex = f"\\textit{{{sanitize_and_format(proj.description)}}}" if proj.description else ""
-        
-        latex_string += f"""
-\\noindent {{\\large \\textbf{{{sanitize_and_format(proj.name)}}}}} {subtitle_latex} \\hfill{{{sanitize_and_format(proj.dates)}}}
-\\\\ 
-\\hfill{{{description_latex}}}
-\\vspace{{-12pt}}
-\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]
-{points_latex}\\end{{itemize}}
-"""
-    if projects: latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_dense_por_latex(pors: List[Responsibility]) -> str:
-    if not pors: return ""
-    latex_string = "\\section*{\\LARGE \\color{myblue}Positions of Responsibility\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
-    for i, por in enumerate(pors):
-        if i > 0: latex_string += "\\vspace{-8pt}\n"
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in por.points if point.strip()])
-        latex_string += f"""
-\\noindent {{\\large \\textbf{{{sanitize_and_format(por.role)}}}}} | {sanitize_and_format(por.organization)} \\hfill{{{sanitize_and_format(por.dates)}}}
-\\vspace{{-10pt}}
-\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]
-{points_latex}\\end{{itemize}}
-"""
-    if pors: latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_dense_extracurricular_latex(extracurriculars: List[ExtraCurricular]) -> str:
-    if not extracurriculars: return ""
-    latex_string = "\\section*{\\LARGE \\color{myblue}Extra-Curricular Activities\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
-    items = "".join([f"    \\item {sanitize_and_format(ec.text)} \\hfill {{{sanitize_and_format(ec.date)}}}\n" for ec in extracurriculars if ec.text.strip()])
-    latex_string += f"\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-28pt}\n" # Pulls the next section up
-    return latex_string
-
-def generate_technical_skills_latex(skills: List[TechnicalSkill]) -> str:
-    if not skills: return ""
-    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Technical Skills} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
-    # Note the \textbf for category and the colon
-    items = "".join([f"    \\item \\textbf{{{sanitize_and_format(skill.category)}:}} {sanitize_and_format(skill.skills)}\n" for skill in skills if skill.category or skill.skills])
-    latex_string += f"\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-def generate_dense_technical_skills_latex(skills: List[TechnicalSkill]) -> str:
-    if not skills: return ""
-    latex_string = "\\section*{\\LARGE \\color{myblue}Technical Skills\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
-    # Note the \textbf for category and the colon
-    items = "".join([f"    \\item \\textbf{{{sanitize_and_format(skill.category)}:}} {sanitize_and_format(skill.skills)}\n" for skill in skills if skill.category or skill.skills])
-    latex_string += f"\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-28pt}\n"
-    return latex_string
-
-# --- NEW: T-Colorbox Style LaTeX Generation Functions ---
-
-def generate_tcolorbox_scholastic_latex(achievements: List[ScholasticAchievement]) -> str:
-    if not achievements: return ""
-    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
-    latex_string += "\\vspace{-1.7mm}\n\\textbf{SCHOLASTIC ACHIEVEMENTS}\n\\end{tcolorbox}\n"
-    latex_string += "\\vspace{-5mm}\n" # REMOVED excessive negative space
-    items = "".join([f"    \\item {sanitize_and_format(ach.text)}\n" for ach in achievements])
-    latex_string += f"\\begin{{itemize}}[itemsep = -1.5mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-5mm}\n" # Reduced final spacing slightly
-    return latex_string
-
-def generate_tcolorbox_experience_latex(experiences: List[Experience]) -> str:
-    if not experiences: return ""
-    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
-    latex_string += "\\vspace{-1.7mm}\n\\textbf{PROFESSIONAL EXPERIENCE}\n\\end{tcolorbox}\n"
-    latex_string += "\\vspace{-2mm}\n"
-    for i, exp in enumerate(experiences):
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in exp.points if point.strip()])
-        description_latex = f"\\textit{{{sanitize_and_format(exp.description)}}}" if exp.description else ""
-        
-        # --- Start replacement ---
-        latex_string += f"""
-\\vspace{{1mm}}
-\\hspace*{{-7.6mm}} % Keep negative horizontal space for alignment
-\\textbf{{{sanitize_and_format(exp.company)}}} $|$ \\textbf{{{sanitize_and_format(exp.role)}}} \\hfill{{\\small {sanitize_and_format(exp.dates)}}}
-\\vspace{{0mm}} \\hline % Adjusted space before first hline
-\\vspace{{1mm}}\\hspace*{{-5mm}} % Keep negative horizontal space
-{description_latex}
-\\vspace{{-3.5mm}} % Reduced space before itemize
-\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]
-{points_latex}
-\\end{{itemize}}
-\\vspace{{0mm}} \\hline % Adjusted space before second hline
-\\\\ % Use only one line break here
-"""
-        # --- End replacement ---
-    return latex_string
-
-def generate_tcolorbox_projects_latex(projects: List[Project]) -> str:
-    if not projects: return ""
-    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
-    latex_string += "\\vspace{-1.7mm}\n\\textbf{KEY PROJECTS}\n\\end{tcolorbox}\n"
-    latex_string += "\\vspace{-2mm}\n"
-    for i, proj in enumerate(projects):
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in proj.points if point.strip()])
-        subtitle_latex = f"| \\textit{{{sanitize_and_format(proj.subtitle)}}}" if proj.subtitle else ""
-        description_latex = f"\\textit{{{sanitize_and_format(proj.description)}}}" if proj.description else ""
-        
-        # --- Start replacement ---
-        latex_string += f"""
-\\vspace{{1mm}}
-\\hspace*{{-7.5mm}} % Keep negative horizontal space
-\\textbf{{{sanitize_and_format(proj.name)}}} {subtitle_latex} \\hfill{{\\small {sanitize_and_format(proj.dates)}}}
-\\vspace{{0mm}} \\hline % Adjusted space before first hline
-\\vspace{{1mm}}
-\\hspace*{{-4.5mm}} % Keep negative horizontal space
-{description_latex}
-\\vspace{{-3.5mm}} % Reduced space before itemize
-\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]
-{points_latex}
-\\end{{itemize}}
-\\vspace{{0mm}} \\hline % Adjusted space before second hline
-\\\\ % Use only one line break here
-"""
-        # --- End replacement ---
-    return latex_string
-
-def generate_tcolorbox_por_latex(pors: List[Responsibility]) -> str:
-    if not pors: return ""
-    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
-    latex_string += "\\vspace{-1.7mm}\n\\textbf{POSITION OF RESPONSIBILITY}\n\\end{tcolorbox}\n"
-    latex_string += "\\vspace{-2mm}\n"
-    for i, por in enumerate(pors):
-        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in por.points if point.strip()])
-        description_latex = f"\\textit{{{sanitize_and_format(por.description)}}}" if por.description else ""
-        
-        # --- Start replacement ---
-        latex_string += f"""
-\\vspace{{1mm}}
-\\hspace*{{-7.6mm}} % Keep negative horizontal space
-\\textbf{{{sanitize_and_format(por.role)}}} $|$ {sanitize_and_format(por.organization)} \\hfill{{\\small {sanitize_and_format(por.dates)}}}
-\\vspace{{0mm}} \\hline % Adjusted space before first hline
-\\vspace{{1mm}}\\hspace*{{-5mm}} % Keep negative horizontal space
-{description_latex}
-\\vspace{{-3.5mm}} % Reduced space before itemize
-\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]
-{points_latex}
-\\end{{itemize}}
-\\vspace{{0mm}} \\hline % Adjusted space before second hline
-\\\\ % Use only one line break here
-"""
-        # --- End replacement ---
-    return latex_string
-
-def generate_tcolorbox_technical_skills_latex(skills: List[TechnicalSkill]) -> str:
-    if not skills: return ""
-    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
-    latex_string += "\\vspace{-1.7mm}\n\\textbf{TECHNICAL SKILLS}\n\\end{tcolorbox}\n"
-    latex_string += "\\vspace{-5mm}\n" # REMOVED excessive negative space
-    items = "".join([f"    \\item \\textbf{{{sanitize_and_format(skill.category)}:}} {sanitize_and_format(skill.skills)}\n" for skill in skills if skill.category or skill.skills])
-    latex_string += f"\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    latex_string += "\\vspace{-5mm}\n" # Kept moderate final spacing
-    return latex_string
-
-def generate_tcolorbox_extracurricular_latex(extracurriculars: List[ExtraCurricular]) -> str:
-    if not extracurriculars: return ""
-    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
-    latex_string += "\\vspace{-1.7mm}\n\\textbf{EXTRA CURRICULAR ACTIVITIES}\n\\end{tcolorbox}\n"
-    latex_string += "\\vspace{-5.5mm}\n"
-    items = "".join([f"    \\item {sanitize_and_format(ec.text)} \\hfill{{\\small {sanitize_and_format(ec.date)}}}\n" for ec in extracurriculars if ec.text.strip()])
-    latex_string += f"\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
-    return latex_string
+def build_headers(plan: BuildPlan) -> dict:
+    # X-Changed-Sections is '*' when the layout changed (or there was no previous build)
+    return {"X-Changed-Sections": "*" if plan.layout_changed else ",".join(plan.changed)}
 
 # --- FastAPI App ---
-app = FastAPI()
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
-
-@app.post("/generate_pdf")
-async def generate_pdf(resume_data: ResumeData):
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Dump (or reuse from disk) a format per template, then warm up the renderers' worker pools from
+    # those formats so the first resumes don't pay for preamble loading
+    await run_in_threadpool(start_renderers, template_registry.sources())
+    scratch_janitor.start()
+    job_queue.start(run_pdf_job)
+    yield
+    await job_queue.stop()
+    scratch_janitor.stop()
+    shutdown_renderers()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Compile-Passes", "X-Cache", "X-Renderer", "X-Changed-Sections", "X-Fit", "X-Fit-Settings", "X-Fit-Compiles", "X-Fit-Slack-Pt", "X-Fit-Overflow-Pt", "ETag", "Server-Timing"])
+
+# --- Metrics (GET /metrics; stage timings are also sent per response as Server-Timing) ---
+# Counts are per worker process: under gunicorn each scrape is answered by whichever worker gets it.
+app.add_middleware(StageTimingMiddleware)
+COMPILE_OUTCOMES = metrics_registry.counter("resume_compiles_total", "LaTeX compiles by renderer and outcome (ok, failed, cancelled)", ["renderer", "outcome"])
+metrics_registry.counter("resume_pdf_cache_lookups_total", "PDF cache lookups by result", ["result"], fn=lambda: {
+    ("memory_hit",): pdf_cache.memory_hits, ("disk_hit",): pdf_cache.disk_hits, ("miss",): pdf_cache.misses})
+metrics_registry.counter("resume_cache_hits_total", "Hits of the in-process caches", ["cache"], fn=lambda: {
+    ("sections",): section_fragment_cache.hits, ("preview",): preview_cache.hits, ("ai",): ai_cache.hits})
+metrics_registry.counter("resume_cache_misses_total", "Misses of the in-process caches", ["cache"], fn=lambda: {
+    ("sections",): section_fragment_cache.misses, ("preview",): preview_cache.misses, ("ai",): ai_cache.misses})
+metrics_registry.gauge("resume_compiles_in_flight", "Compiles running on the compile thread pool", fn=lambda: {(): compile_limiter.stats()["in_flight"]})
+metrics_registry.gauge("resume_compiles_waiting", "Compiles queued for a compile slot", fn=lambda: {(): compile_limiter.stats()["waiting"]})
+metrics_registry.gauge("resume_compile_slots", "Compiles this process runs at once", fn=lambda: {(): compile_limiter.stats()["max_concurrent"]})
+
+# "memory" answers with the PDF bytes read once from the scratch dir (which is removed right away);
+# "file" keeps the scratch dir and serves it with FileResponse, cleaning up after the send.
+PDF_RESPONSE_MODE = os.getenv("PDF_RESPONSE_MODE", "memory")
+LOG_TAIL_BYTES = 4096   # pdfTeX's "Output written on ... (N pages" summary is near the end of the .log
+
+# Page count of every compiled PDF by cache key, so /generate_pdf_fit can tell whether a resume that
+# /generate_pdf already compiled fits on one page without compiling it again
+pdf_page_counts = LRUCache(max_items=4096)
+
+def read_log_tail(log_filepath: str) -> str:
+    with open(log_filepath, "rb") as f:
+        f.seek(max(0, os.path.getsize(log_filepath) - LOG_TAIL_BYTES))
+        return f.read().decode('utf-8', errors='replace')
+
+def compile_resume_pdf(latex_template: str, cache_key: str, keep_file: bool = False, renderer: Optional[Renderer] = None,
+                       cancel: Optional[threading.Event] = None, read_log: bool = False):
+    # Blocking part of /generate_pdf (TeX run plus file I/O); runs on the compile thread pool.
+    # Every job gets its own scratch dir. Returns (pdf_bytes, workdir, compile_result); workdir is
+    # None unless keep_file is set, in which case the caller must remove it once the PDF is sent.
+    # Setting cancel kills the TeX run and raises CompileCancelled; compile_result.log carries the
+    # .log when read_log is set.
+    workdir = make_scratch_dir()
+    renderer = renderer or get_renderer()
     try:
-        # --- 1. Validate Body Template ---
-        body_id = resume_data.body_id
-        if '..' in body_id: raise HTTPException(status_code=400, detail="Invalid body template name")
-        template_path = os.path.join("templates", body_id)
-        if not os.path.exists(template_path): raise HTTPException(status_code=404, detail=f"Body template '{body_id}' not found")
-        
-        with open(template_path, "r", encoding='utf-8') as f: latex_template = f.read()
-
-        # --- 2. Define Header and Body Style Dispatchers ---
-        header_generators = {
-            "iitb": generate_iitb_header_latex,
-            "universal": generate_universal_header_latex,
-            "blank": generate_blank_header_latex,
-            "iitb_2": generate_iitb_official_2_header,
-        }
-
-        universal_style_sections = {
-            "scholasticAchievements": generate_scholastic_latex,
-            "professionalExperience": generate_experience_latex,
-            "keyProjects": generate_projects_latex,
-            "positionsOfResponsibility": generate_por_latex,
-            "extraCurriculars": generate_extracurricular_latex,
-            "technicalSkills": generate_technical_skills_latex,
-        }
-
-        dense_blue_style_sections = {
-            "scholasticAchievements": generate_dense_scholastic_latex,
-            "professionalExperience": generate_dense_experience_latex,
-            "keyProjects": generate_dense_projects_latex,
-            "positionsOfResponsibility": generate_dense_por_latex,
-            "extraCurriculars": generate_dense_extracurricular_latex,
-            "technicalSkills": generate_dense_technical_skills_latex,
-        }
-        # Ensure this block is added
-        tcolorbox_style_sections = {
-            "scholasticAchievements": generate_tcolorbox_scholastic_latex,
-            "professionalExperience": generate_tcolorbox_experience_latex,
-            "keyProjects": generate_tcolorbox_projects_latex,
-            "positionsOfResponsibility": generate_tcolorbox_por_latex,
-            "extraCurriculars": generate_tcolorbox_extracurricular_latex,
-            "technicalSkills": generate_tcolorbox_technical_skills_latex,
-        }
-        
-        body_style_map = {
-            "iitb_one_page.tex": universal_style_sections,
-            "dense_blue.tex": dense_blue_style_sections,
-            "tcolorbox_style.tex": tcolorbox_style_sections,
-        }
-
-        # --- 3. Generate Header LaTeX ---
-        header_id = resume_data.header_id
-        header_func = header_generators.get(header_id)
-        if not header_func: raise HTTPException(status_code=400, detail=f"Invalid header_id: {header_id}")
-        header_latex = header_func(resume_data.personalDetails) if header_id != "blank" else header_func()
-
-        # --- 4. Generate Dynamic Content LaTeX based on Body Style ---
-        section_generators = body_style_map.get(body_id)
-        if not section_generators:
-            # Default to universal style if the body_id is not explicitly mapped
-            section_generators = universal_style_sections
-
-        # --- Start replacement ---
-        dynamic_content = ""
-        # Add initial space ONLY for tcolorbox style to prevent header overlap
-        if body_id == "tcolorbox_style.tex":
-            dynamic_content += "\\vspace{5mm}\n" # Adjust this value as needed
-
-        for section_key in resume_data.sectionOrder:
-            generator_func = section_generators.get(section_key)
-            if generator_func:
-                section_data = getattr(resume_data, section_key, [])
-                if section_data: # Only process if there's data
-                    section_latex = generator_func(section_data)
-                    if section_latex:
-                        dynamic_content += section_latex + "\n"
-        # --- End replacement ---
-        
-        # --- 5. Populate Template and Compile PDF ---
-        latex_template = latex_template.replace("__PERSONAL_DETAILS_SECTION__", header_latex)
-        latex_template = latex_template.replace("__DYNAMIC_CONTENT_SECTION__", dynamic_content)
-        
-        session_id = str(uuid.uuid4())
-        tex_filepath = f"{session_id}.tex"
-        with open(tex_filepath, "w", encoding='utf-8') as f: f.write(latex_template)
-        
-        # We run it twice to ensure cross-references are resolved properly
-        subprocess.run(['pdflatex', '-interaction=nonstopmode', tex_filepath], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        subprocess.run(['pdflatex', '-interaction=nonstopmode', tex_filepath], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Uses a warm worker when one is ready; a second pass only runs if the log/aux ask for it
+        with cancellable(cancel):
+            compile_result = renderer.render(latex_template, workdir)
         
-        pdf_filepath = f"{session_id}.pdf"
+        pdf_filepath, log_filepath, _, _ = job_paths(workdir)
         if not os.path.exists(pdf_filepath):
-            log_filepath = f"{session_id}.log"
             log_content = "No log file found."
             if os.path.exists(log_filepath):
                 with open(log_filepath, "r", encoding='utf-8') as log_file: log_content = log_file.read()
             raise Exception(f"PDF file was not created. LaTeX log: {log_content}")
+
+        with stage("serving"):
+            with open(pdf_filepath, "rb") as f: pdf_bytes = f.read()
+            if os.path.exists(log_filepath):
+                if read_log:
+                    with open(log_filepath, "r", encoding='utf-8', errors='replace') as f: compile_result = compile_result._replace(log=f.read())
+                pages = page_count(compile_result.log if read_log else read_log_tail(log_filepath))
+                if pages: pdf_page_counts.put(cache_key, pages)
+            pdf_cache.put(cache_key, pdf_bytes)
+    except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        COMPILE_OUTCOMES.inc(renderer=renderer.name, outcome="cancelled" if isinstance(e, CompileCancelled) else "failed")
+        raise
+    COMPILE_OUTCOMES.inc(renderer=renderer.name, outcome="ok")
+    if keep_file: return pdf_bytes, workdir, compile_result
+    shutil.rmtree(workdir, ignore_errors=True)
+    return pdf_bytes, None, compile_result
+
+def pdf_etag(cache_key: str) -> str:
+    # The cache key already hashes the LaTeX source and compiler version, so it identifies the PDF
+    return f'"{cache_key[:32]}"'
+
+def pdf_response(pdf_bytes: bytes, etag: str, headers: dict) -> Response:
+    headers = {"Content-Disposition": 'attachment; filename="MyResume.pdf"', "ETag": etag, **headers}
+    return Response(content=pdf_bytes, media_type='application/pdf', headers=headers)
+
+@app.post("/generate_pdf")
+async def generate_pdf(resume_data: ResumeData, raw_request: Request, renderer: Optional[str] = None, session_id: Optional[str] = None):
+    try:
+        latex_template = build_resume_latex(resume_data)
+        try:
+            pdf_renderer = get_renderer(renderer)
+        except RendererUnavailable as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # With a session_id, the response reports which sections changed since the session's last build
+        fingerprint = resume_fingerprint(resume_data, pdf_renderer.name)
+        plan = build_sessions.plan(session_id, fingerprint)
+
+        # Identical resumes (repeat downloads, preview refreshes) are served without spawning TeX
+        cache_key = pdf_cache.key_for(latex_template, pdf_renderer.version())
+        etag = pdf_etag(cache_key)
+        if raw_request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        with stage("cache_lookup"):
+            cached_pdf = await run_in_threadpool(pdf_cache.get, cache_key)
+        if cached_pdf is not None:
+            build_sessions.record(session_id, fingerprint, plan, compiled=False)
+            return pdf_response(cached_pdf, etag, {"X-Cache": "HIT", "X-Renderer": pdf_renderer.name, **build_headers(plan)})
+        
+        keep_file = PDF_RESPONSE_MODE == "file"
+        try:
+            pdf_bytes, workdir, compile_result = await compile_limiter.run(compile_resume_pdf, latex_template, cache_key, keep_file, pdf_renderer)
+        except CompileQueueFull as e:
+            print(f"--- COMPILE QUEUE FULL, SHEDDING /generate_pdf ---: {e}")
+            raise HTTPException(status_code=503, detail="The PDF service is busy right now. Please try again in a few seconds.", headers={"Retry-After": "5"})
             
-        return FileResponse(pdf_filepath, media_type='application/pdf', filename="MyResume.pdf")
+        build_sessions.record(session_id, fingerprint, plan, compiled=True)
+        headers = {"X-Compile-Passes": str(compile_result.passes), "X-Cache": "MISS", "X-Renderer": pdf_renderer.name, **build_headers(plan)}
+        if not keep_file:
+            return pdf_response(pdf_bytes, etag, headers)
+        headers["ETag"] = etag
+        cleanup = BackgroundTask(shutil.rmtree, workdir, ignore_errors=True)
+        return FileResponse(job_paths(workdir)[0], media_type='application/pdf', filename="MyResume.pdf", headers=headers, background=cleanup)
+    except HTTPException:
+        raise
     except Exception as e:
         print("--- AN EXCEPTION OCCURRED IN generate_pdf ---"); traceback.print_exc(); print("-------------------------------------------")
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
 
-@app.post("/lengthen_text")
-async def lengthen_text(request: AdjustTextRequest):
+# --- Live Preview ---
+def render_preview_image(latex_template: str, cache_key: str, renderer: Renderer, image_format: str, dpi: int,
+                         cancel: threading.Event):
+    # Blocking part of /preview: reuse the compiled PDF when cached, then rasterize page one.
+    # Returns (image_bytes, compile_result), compile_result being None for a cached PDF.
+    with cancellable(cancel):
+        pdf_bytes, compile_result = pdf_cache.get(cache_key), None
+        if pdf_bytes is None: pdf_bytes, _, compile_result = compile_resume_pdf(latex_template, cache_key, False, renderer)
+        return rasterize_first_page(pdf_bytes, image_format, dpi), compile_result
+
+@app.post("/preview")
+async def preview(resume_data: ResumeData, raw_request: Request, session_id: Optional[str] = None, format: str = "png",
+                  dpi: int = PREVIEW_DPI, renderer: Optional[str] = None):
+    # Page one as an image for the live editor. Requests sharing a session_id supersede each other:
+    # a newer one cancels the compile of the older, which is answered with 409.
     try:
-        if not request.text.strip(): raise HTTPException(status_code=400, detail="Text cannot be empty")
-        prompt = generate_lengthen_prompt(request.text)
-        response = model.generate_content(prompt)
-        
-        # This line will raise a ValueError if parts are empty
-        adjusted_text = response.text.strip().replace('**', '').replace('\n', ' ')
-        return {"adjusted_text": adjusted_text}
-    
-    except ValueError as ve:
-        print(f"--- AI VALUE_ERROR (Likely Safety Block in /lengthen_text) ---: {ve}")
+        formats = preview_formats()
+        if format not in formats: raise HTTPException(status_code=400, detail=f"Unsupported preview format '{format}'. Choose one of: {', '.join(formats)}")
+        if not 1 <= dpi <= PREVIEW_MAX_DPI: raise HTTPException(status_code=400, detail=f"dpi must be between 1 and {PREVIEW_MAX_DPI}")
+        latex_template = build_resume_latex(resume_data)
         try:
-            finish_reason = response.candidates[0].finish_reason
-            print(f"--- Actual Finish Reason: {finish_reason} ---")
-            if finish_reason == 3: # SAFETY
-                 raise HTTPException(status_code=400, detail="Request blocked by AI safety filters. Please rephrase your input.")
-        except Exception:
-            pass 
-        raise HTTPException(status_code=500, detail="AI response was empty. This can be caused by safety filters or an internal AI error.")
-    
+            pdf_renderer = get_renderer(renderer)
+        except RendererUnavailable as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        fingerprint = resume_fingerprint(resume_data, pdf_renderer.name)
+        plan = build_sessions.plan(session_id, fingerprint)
+        cache_key = pdf_cache.key_for(latex_template, pdf_renderer.version())
+        preview_key = f"{cache_key}:{format}:{dpi}"
+        etag = f'"{cache_key[:32]}-{format}-{dpi}"'
+        if raw_request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Renderer": pdf_renderer.name, **build_headers(plan)}
+        image = preview_cache.get(preview_key)
+        if image is not None:
+            build_sessions.record(session_id, fingerprint, plan, compiled=False)
+            return Response(content=image, media_type=formats[format], headers={**headers, "X-Cache": "HIT"})
+
+        cancel = preview_sessions.begin(session_id)
+        try:
+            image, compile_result = await compile_limiter.run(render_preview_image, latex_template, cache_key, pdf_renderer, format, dpi, cancel)
+        except CompileCancelled:
+            raise HTTPException(status_code=409, detail="Superseded by a newer preview request")
+        except CompileQueueFull as e:
+            print(f"--- COMPILE QUEUE FULL, SHEDDING /preview ---: {e}")
+            raise HTTPException(status_code=503, detail="The PDF service is busy right now. Please try again in a few seconds.", headers={"Retry-After": "5"})
+        except PreviewUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        finally:
+            preview_sessions.end(session_id, cancel)
+        build_sessions.record(session_id, fingerprint, plan, compiled=compile_result is not None)
+        preview_cache.put(preview_key, image)
+        return Response(content=image, media_type=formats[format], headers={**headers, "X-Cache": "MISS"})
+    except HTTPException:
+        raise
     except Exception as e:
-        print("--- AI LENGthen EXCEPTION ---"); traceback.print_exc(); print("-------------------------")
-        raise HTTPException(status_code=500, detail=f"An error occurred with the AI model: {str(e)}")
+        print("--- AN EXCEPTION OCCURRED IN preview ---"); traceback.print_exc(); print("-------------------------------------------")
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
 
-@app.post("/shorten_text")
-async def shorten_text(request: AdjustTextRequest):
+# --- One-Page Fit ---
+# Chosen settings per resume (keyed by the untouched resume's PDF cache key); the PDF for those
+# settings then usually comes straight from the PDF cache.
+fit_cache = LRUCache(max_items=1024)
+
+@app.post("/generate_pdf_fit")
+async def generate_pdf_fit(resume_data: ResumeData, renderer: Optional[str] = None):
+    # Like /generate_pdf, but searches line spacing, itemsep and font size (see fit_solver.py) for the
+    # least compression that fits on one page. Candidates of a search round compile in parallel. The
+    # untouched resume is the same document (and PDF cache entry) as /generate_pdf's, so a resume
+    # that already fits and was downloaded before costs no compile at all.
     try:
-        if not request.text.strip(): raise HTTPException(status_code=400, detail="Text cannot be empty")
-        prompt = generate_shorten_prompt(request.text)
-        response = model.generate_content(prompt)
-        
-        # This line will raise a ValueError if parts are empty
-        adjusted_text = response.text.strip().replace('**', '').replace('\n', ' ')
-        return {"adjusted_text": adjusted_text}
+        latex_template = build_resume_latex(resume_data)
+        try:
+            pdf_renderer = get_renderer(renderer)
+        except RendererUnavailable as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        version = pdf_renderer.version()
+        compiles = 0
+
+        async def evaluate(settings: FitSettings):
+            nonlocal compiles
+            candidate = apply_settings(latex_template, settings)
+            cache_key = pdf_cache.key_for(candidate, version)
+            pages = pdf_page_counts.get(cache_key) if candidate is latex_template else None
+            if pages:
+                pdf_bytes = await run_in_threadpool(pdf_cache.get, cache_key)
+                if pdf_bytes is not None: return pages_only(pages), pdf_bytes
+            compiles += 1
+            pdf_bytes, _, compile_result = await compile_limiter.run(compile_resume_pdf, candidate, cache_key, False, pdf_renderer, None, True)
+            return measure_fit(compile_result.log or ""), pdf_bytes
+
+        fit_key = pdf_cache.key_for(latex_template, version)
+        try:
+            cached = fit_cache.get(fit_key)
+            if cached is not None:
+                status, settings, measurement = cached
+                candidate = apply_settings(latex_template, settings)
+                pdf_bytes = await run_in_threadpool(pdf_cache.get, pdf_cache.key_for(candidate, version))
+                if pdf_bytes is None: measurement, pdf_bytes = await evaluate(settings)
+            else:
+                outcome = await solve_fit(evaluate)
+                status, settings, measurement, pdf_bytes = outcome.status, outcome.settings, outcome.measurement, outcome.result
+                fit_cache.put(fit_key, (status, settings, measurement))
+        except CompileQueueFull as e:
+            print(f"--- COMPILE QUEUE FULL, SHEDDING /generate_pdf_fit ---: {e}")
+            raise HTTPException(status_code=503, detail="The PDF service is busy right now. Please try again in a few seconds.", headers={"Retry-After": "5"})
+
+        headers = {
+            "X-Fit": status,
+            "X-Fit-Settings": settings.describe(template_stretch(latex_template)),
+            "X-Fit-Compiles": str(compiles),
+            "X-Fit-Overflow-Pt": f"{measurement.overflow_pt:.2f}",
+            "X-Renderer": pdf_renderer.name,
+        }
+        # Not measured when the untouched resume fit (it is compiled without the fill-level \typeout)
+        if not math.isnan(measurement.slack_pt): headers["X-Fit-Slack-Pt"] = f"{measurement.slack_pt:.2f}"
+        etag = pdf_etag(pdf_cache.key_for(apply_settings(latex_template, settings), version))
+        return pdf_response(pdf_bytes, etag, headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("--- AN EXCEPTION OCCURRED IN generate_pdf_fit ---"); traceback.print_exc(); print("-------------------------------------------")
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
 
-    except ValueError as ve:
-        print(f"--- AI VALUE_ERROR (Likely Safety Block in /shorten_text) ---: {ve}")
+# --- Async PDF Jobs ---
+# POST /jobs/pdf answers at once with a job id; a worker compiles it later and GET /jobs/{id}
+# reports the status, with the PDF at /jobs/{id}/result. Jobs are keyed by the PDF cache key, so
+# resubmitting an identical resume returns the existing job.
+async def run_pdf_job(payload: dict) -> bytes:
+    # Worker side of a PDF job: the LaTeX was populated at submit time
+    pdf_renderer = get_renderer(payload["renderer"])
+    cached_pdf = await run_in_threadpool(pdf_cache.get, payload["cache_key"])
+    if cached_pdf is not None: return cached_pdf
+    try:
+        pdf_bytes, _, _ = await compile_limiter.run(compile_resume_pdf, payload["latex"], payload["cache_key"], False, pdf_renderer)
+    except CompileQueueFull:
+        raise JobRetry()
+    return pdf_bytes
+
+@app.post("/jobs/pdf", status_code=202)
+async def submit_pdf_job(resume_data: ResumeData, renderer: Optional[str] = None, priority: str = "interactive", webhook_url: Optional[str] = None):
+    if priority not in JOB_PRIORITIES: raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(JOB_PRIORITIES)}")
+    if webhook_url:
         try:
-            finish_reason = response.candidates[0].finish_reason
-            print(f"--- Actual Finish Reason: {finish_reason} ---")
-            if finish_reason == 3: # SAFETY
-                 raise HTTPException(status_code=400, detail="Request blocked by AI safety filters. Please rephrase your input.")
-        except Exception:
+            await run_in_threadpool(check_webhook_url, webhook_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    latex_template = build_resume_latex(resume_data)
+    try:
+        pdf_renderer = get_renderer(renderer)
+    except RendererUnavailable as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache_key = pdf_cache.key_for(latex_template, pdf_renderer.version())
+    payload = {"latex": latex_template, "cache_key": cache_key, "renderer": pdf_renderer.name}
+    job_id, deduplicated = await run_in_threadpool(job_queue.submit, cache_key, payload, priority, webhook_url)
+    job_queue.wake()
+    return {**await run_in_threadpool(job_queue.status, job_id), "deduplicated": deduplicated, "result_url": f"/jobs/{job_id}/result"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    status = await run_in_threadpool(job_queue.status, job_id)
+    if status is None: raise HTTPException(status_code=404, detail="Job not found")
+    return {**status, "result_url": f"/jobs/{job_id}/result"}
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    status = await run_in_threadpool(job_queue.status, job_id)
+    if status is None: raise HTTPException(status_code=404, detail="Job not found")
+    if status["status"] == "failed": raise HTTPException(status_code=500, detail=f"The PDF job failed: {status['error']}")
+    pdf_bytes = await run_in_threadpool(job_queue.result, job_id) if status["status"] == "done" else None
+    if pdf_bytes is None: raise HTTPException(status_code=409, detail=f"The PDF job is {status['status']}", headers={"Retry-After": "1"})
+    return pdf_response(pdf_bytes, f'"{job_id}"', {"X-Job": job_id})
+
+# --- Bulk Generation ---
+# One bulk run per server process at a time, on BULK_HTTP_WORKERS niced processes
+bulk_lock = threading.Lock()
+
+async def spool_jsonl(raw_request: Request):
+    # Streams the request body to an anonymous temp file, counting records as the lines arrive, so
+    # neither the body nor an over-limit upload is held in memory. Returns (file at offset 0, records).
+    spool = tempfile.TemporaryFile()
+    records, partial = 0, b""
+    try:
+        async for chunk in raw_request.stream():
+            await run_in_threadpool(spool.write, chunk)
+            lines = (partial + chunk).split(b"\n")
+            partial = lines.pop()
+            records += sum(1 for line in lines if line.strip())
+            if records > BULK_MAX_RECORDS: raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_RECORDS} resumes per bulk request")
+            if len(partial) > BULK_MAX_RECORD_BYTES: raise HTTPException(status_code=400, detail=f"A resume line is longer than {BULK_MAX_RECORD_BYTES} bytes")
+        if partial.strip(): records += 1
+        if records > BULK_MAX_RECORDS: raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_RECORDS} resumes per bulk request")
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, records
+
+@app.post("/bulk/pdf")
+async def bulk_pdf(raw_request: Request, renderer: Optional[str] = None):
+    # Body: JSONL, one ResumeData per line. Streams back a ZIP of the PDFs (named by line number and
+    # the record's "id", roll number or name) followed by errors.jsonl and stats.json. Finished PDFs
+    # land in the PDF cache, so resubmitting after an interrupted download only compiles the rest.
+    try:
+        pdf_renderer = get_renderer(renderer)
+    except RendererUnavailable as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if bulk_lock.locked():
+        raise HTTPException(status_code=503, detail="Another bulk run is in progress. Please try again later.", headers={"Retry-After": "30"})
+    spool, records = await spool_jsonl(raw_request)
+    if not records:
+        spool.close()
+        raise HTTPException(status_code=400, detail="No resumes in the request body")
+
+    def archive():
+        # The lock is taken here rather than in the handler: a response whose body is never iterated
+        # (client gone before it starts) must not keep it. A request that slipped past the check
+        # above at the same moment as another one just waits for that run to finish.
+        stats = BulkStats()
+        with bulk_lock, io.TextIOWrapper(spool, encoding="utf-8", errors="replace") as lines:
+            try:
+                records = read_records(lines, bulk_resume_latex, pdf_renderer.version())
+                yield from stream_zip(run_bulk(records, pdf_renderer.name, template_registry.sources(), BULK_HTTP_WORKERS, BULK_HTTP_NICE), stats)
+            finally:
+                print(f"--- BULK RUN FINISHED ---: {stats.as_dict()}")
+
+    headers = {"Content-Disposition": 'attachment; filename="resumes.zip"', "X-Renderer": pdf_renderer.name}
+    # The background task closes the spool file when the body was never iterated (closing twice is harmless)
+    return StreamingResponse(archive(), media_type="application/zip", headers=headers, background=BackgroundTask(spool.close))
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/renderers")
+async def list_renderers():
+    return {"default": DEFAULT_RENDERER, "renderers": {name: renderer.stats() for name, renderer in RENDERERS.items()}}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    # Per-process figures except where the store is shared; worker_pid tells the workers apart
+    return {"worker_pid": os.getpid(), "pdf": pdf_cache.stats(), "sections": section_fragment_cache.stats(), "ai": await run_in_threadpool(ai_cache.stats), "formats": latex_formats.stats(),
+            "preview": {**preview_cache.stats(), **preview_sessions.stats()}, "builds": build_sessions.stats(),
+            "jobs": await run_in_threadpool(job_queue.stats)}
+
+# --- Non-blocking AI Calls ---
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "30"))  # seconds before a Gemini call is abandoned
+AI_DISCONNECT_POLL_INTERVAL = 0.5
+
+class ClientDisconnected(Exception):
+    pass
+
+async def wait_for_disconnect(raw_request: Request) -> None:
+    while not await raw_request.is_disconnected():
+        await asyncio.sleep(AI_DISCONNECT_POLL_INTERVAL)
+
+# --- AI Metrics (exported on /metrics) ---
+# "call" tells the request shapes apart: single (one point), stream (SSE), batch (a whole section)
+# and fit (several candidates for one point), since their prompts differ a lot in size.
+AI_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+AI_LATENCY = metrics_registry.histogram("resume_ai_request_duration_seconds", "Gemini call latency by operation and call type",
+                                        ["operation", "call"], buckets=AI_LATENCY_BUCKETS)
+AI_CALLS = metrics_registry.counter("resume_ai_requests_total", "Gemini calls by outcome (ok, empty, safety_block, timeout, disconnected, error)",
+                                    ["operation", "call", "outcome"])
+AI_TOKENS = metrics_registry.counter("resume_ai_tokens_total", "Prompt and response tokens reported in usage_metadata", ["operation", "call", "kind"])
+AI_RETRIES = metrics_registry.counter("resume_ai_retries_total", "Extra Gemini calls made because an earlier reply was unusable", ["operation", "reason"])
+metrics_registry.counter("resume_ai_tokens_saved_total", "Tokens the AI response cache saved", fn=lambda: {(): ai_cache.tokens_saved})
+
+def finish_reason_of(response):
+    try:
+        return response.candidates[0].finish_reason
+    except Exception:
+        return None
+
+def reply_outcome(response) -> str:
+    # response.text raises ValueError when the reply has no parts; finish_reason 3 is SAFETY
+    try:
+        return "ok" if response.text.strip() else "empty"
+    except ValueError:
+        return "safety_block" if finish_reason_of(response) == 3 else "empty"
+
+def record_ai_call(operation: str, call: str, seconds: float, outcome: str, response=None) -> None:
+    AI_LATENCY.observe(seconds, operation=operation, call=call)
+    AI_CALLS.inc(operation=operation, call=call, outcome=outcome)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None: return
+    for kind, field in (("prompt", "prompt_token_count"), ("response", "candidates_token_count")):
+        try:
+            AI_TOKENS.inc(int(getattr(usage, field) or 0), operation=operation, call=call, kind=kind)
+        except (AttributeError, TypeError, ValueError):
             pass
-        raise HTTPException(status_code=500, detail="AI response was empty. This can be caused by safety filters or an internal AI error.")
-    
-    except Exception as e:
-        print("--- AI SHORTEN EXCEPTION ---"); traceback.print_exc(); print("-------------------------")
-        raise HTTPException(status_code=500, detail=f"An error occurred with the AI model: {str(e)}")
 
-@app.post("/improve_text")
-async def improve_text(request: ImproveTextRequest):
+async def generate_ai_content(prompt: str, raw_request: Request, operation: str, call: str = "single"):
+    # Awaits Gemini's async API so other requests keep being served meanwhile. The call is cancelled
+    # when it exceeds AI_REQUEST_TIMEOUT or when the client disconnects before it finishes.
+    start = time.perf_counter()
+    outcome, response = "error", None
+    generation = asyncio.ensure_future(model.generate_content_async(prompt))
+    disconnect = asyncio.ensure_future(wait_for_disconnect(raw_request))
+    try:
+        done, _ = await asyncio.wait({generation, disconnect}, timeout=AI_REQUEST_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        if generation in done:
+            response = generation.result()
+            outcome = reply_outcome(response)
+            return response
+        if disconnect in done:
+            outcome = "disconnected"
+            raise ClientDisconnected()
+        outcome = "timeout"
+        raise asyncio.TimeoutError()
+    finally:
+        generation.cancel()
+        disconnect.cancel()
+        record_ai_call(operation, call, time.perf_counter() - start, outcome, response)
+
+def clean_ai_text(text: str) -> str:
+    return text.strip().replace('**', '').replace('\n', ' ')
+
+def ai_cache_key(operation: str, text: str) -> str:
+    return ai_cache.key_for(operation, GEMINI_MODEL_NAME, AI_PROMPT_VERSIONS[operation], text)
+
+def usage_token_count(response) -> int:
+    try:
+        return int(response.usage_metadata.total_token_count)
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+def empty_response_error(response, endpoint: str, ve: ValueError) -> HTTPException:
+    # response.text raised because the reply has no parts; tell safety blocks apart from other failures
+    print(f"--- AI VALUE_ERROR (Likely Safety Block in {endpoint}) ---: {ve}")
+    # Try to get the real finish reason
+    finish_reason = None
+    try:
+        finish_reason = response.candidates[0].finish_reason
+        print(f"--- Actual Finish Reason: {finish_reason} ---")
+    except Exception:
+        pass # Fallback to generic error
+    if finish_reason == 3: # SAFETY
+        return HTTPException(status_code=400, detail="Request blocked by AI safety filters. Please rephrase your input.")
+    return HTTPException(status_code=500, detail="AI response was empty. This can be caused by safety filters or an internal AI error.")
+
+async def run_ai_rewrite(operation: str, text: str, raw_request: Request, endpoint: str) -> str:
+    # Shared body of /improve_text, /lengthen_text and /shorten_text; returns the cleaned single line.
+    # Repeat requests (retries, undo/redo, shared templates) are answered from the AI response cache.
+    cache_key = ai_cache_key(operation, text)
+    cached_text = await run_in_threadpool(ai_cache.get, cache_key)
+    if cached_text is not None: return cached_text
+
+    response = await generate_ai_content(AI_SINGLE_PROMPTS[operation](text), raw_request, operation)
     try:
-        if not request.text.strip(): raise HTTPException(status_code=400, detail="Text cannot be empty")
-        prompt = generate_ai_prompt(request.text)
-        response = model.generate_content(prompt)
-        
         # This line will raise a ValueError if parts are empty (e.g., safety block)
-        improved_text = response.text.strip().replace('**', '').replace('\n', ' ')
-        
-        return {"improved_text": improved_text}
-    
+        adjusted_text = clean_ai_text(response.text)
     except ValueError as ve:
-        print(f"--- AI VALUE_ERROR (Likely Safety Block in /improve_text) ---: {ve}")
-        # Try to get the real finish reason
+        raise empty_response_error(response, endpoint, ve)
+
+    await run_in_threadpool(ai_cache.put, cache_key, adjusted_text, usage_token_count(response))
+    return adjusted_text
+
+async def line_fit(text: str, body_id: Optional[str]) -> Optional[dict]:
+    # One-line fit of a rewrite in the caller's template; None when not asked for or not measurable here.
+    # In the threadpool because the template's first measurement compiles a probe document.
+    if not body_id: return None
+    try:
+        return (await run_in_threadpool(text_metrics.measure, text, body_id)).as_dict()
+    except text_metrics.TextMetricsUnavailable:
+        return None
+
+async def require_text_metrics(body_id: str) -> None:
+    # 404 for a template the registry doesn't serve, 503 when this server can't measure its bullets
+    # (no pdflatex or TFM files). Also takes the template's one-off probe compile off the event loop.
+    if template_registry.get(body_id) is None: raise HTTPException(status_code=404, detail=f"Body template '{body_id}' not found")
+    try:
+        await run_in_threadpool(text_metrics.template_fonts, body_id)
+    except text_metrics.TextMetricsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# --- Length-Constrained Rewrites ---
+AI_FIT_CANDIDATES = int(os.getenv("AI_FIT_CANDIDATES", "4"))   # rewrites asked for per model call
+AI_FIT_MAX_CALLS = int(os.getenv("AI_FIT_MAX_CALLS", "2"))     # calls before settling for the closest candidate
+AI_FIT_MIN_FILL = float(os.getenv("AI_FIT_MIN_FILL", "0.9"))   # shortest accepted line, as a fraction of the line width
+
+def fit_distance(fit: text_metrics.TextFit) -> float:
+    # Points outside the accepted band: how far past the line a wrapping candidate runs, or how far
+    # short of AI_FIT_MIN_FILL a one-liner ends. 0 for candidates inside the band.
+    if not fit.fits_one_line: return fit.min_width_pt - fit.line_width_pt
+    return max(0.0, AI_FIT_MIN_FILL * fit.line_width_pt - fit.width_pt)
+
+def fit_feedback(text: str, fit: text_metrics.TextFit) -> str:
+    # Turns the closest miss into a character count the model can act on
+    points_per_char = fit.width_pt / max(len(text), 1)
+    characters = max(1, round(fit_distance(fit) / points_per_char))
+    direction = "too long to fit on one line" if not fit.fits_one_line else "too short to fill the line"
+    return f"Your previous best attempt was about {characters} characters {direction}: \"{text}\". Adjust the length accordingly."
+
+def parse_candidates(text: str) -> List[str]:
+    # Like parse_batch_response, but any number of candidates is usable
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"): text = text[4:]
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(items, list): return []
+    return [clean_ai_text(item) for item in items if isinstance(item, str) and item.strip()]
+
+async def run_ai_fit_rewrite(operation: str, text: str, body_id: str, raw_request: Request, endpoint: str) -> dict:
+    # Asks for AI_FIT_CANDIDATES rewrites per call, measures each against the template's line width
+    # and keeps the longest one that fits on one line and fills at least AI_FIT_MIN_FILL of it. Only
+    # when no candidate lands in that band is the model called again, told how far off the closest
+    # one was. After AI_FIT_MAX_CALLS the closest candidate is returned with fit.fits_one_line telling
+    # the client whether it made it.
+    cache_key = ai_cache.key_for(f"{operation}:fit:{body_id}", GEMINI_MODEL_NAME, AI_PROMPT_VERSIONS[operation], text)
+    cached_text = await run_in_threadpool(ai_cache.get, cache_key)
+    if cached_text is not None:
+        return {"text": cached_text, "fit": text_metrics.measure(cached_text, body_id), "model_calls": 0, "candidates": 0}
+
+    best, best_fit, feedback, tokens, scored, calls = None, None, "", 0, 0, 0
+    while calls < AI_FIT_MAX_CALLS:
+        calls += 1
+        if calls > 1: AI_RETRIES.inc(operation=operation, reason="no_fit")
+        response = await generate_ai_content(generate_candidates_prompt(operation, text, AI_FIT_CANDIDATES, feedback), raw_request, operation, "fit")
         try:
-            finish_reason = response.candidates[0].finish_reason
-            print(f"--- Actual Finish Reason: {finish_reason} ---")
-            if finish_reason == 3: # SAFETY
-                 raise HTTPException(status_code=400, detail="Request blocked by AI safety filters. Please rephrase your input.")
-        except Exception:
-            pass # Fallback to generic error
-        raise HTTPException(status_code=500, detail="AI response was empty. This can be caused by safety filters or an internal AI error.")
+            candidates = parse_candidates(response.text)
+        except ValueError as ve:
+            raise empty_response_error(response, endpoint, ve)
+        tokens += usage_token_count(response)
+        for candidate in candidates:
+            fit = text_metrics.measure(candidate, body_id)
+            scored += 1
+            if best_fit is None or (fit_distance(fit), -fit.width_pt) < (fit_distance(best_fit), -best_fit.width_pt):
+                best, best_fit = candidate, fit
+        if best_fit is not None and fit_distance(best_fit) == 0: break
+        if best_fit is not None: feedback = fit_feedback(best, best_fit)
+    if best is None: raise HTTPException(status_code=500, detail="The AI model did not return any usable rewrite. Please try again.")
+
+    if fit_distance(best_fit) == 0: await run_in_threadpool(ai_cache.put, cache_key, best, tokens)
+    return {"text": best, "fit": best_fit, "model_calls": calls, "candidates": scored}
+
+async def handle_ai_rewrite(text: str, operation: str, raw_request: Request, endpoint: str, result_key: str, body_id: Optional[str] = None,
+                            fit: bool = False):
+    try:
+        if not text.strip(): raise HTTPException(status_code=400, detail="Text cannot be empty")
+        if fit:
+            if not body_id: raise HTTPException(status_code=400, detail="fit requires a body_id to measure against")
+            await require_text_metrics(body_id)
+            outcome = await run_ai_fit_rewrite(operation, text, body_id, raw_request, endpoint)
+            return {result_key: outcome["text"], "fit": outcome["fit"].as_dict(), "model_calls": outcome["model_calls"], "candidates": outcome["candidates"]}
+        adjusted_text = await run_ai_rewrite(operation, text, raw_request, endpoint)
+        if body_id: return {result_key: adjusted_text, "fit": await line_fit(adjusted_text, body_id)}
+        return {result_key: adjusted_text}
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        print(f"--- CLIENT DISCONNECTED, CANCELLED AI CALL IN {endpoint} ---")
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        print(f"--- AI TIMEOUT IN {endpoint} after {AI_REQUEST_TIMEOUT}s ---")
+        raise HTTPException(status_code=504, detail="The AI model took too long to respond. Please try again.")
+    except Exception as e:
+        print(f"--- AI EXCEPTION IN {endpoint} ---"); traceback.print_exc(); print("-------------------------")
+        raise HTTPException(status_code=500, detail=f"An error occurred with the AI model: {str(e)}")
 
+@app.post("/lengthen_text")
+async def lengthen_text(request: AdjustTextRequest, raw_request: Request):
+    return await handle_ai_rewrite(request.text, "lengthen", raw_request, "/lengthen_text", "adjusted_text", request.body_id, request.fit)
+
+@app.post("/shorten_text")
+async def shorten_text(request: AdjustTextRequest, raw_request: Request):
+    return await handle_ai_rewrite(request.text, "shorten", raw_request, "/shorten_text", "adjusted_text", request.body_id, request.fit)
+
+@app.post("/improve_text")
+async def improve_text(request: ImproveTextRequest, raw_request: Request):
+    return await handle_ai_rewrite(request.text, "improve", raw_request, "/improve_text", "improved_text", request.body_id, request.fit)
+
+@app.post("/measure_text")
+async def measure_text(request: MeasureTextRequest):
+    # Predicts from the template's font metrics whether each text fits on one bullet line, without
+    # compiling anything. Texts use the same **bold** markup as resume points.
+    texts = list(request.texts) + ([request.text] if request.text is not None else [])
+    if not texts: raise HTTPException(status_code=400, detail="No text to measure")
+    await require_text_metrics(request.body_id)
+    try:
+        results = [{"text": text, **text_metrics.measure(text, request.body_id).as_dict()} for text in texts]
+    except text_metrics.TextMetricsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"body_id": request.body_id, "results": results}
+
+# --- Streaming AI Rewrites (Server-Sent Events) ---
+# Events: "token" carries raw text as Gemini produces it, "done" carries the final cleaned line
+# (same post-processing as the JSON endpoints), "error" carries {"status", "detail"}.
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+async def stream_ai_rewrite(operation: str, text: str, endpoint: str):
+    cache_key = ai_cache_key(operation, text)
+    cached_text = await run_in_threadpool(ai_cache.get, cache_key)
+    if cached_text is not None:
+        yield sse_event("token", {"text": cached_text})
+        yield sse_event("done", {"text": cached_text})
+        return
+
+    deadline = asyncio.get_running_loop().time() + AI_REQUEST_TIMEOUT
+    start = time.perf_counter()
+    outcome, response = "disconnected", None   # stays so when the client goes away mid-stream
+    try:
+        response = await asyncio.wait_for(model.generate_content_async(AI_SINGLE_PROMPTS[operation](text), stream=True), AI_REQUEST_TIMEOUT)
+        chunks = []
+        stream = response.__aiter__()
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), max(remaining, 0))
+            except StopAsyncIteration:
+                break
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                continue # A part-less chunk (e.g. the one carrying a safety finish_reason)
+            chunks.append(chunk_text)
+            yield sse_event("token", {"text": chunk_text})
+
+        full_text = "".join(chunks)
+        if not full_text.strip():
+            outcome = "safety_block" if finish_reason_of(response) == 3 else "empty"
+            error = empty_response_error(response, endpoint, ValueError("stream produced no text"))
+            yield sse_event("error", {"status": error.status_code, "detail": error.detail})
+            return
+        outcome = "ok"
+        adjusted_text = clean_ai_text(full_text)
+        await run_in_threadpool(ai_cache.put, cache_key, adjusted_text, usage_token_count(response))
+        yield sse_event("done", {"text": adjusted_text})
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        print(f"--- AI TIMEOUT IN {endpoint} after {AI_REQUEST_TIMEOUT}s ---")
+        yield sse_event("error", {"status": 504, "detail": "The AI model took too long to respond. Please try again."})
+    except Exception as e:
+        outcome = "error"
+        print(f"--- AI EXCEPTION IN {endpoint} ---"); traceback.print_exc(); print("-------------------------")
+        yield sse_event("error", {"status": 500, "detail": f"An error occurred with the AI model: {str(e)}"})
+    finally:
+        record_ai_call(operation, "stream", time.perf_counter() - start, outcome, response)
+
+def handle_ai_stream(text: str, operation: str, endpoint: str):
+    if not text.strip(): raise HTTPException(status_code=400, detail="Text cannot be empty")
+    # Starlette cancels the generator when the client disconnects, which abandons the Gemini stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream_ai_rewrite(operation, text, endpoint), media_type="text/event-stream", headers=headers)
+
+@app.post("/improve_text/stream")
+async def improve_text_stream(request: ImproveTextRequest):
+    return handle_ai_stream(request.text, "improve", "/improve_text/stream")
+
+@app.post("/lengthen_text/stream")
+async def lengthen_text_stream(request: AdjustTextRequest):
+    return handle_ai_stream(request.text, "lengthen", "/lengthen_text/stream")
+
+@app.post("/shorten_text/stream")
+async def shorten_text_stream(request: AdjustTextRequest):
+    return handle_ai_stream(request.text, "shorten", "/shorten_text/stream")
+
+# --- Batch AI Rewrites ---
+AI_BATCH_MAX_POINTS = int(os.getenv("AI_BATCH_MAX_POINTS", "40"))
+AI_BATCH_FANOUT_CONCURRENCY = int(os.getenv("AI_BATCH_FANOUT_CONCURRENCY", "5"))
+
+def parse_batch_response(text: str, expected: int) -> Optional[List[str]]:
+    # The model is asked for a bare JSON array, but tolerate a ```json fence around it
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"): text = text[4:]
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(items, list) or len(items) != expected or not all(isinstance(item, str) for item in items):
+        return None
+    return [clean_ai_text(item) for item in items]
+
+async def rewrite_points_batched(operation: str, points: List[str], raw_request: Request) -> Optional[List[str]]:
+    # One structured call carrying the instructions (and few-shot examples) once for all points.
+    # Returns None when the reply can't be matched back to the points, so the caller can fan out.
+    response = await generate_ai_content(generate_batch_prompt(operation, points), raw_request, operation, "batch")
+    try:
+        rewritten = parse_batch_response(response.text, len(points))
+    except ValueError:
+        return None # Empty/blocked batch reply; per-item calls will tell us which point caused it
+    if rewritten is not None:
+        tokens_per_point = usage_token_count(response) // len(points)
+        for point, text in zip(points, rewritten):
+            await run_in_threadpool(ai_cache.put, ai_cache_key(operation, point), text, tokens_per_point)
+    return rewritten
+
+async def rewrite_points_fanout(operation: str, points: List[str], raw_request: Request, endpoint: str) -> List[dict]:
+    semaphore = asyncio.Semaphore(AI_BATCH_FANOUT_CONCURRENCY)
+
+    async def rewrite_one(point: str) -> dict:
+        async with semaphore:
+            try:
+                return {"text": await run_ai_rewrite(operation, point, raw_request, endpoint), "error": None}
+            except HTTPException as e:
+                return {"text": None, "error": e.detail}
+            except asyncio.TimeoutError:
+                return {"text": None, "error": "The AI model took too long to respond."}
+            except ClientDisconnected:
+                raise # Nobody is waiting for the rest of the batch
+            except Exception as e:
+                # Rate limits, API and network errors fail this point only, not the whole batch
+                print(f"--- AI EXCEPTION IN {endpoint} (batch item) ---"); traceback.print_exc(); print("-------------------------")
+                return {"text": None, "error": f"An error occurred with the AI model: {str(e)}"}
+
+    return await asyncio.gather(*[rewrite_one(point) for point in points])
+
+async def handle_ai_batch(batch: BatchTextRequest, operation: str, raw_request: Request, endpoint: str):
+    try:
+        points = list(batch.points)
+        if batch.experience: points += batch.experience.points
+        if batch.project: points += batch.project.points
+        if not points: raise HTTPException(status_code=400, detail="No points to rewrite")
+        if len(points) > AI_BATCH_MAX_POINTS: raise HTTPException(status_code=400, detail=f"At most {AI_BATCH_MAX_POINTS} points per batch")
+
+        # Empty points are reported per item and never sent to the model; cached points skip it too
+        results = [{"index": i, "text": None, "error": "Text cannot be empty"} for i in range(len(points))]
+        pending = []
+        for i, point in enumerate(points):
+            if not point.strip(): continue
+            cached_text = await run_in_threadpool(ai_cache.get, ai_cache_key(operation, point))
+            if cached_text is not None: results[i].update({"text": cached_text, "error": None})
+            else: pending.append(i)
+        pending_points = [points[i] for i in pending]
+
+        mode = "batched" if pending_points else "cached"
+        rewritten = await rewrite_points_batched(operation, pending_points, raw_request) if pending_points else []
+        if rewritten is None:
+            mode = "fanout"
+            print(f"--- AI BATCH REPLY UNUSABLE IN {endpoint}, FANNING OUT {len(pending_points)} POINTS ---")
+            AI_RETRIES.inc(len(pending_points), operation=operation, reason="batch_unusable")
+            outcomes = await rewrite_points_fanout(operation, pending_points, raw_request, endpoint)
+        else:
+            outcomes = [{"text": text, "error": None} for text in rewritten]
+        for i, outcome in zip(pending, outcomes):
+            results[i].update(outcome)
+        if batch.body_id:
+            for result in results: result["fit"] = await line_fit(result["text"], batch.body_id) if result["text"] else None
+        return {"results": results, "mode": mode}
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        print(f"--- CLIENT DISCONNECTED, CANCELLED AI CALL IN {endpoint} ---")
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        print(f"--- AI TIMEOUT IN {endpoint} after {AI_REQUEST_TIMEOUT}s ---")
+        raise HTTPException(status_code=504, detail="The AI model took too long to respond. Please try again.")
     except Exception as e:
-        print("--- AI ENDPOINT EXCEPTION OCCURRED ---"); traceback.print_exc(); print("------------------------------------")
+        print(f"--- AI EXCEPTION IN {endpoint} ---"); traceback.print_exc(); print("-------------------------")
         raise HTTPException(status_code=500, detail=f"An error occurred with the AI model: {str(e)}")
 
+@app.post("/improve_batch")
+async def improve_batch(batch: BatchTextRequest, raw_request: Request):
+    return await handle_ai_batch(batch, "improve", raw_request, "/improve_batch")
+
+@app.post("/lengthen_batch")
+async def lengthen_batch(batch: BatchTextRequest, raw_request: Request):
+    return await handle_ai_batch(batch, "lengthen", raw_request, "/lengthen_batch")
+
+@app.post("/shorten_batch")
+async def shorten_batch(batch: BatchTextRequest, raw_request: Request):
+    return await handle_ai_batch(batch, "shorten", raw_request, "/shorten_batch")
+
 @app.post("/funnel/submit")
 async def funnel_submit(data: FunnelSubmitData):
     try:
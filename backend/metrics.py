@@ -0,0 +1,200 @@
+# metrics.py (Prometheus text-format metrics and per-request stage timing, no client library needed)
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; covers everything from a sanitize pass (sub-millisecond) to a cold multi-pass compile
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def format_value(value: float) -> str:
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metric:
+    # One metric family. Values are kept per label-value tuple; fn (for gauges and counters that
+    # mirror state kept elsewhere) is called at scrape time and returns {label tuple: value}.
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], Dict[tuple, float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, tuple, Tuple[Tuple[str, str], ...], float]]:
+        # (suffix, label values, extra labels, value)
+        values = self.fn() if self.fn else self._snapshot()
+        for key, value in sorted(values.items()): yield "", key, (), value
+
+    def _snapshot(self) -> dict:
+        with self._lock: return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock: self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, List[float]] = {}   # label tuple -> per-bucket counts, then sum and count
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None: series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets): series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock: series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield "_bucket", key, (("le", format_value(bound)),), cumulative
+            yield "_bucket", key, (("le", "+Inf"),), values[-1]
+            yield "_sum", key, (), values[-2]
+            yield "_count", key, (), values[-1]
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = (), fn=None) -> Counter:
+        return self.register(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:   # a broken callback must not take the whole scrape down
+                print(f"--- METRIC {metric.name} FAILED ---: {e}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# --- Pipeline Stage Timing ---
+# Each request gets a dict of stage -> seconds in a context variable. stage() adds to it (so a stage
+# run many times per request, like a TeX pass, reports its total) and the middleware turns it into
+# stage histogram observations plus a Server-Timing header. Work running on the compile threads
+# sees the same dict because CompileLimiter copies the request's context into the executor.
+STAGE_SECONDS = registry.histogram("resume_stage_duration_seconds", "Time spent per request in each PDF pipeline stage", ["stage"])
+REQUEST_SECONDS = registry.histogram("resume_http_request_duration_seconds", "Time to the response start, by route", ["method", "route", "status"])
+_stage_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+_stage_totals: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_totals", default=None)
+
+def add_stage_time(name: str, seconds: float) -> None:
+    timings = _stage_timings.get()
+    if timings is None:
+        STAGE_SECONDS.observe(seconds, stage=name)   # outside a request (bulk workers, job queue)
+        return
+    timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(name, time.perf_counter() - start)
+
+@contextmanager
+def stage_totals():
+    # For work split into many tiny calls (sanitizing each string of a resume): the calls add their
+    # time to the yielded dict, and each name is reported once, as one stage observation, when the
+    # block ends. Outside a request that is still one histogram observation per block, not per call.
+    totals: Dict[str, float] = {}
+    token = _stage_totals.set(totals)
+    try:
+        yield totals
+    finally:
+        _stage_totals.reset(token)
+        for name, seconds in totals.items(): add_stage_time(name, seconds)
+
+def current_stage_totals() -> Optional[Dict[str, float]]:
+    return _stage_totals.get()
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    return ", ".join(entries + [f"total;dur={total * 1000:.2f}"])
+
+class StageTimingMiddleware:
+    # Pure ASGI middleware (the header has to go out with http.response.start, before a streamed body)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        timings: Dict[str, float] = {}
+        token = _stage_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, elapsed).encode("latin-1")))
+                headers.append((b"timing-allow-origin", b"*"))   # lets a cross-origin frontend read the durations
+                message = {**message, "headers": headers}
+                route = getattr(scope.get("route"), "path", "unmatched")
+                REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=message["status"])
+                for name, seconds in timings.items(): STAGE_SECONDS.observe(seconds, stage=name)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stage_timings.reset(token)
@@ -0,0 +1,85 @@
+# preview.py (rasterized first-page previews and per-session request supersession)
+import io
+import os
+import shutil
+import subprocess
+import threading
+from typing import Dict, Optional
+
+from caching import LRUCache
+from latex_compiler import make_scratch_dir, wait_for_process
+
+try:
+    from PIL import Image  # optional, only needed for WebP previews
+except ImportError:
+    Image = None
+
+PREVIEW_DPI = int(os.getenv("PREVIEW_DPI", "72"))               # screen resolution; A4 is 595x842 px at 72 dpi
+PREVIEW_MAX_DPI = int(os.getenv("PREVIEW_MAX_DPI", "200"))
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+PREVIEW_RASTER_TIMEOUT = float(os.getenv("PREVIEW_RASTER_TIMEOUT", "15"))
+PREVIEW_FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+class PreviewUnavailable(Exception):
+    pass
+
+def preview_formats() -> Dict[str, str]:
+    # Image formats this host can produce; WebP needs Pillow on top of pdftoppm
+    if Image is None: return {"png": PREVIEW_FORMATS["png"]}
+    return dict(PREVIEW_FORMATS)
+
+def rasterize_first_page(pdf_bytes: bytes, image_format: str = "png", dpi: int = PREVIEW_DPI) -> bytes:
+    # Renders page one of a PDF with pdftoppm (poppler) and returns the encoded image.
+    if shutil.which("pdftoppm") is None: raise PreviewUnavailable("pdftoppm is not installed on this server")
+    if image_format not in preview_formats(): raise PreviewUnavailable(f"'{image_format}' previews are not supported on this server")
+    workdir = make_scratch_dir(prefix="preview-")
+    try:
+        pdf_path, image_base = os.path.join(workdir, "page.pdf"), os.path.join(workdir, "page")
+        with open(pdf_path, "wb") as f: f.write(pdf_bytes)
+        process = subprocess.Popen(['pdftoppm', '-png', '-r', str(dpi), '-f', '1', '-l', '1', '-singlefile', pdf_path, image_base],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            wait_for_process(process, timeout=PREVIEW_RASTER_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            raise PreviewUnavailable(f"pdftoppm exceeded the {PREVIEW_RASTER_TIMEOUT}s timeout")
+        if process.returncode != 0: raise PreviewUnavailable(f"pdftoppm failed: {process.stderr.read().decode(errors='replace')[:200]}")
+        with open(f"{image_base}.png", "rb") as f: png_bytes = f.read()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if image_format == "png": return png_bytes
+    output = io.BytesIO()
+    Image.open(io.BytesIO(png_bytes)).save(output, format="WEBP", quality=80, method=4)
+    return output.getvalue()
+
+class PreviewSessions:
+    # One in-flight preview per editing session. Starting a new preview sets the cancel event of the
+    # previous one, which kills its TeX/pdftoppm process (or drops it from the compile queue), so a
+    # burst of keystroke-driven requests only ever pays for the latest resume.
+    def __init__(self):
+        self._current: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.superseded = 0
+
+    def begin(self, session_id: Optional[str]) -> threading.Event:
+        cancel = threading.Event()
+        if not session_id: return cancel
+        with self._lock:
+            previous = self._current.get(session_id)
+            self._current[session_id] = cancel
+        if previous is not None and not previous.is_set():
+            previous.set()
+            with self._lock: self.superseded += 1
+        return cancel
+
+    def end(self, session_id: Optional[str], cancel: threading.Event) -> None:
+        if not session_id: return
+        with self._lock:
+            if self._current.get(session_id) is cancel: del self._current[session_id]
+
+    def stats(self) -> dict:
+        with self._lock: return {"active_sessions": len(self._current), "superseded": self.superseded}
+
+# Encoded images keyed by (PDF cache key, format, dpi); the PDF cache key already hashes the LaTeX
+preview_cache = LRUCache(max_items=2048, max_bytes=PREVIEW_CACHE_MAX_BYTES)
+preview_sessions = PreviewSessions()
@@ -0,0 +1,133 @@
+# renderers.py (pluggable LaTeX -> PDF engines behind one interface)
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from latex_compiler import (
+    CompileResult, LatexPool, aux_signature, build_formats, compile_cold, compile_latex, compiler_version, job_paths,
+    needs_rerun, pool as pdflatex_pool,
+)
+
+DEFAULT_RENDERER = os.getenv("RENDERER", "pdflatex")                     # used when a request names none
+LUALATEX_POOL_SIZE = int(os.getenv("LUALATEX_POOL_SIZE", "1"))          # resident LuaTeX workers per template
+
+class RendererUnavailable(Exception):
+    pass
+
+class Renderer(ABC):
+    # A renderer turns a populated template into resume.pdf (plus .log/.aux) inside a scratch dir.
+    # render() is blocking and runs on the compile thread pool. version() (renderer name plus engine
+    # version) goes into the PDF cache key, so output from different engines is never mixed up.
+    name = ""
+
+    @abstractmethod
+    def available(self) -> bool: ...
+
+    @abstractmethod
+    def version(self) -> str: ...
+
+    def start(self, template_sources: List[str]) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+    @abstractmethod
+    def render(self, latex_source: str, workdir: str) -> CompileResult: ...
+
+    def stats(self) -> dict:
+        return {"available": self.available()}
+
+class PdflatexRenderer(Renderer):
+    # The reference engine: warm worker pool, precompiled formats, cold pdflatex as the last resort.
+    name = "pdflatex"
+
+    def available(self) -> bool:
+        return shutil.which("pdflatex") is not None
+
+    def version(self) -> str:
+        return f"{self.name}: {compiler_version()}"
+
+    def start(self, template_sources: List[str]) -> None:
+        # Dump (or reuse from disk) a format per template first, so the pool workers start from them
+        compiler_version()
+        build_formats(template_sources)
+        pdflatex_pool.start(template_sources)
+
+    def shutdown(self) -> None:
+        pdflatex_pool.shutdown()
+
+    def render(self, latex_source: str, workdir: str) -> CompileResult:
+        return compile_latex(latex_source, workdir)
+
+    def stats(self) -> dict:
+        return {"available": self.available(), "pool": pdflatex_pool.stats()}
+
+class LualatexRenderer(Renderer):
+    # Alternative engine: resident LuaTeX processes that have already loaded the template preamble
+    # (same warm-worker protocol as the pdflatex pool), with a cold lualatex run as fallback. A cold
+    # LuaTeX start is slower than pdflatex, so this engine relies on its pool for latency. Unless it is
+    # the default renderer, the pool only starts with the first lualatex request (which compiles cold
+    # while it warms up), so hosts that never use the engine don't keep LuaTeX processes around.
+    name = "lualatex"
+
+    def __init__(self, pool_size: int = LUALATEX_POOL_SIZE):
+        self.pool = LatexPool(size=pool_size, engine="lualatex")
+        self._template_sources: List[str] = []
+        self._pool_started = False
+        self._start_lock = threading.Lock()
+
+    def available(self) -> bool:
+        return shutil.which("lualatex") is not None
+
+    def version(self) -> str:
+        return f"{self.name}: {compiler_version('lualatex')}"
+
+    def start(self, template_sources: List[str]) -> None:
+        self._template_sources = list(template_sources)
+        if self.available(): self.version()
+        if self.name == DEFAULT_RENDERER and self.available(): self._start_pool(background=False)
+
+    def _start_pool(self, background: bool) -> None:
+        with self._start_lock:
+            if self._pool_started: return
+            self._pool_started = True
+        if background: threading.Thread(target=self.pool.start, args=(self._template_sources,), daemon=True).start()
+        else: self.pool.start(self._template_sources)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown()
+
+    def render(self, latex_source: str, workdir: str) -> CompileResult:
+        if not self.available(): raise RendererUnavailable("lualatex is not installed")
+        if not self._pool_started: self._start_pool(background=True)
+        pdf_filepath, log_filepath, aux_filepath, tex_filepath = job_paths(workdir)
+        warm = self.pool.compile(latex_source, pdf_filepath, log_filepath, aux_filepath)
+        if warm and not needs_rerun(log_filepath, aux_signature(""), aux_signature(aux_filepath)):
+            return CompileResult(passes=1, warm=True)
+        with open(tex_filepath, "w", encoding='utf-8') as f: f.write(latex_source)
+        return CompileResult(passes=compile_cold(tex_filepath, passes_done=int(warm), engine="lualatex"), warm=warm)
+
+    def stats(self) -> dict:
+        return {"available": self.available(), "pool": self.pool.stats()}
+
+RENDERERS: Dict[str, Renderer] = {renderer.name: renderer for renderer in (PdflatexRenderer(), LualatexRenderer())}
+
+def get_renderer(name: Optional[str] = None) -> Renderer:
+    # Looks up a renderer by name, or the configured default when None. Raises RendererUnavailable
+    # for unknown names and for explicitly requested engines that are not installed on this host.
+    if name is None: return RENDERERS[DEFAULT_RENDERER]
+    renderer = RENDERERS.get(name)
+    if renderer is None: raise RendererUnavailable(f"Unknown renderer '{name}'. Choose one of: {', '.join(RENDERERS)}")
+    if not renderer.available(): raise RendererUnavailable(f"Renderer '{name}' is not installed on this server")
+    return renderer
+
+def start_renderers(template_sources: List[str]) -> None:
+    # The default engine always starts; others only warm up when they are installed.
+    for renderer in RENDERERS.values():
+        if renderer.name == DEFAULT_RENDERER or renderer.available(): renderer.start(template_sources)
+
+def shutdown_renderers() -> None:
+    for renderer in RENDERERS.values(): renderer.shutdown()
@@ -0,0 +1,667 @@
+# resume_latex.py (resume models and the LaTeX they populate the body templates with)
+# Kept apart from main.py so the bulk CLI and the benchmarks can build resumes without the web app
+# (and without a Gemini key).
+import os
+import re
+import json
+import hashlib
+import time
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from caching import LRUCache
+from metrics import current_stage_totals, stage, stage_totals
+from template_registry import template_registry
+
+# --- Pydantic Models ---
+class PersonalDetails(BaseModel):
+    name: str = ""
+    branch: str = ""
+    institution: str = ""
+    email: Optional[str] = ""
+    phone: Optional[str] = ""
+    linkedin_url: Optional[str] = ""
+    github_url: Optional[str] = ""
+    location: Optional[str] = ""
+    cpi: str = ""
+    grad_year: Optional[str] = ""
+    roll_no: Optional[str] = ""
+    dob: Optional[str] = ""
+    gender: Optional[str] = ""
+class ScholasticAchievement(BaseModel): text: str = ""
+class Experience(BaseModel): company: str = ""; role: str = ""; dates: str = ""; description: str = ""; points: List[str] = []
+class Project(BaseModel): name: str = ""; subtitle: str = ""; dates: str = ""; description: str = ""; points: List[str] = []
+class Responsibility(BaseModel): role: str = ""; organization: str = ""; dates: str = ""; description: str = ""; points: List[str] = []
+class ExtraCurricular(BaseModel): text: str = ""; date: str = ""
+class TechnicalSkill(BaseModel):
+    category: str = ""
+    skills: str = ""
+
+class ResumeData(BaseModel):
+    header_id: str
+    body_id: str
+    sectionOrder: List[str]
+    personalDetails: PersonalDetails
+    scholasticAchievements: List[ScholasticAchievement]
+    professionalExperience: List[Experience]
+    keyProjects: List[Project]
+    positionsOfResponsibility: List[Responsibility]
+    extraCurriculars: List[ExtraCurricular] = []
+    technicalSkills: List[TechnicalSkill] = []
+
+# --- LaTeX Escaping ---
+# One precompiled character-class regex plus a lookup dict replaces the old chain of twelve
+# str.replace calls, so each fragment is scanned once. Backslash maps to \textbackslash\{\}
+# (escaped braces) because the chained version escaped the braces it had just inserted; the
+# table keeps that output byte-for-byte.
+LATEX_ESCAPES = {
+    '\\': r'\textbackslash\{\}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '[': r'{[}',
+    ']': r'{]}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+LATEX_SPECIAL_CHARS = re.compile(r'[\\&%$#_{}\[\]~^]')
+BOLD_PATTERN = re.compile(r'(\*\*.*?\*\*)')
+
+def _latex_escape(match) -> str:
+    return LATEX_ESCAPES[match.group()]
+
+def sanitize_and_format(text: str) -> str:
+    # Timed as the "sanitize" stage inside build_resume_latex, which sums the calls of one build and
+    # reports them as a single observation; elsewhere (benchmarks, probes) it is not timed at all.
+    totals = current_stage_totals()
+    if totals is None: return _sanitize_and_format(text)
+    start = time.perf_counter()
+    sanitized = _sanitize_and_format(text)
+    totals["sanitize"] = totals.get("sanitize", 0.0) + time.perf_counter() - start
+    return sanitized
+
+def _sanitize_and_format(text: str) -> str:
+    # This function handles both sanitization and Markdown-style bolding.
+    if '**' not in text:
+        # Most fragments (dates, companies, plain bullets) have no bold markers at all
+        return LATEX_SPECIAL_CHARS.sub(_latex_escape, text)
+
+    # Split the string by the bold delimiter (**), keeping the delimiters
+    parts = BOLD_PATTERN.split(text)
+    
+    processed_parts = []
+    for part in parts:
+        if part.startswith('**') and part.endswith('**'):
+            # This is a bolded part. Extract content, sanitize it, and wrap in \textbf{}
+            content = part[2:-2]
+            processed_parts.append(f"\\textbf{{{LATEX_SPECIAL_CHARS.sub(_latex_escape, content)}}}")
+        else:
+            # This is a normal part. Just sanitize it.
+            processed_parts.append(LATEX_SPECIAL_CHARS.sub(_latex_escape, part))
+            
+    return "".join(processed_parts)
+
+# --- Section Fragment Memoization ---
+# Live-preview edits usually touch one bullet, so unchanged sections are served from an LRU keyed
+# on (body style, section key, hash of the section's data) instead of being regenerated.
+SECTION_CACHE_SIZE = int(os.getenv("SECTION_CACHE_SIZE", "2048"))
+section_fragment_cache = LRUCache(max_items=SECTION_CACHE_SIZE)
+
+def section_data_digest(section_data: List[BaseModel]) -> str:
+    payload = json.dumps([item.model_dump() for item in section_data], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def render_section(body_style: str, section_key: str, generator_func, section_data: List[BaseModel]) -> str:
+    cache_key = (body_style, section_key, section_data_digest(section_data))
+    section_latex = section_fragment_cache.get(cache_key)
+    if section_latex is None:
+        section_latex = generator_func(section_data)
+        section_fragment_cache.put(cache_key, section_latex)
+    return section_latex
+
+# --- FINAL, STABLE LaTeX Generation Functions ---
+def generate_iitb_header_latex(details: PersonalDetails) -> str:
+    # This function now perfectly replicates the structured IITB header with the logo.
+    return f"""
+\\begin{{tabular*}}{{\\textwidth}}{{l@{{\\extracolsep{{\\fill}}}}cr}}
+    % Column 1: IITB Logo (larger and left-aligned)
+    \\begin{{tabular}}[b]{{l}}
+        \\hspace*{{-14.11mm}}\\includegraphics[height=1.8cm]{{iitb_logo.png}}
+    \\end{{tabular}} &
+    % Column 2: Name and Institution (Center Aligned)
+    \\begin{{tabular}}[b]{{c}}
+        \\textbf{{\\Large {sanitize_and_format(details.name)}}} \\\\
+        {sanitize_and_format(details.branch)} \\\\
+        {sanitize_and_format(details.institution)}
+    \\end{{tabular}} &
+    % Column 3: Key Stats (Right Aligned)
+    \\begin{{tabular}}[b]{{l}}
+        \\textbf{{{sanitize_and_format(details.roll_no)}}} \\\\
+        B.Tech \\\\
+        Gender: {sanitize_and_format(details.gender)} \\\\
+        DOB: {sanitize_and_format(details.dob)}
+    \\end{{tabular}}
+\\end{{tabular*}}
+\\vspace{{2mm}}
+\\begin{{tabular*}}{{\\textwidth}}{{@{{\\extracolsep{{\\fill}}}}lcrr}}
+    \\hline
+    \\textbf{{Examination}} & \\textbf{{Institute}} & \\textbf{{Year}} & \\textbf{{CPI / \\%}} \\\\ \\hline
+    Graduation & {sanitize_and_format(details.institution)} & 2027 & {sanitize_and_format(details.cpi)} \\\\ \\hline
+\\end{{tabular*}}
+
+\\vspace{{-20pt}} % Pulls the next section up
+"""
+
+def generate_personal_details_latex(details: PersonalDetails) -> str:
+    # This function creates the final, multi-column header using minipages for perfect alignment.
+    contact_parts = []
+    if details.email:
+        contact_parts.append(f"\\faEnvelope \\hspace{{1mm}} \\href{{mailto:{details.email}}}{{{sanitize_and_format(details.email)}}}")
+    if details.phone:
+        contact_parts.append(f"\\faPhone \\hspace{{1mm}} {sanitize_and_format(details.phone)}")
+    if details.linkedin_url:
+        contact_parts.append(f"\\faLinkedin \\hspace{{1mm}} \\href{{{details.linkedin_url}}}{{LinkedIn}}")
+    if details.github_url:
+        contact_parts.append(f"\\faGithub \\hspace{{1mm}} \\href{{{details.github_url}}}{{GitHub}}")
+    contact_block = " \\\\ \n".join(contact_parts)
+    return f"""
+\\begin{{minipage}}[t]{{0.3\\textwidth}}
+    \\raggedright
+    {contact_block}
+\\end{{minipage}}%
+\\begin{{minipage}}[t]{{0.4\\textwidth}}
+    \\centering
+    \\vspace*{{2mm}}
+    \\textbf{{\\LARGE \\textcolor{{Blue}}{{{sanitize_and_format(details.name)}}}}} \\\\
+    \\normalsize {sanitize_and_format(details.branch)} \\\\
+    \\normalsize {sanitize_and_format(details.institution)}
+\\end{{minipage}}%
+\\begin{{minipage}}[t]{{0.3\\textwidth}}
+    \\raggedleft
+    \\textbf{{CPI:}} {sanitize_and_format(details.cpi)} \\\\
+    \\textbf{{Graduation:}} {sanitize_and_format(details.grad_year)} \\\\
+    \\textbf{{Location:}} {sanitize_and_format(details.location)}
+\\end{{minipage}}
+\\vspace{{4mm}}
+\\rule{{\\textwidth}}{{0.4pt}}
+"""
+
+def generate_universal_header_latex(details: PersonalDetails) -> str:
+    # This function creates the final, multi-column header using minipages for perfect alignment.
+    
+    contact_parts = []
+    if details.email:
+        contact_parts.append(f"\\faEnvelope \\hspace{{1mm}} \\href{{mailto:{details.email}}}{{{sanitize_and_format(details.email)}}}")
+    if details.phone:
+        contact_parts.append(f"\\faPhone \\hspace{{1mm}} {sanitize_and_format(details.phone)}")
+    if details.linkedin_url:
+        contact_parts.append(f"\\faLinkedin \\hspace{{1mm}} \\href{{{details.linkedin_url}}}{{LinkedIn}}")
+    if details.github_url:
+        contact_parts.append(f"\\faGithub \\hspace{{1mm}} \\href{{{details.github_url}}}{{GitHub}}")
+        
+    contact_block = " \\\\ \n".join(contact_parts)
+
+    return f"""
+% Using minipages for a robust 3-column layout
+\\begin{{minipage}}[t]{{0.3\\textwidth}}
+    \\raggedright
+    {contact_block}
+\\end{{minipage}}%
+\\begin{{minipage}}[t]{{0.4\\textwidth}}
+    \\centering
+    \\vspace*{{2mm}} % Artificially lower the center block for visual balance
+    \\textbf{{\\LARGE \\textcolor{{Blue}}{{{sanitize_and_format(details.name)}}}}} \\\\
+    \\normalsize {sanitize_and_format(details.branch)} \\\\
+    \\normalsize {sanitize_and_format(details.institution)}
+\\end{{minipage}}%
+\\begin{{minipage}}[t]{{0.3\\textwidth}}
+    \\raggedleft
+    \\textbf{{CPI:}} {sanitize_and_format(details.cpi)} \\\\
+    \\textbf{{Graduation:}} {sanitize_and_format(details.grad_year)} \\\\
+    \\textbf{{Location:}} {sanitize_and_format(details.location)}
+\\end{{minipage}}
+
+\\vspace{{4mm}}
+\\rule{{\\textwidth}}{{0.4pt}}
+\\vspace{{-28pt}} % Pulls the next section up
+"""
+
+def generate_blank_header_latex() -> str:
+    # This function generates a vertical space of 3.5cm.
+    # This value can be adjusted later if the placement cell requires a different size.
+    return "\\vspace*{3.5cm}\n"
+
+def generate_iitb_official_2_header(details: PersonalDetails) -> str:
+    # This generates the header using nested tabular environments for robust layout
+    # Personal Details Section (Mimicking structure of generate_iitb_header_latex)
+    personal_details_latex = f"""
+\\begin{{tabular*}}{{\\textwidth}}{{l@{{\\extracolsep{{\\fill}}}}cr}}
+    % Column 1: Logo
+    \\begin{{tabular}}[b]{{l}}
+        \\includegraphics[width=0.15\\textwidth]{{iitb_logo.png}}
+    \\end{{tabular}} &
+    % Column 2: Name, Branch, Institute, Email (Left Aligned within center block)
+    \\begin{{tabular}}[b]{{l}} % Changed alignment to 'l'
+        \\textbf{{{sanitize_and_format(details.name)}}} \\\\
+        \\textbf{{{sanitize_and_format(details.branch)}}} \\\\
+        \\textbf{{{sanitize_and_format(details.institution)}}} \\\\
+        \\textbf{{{sanitize_and_format(details.email)}}}
+    \\end{{tabular}} &
+    % Column 3: Roll No, BTech, Gender, DOB (Left Aligned within right block)
+    \\begin{{tabular}}[b]{{l}} % Changed alignment to 'l'
+        \\textbf{{{sanitize_and_format(details.roll_no)}}} \\\\
+        \\textbf{{B.Tech.}} \\\\
+        \\textbf{{Gender: {sanitize_and_format(details.gender)}}} \\\\
+        \\textbf{{DOB: {sanitize_and_format(details.dob)}}}
+    \\end{{tabular}}
+\\end{{tabular*}}
+\\vspace{{0.7cm}} % Space before the academic table line
+\\hrule % First horizontal line
+"""
+
+    # Academic Table Section (Single tabular* with aligned columns)
+    academic_table_latex = f"""
+\\vspace{{1mm}} % Space after first hrule
+\\hrule % Top horizontal line
+\\vspace{{1mm}} % Space before table
+\\hspace*{{-7mm}} % Shift table left\n\\n
+\\begin{{tabular*}}{{\\textwidth}}{{@{{\\extracolsep{{\\fill}}}} l l l c c }}
+    \\textbf{{Examination}} & \\textbf{{University}} & \\textbf{{Institute}} & \\textbf{{Year}} & \\textbf{{CPI / \\%}} \\\\
+    \\hline
+    Graduation & IIT Bombay & {sanitize_and_format(details.institution)} & {sanitize_and_format(details.grad_year)} & {sanitize_and_format(details.cpi)} \\\\
+\\end{{tabular*}}
+\\vspace{{0.1cm}} % Space before final hrule
+\\hrule % Bottom horizontal line
+\\vspace{{-5mm}} % Pulls the next section up
+"""
+
+    return personal_details_latex + academic_table_latex
+
+def generate_scholastic_latex(achievements: List[ScholasticAchievement]) -> str:
+    if not achievements: return ""
+    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Scholastic Achievements} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
+    items = "".join([f"    \\item {sanitize_and_format(ach.text)}\n" for ach in achievements])
+    latex_string += f"\\begin{{itemize}}[itemsep=-1.55mm,leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_experience_latex(experiences: List[Experience]) -> str:
+    if not experiences: return ""
+    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Professional Experience} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
+    for i, exp in enumerate(experiences):
+        if i > 0: latex_string += "\\vspace{-10pt}\n"
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in exp.points if point.strip()])
+        description_latex = f"\\vspace{{-1.5mm}}\n\\textit{{{sanitize_and_format(exp.description)}}}\n\\vspace{{-1mm}}" if exp.description else ""
+        latex_string += f"""
+\\noindent \\textbf{{\\large {sanitize_and_format(exp.company)}}}
+| \\textbf{{\\large   {sanitize_and_format(exp.role)}}}
+\\hfill{{\\textit{{{sanitize_and_format(exp.dates)}}}}}
+\\vspace{{-3mm}}
+\\\\ \\rule{{\\textwidth}}{{0.2mm}}
+{description_latex}
+\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]
+{points_latex}\\end{{itemize}}
+"""
+    if experiences: latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_projects_latex(projects: List[Project]) -> str:
+    if not projects: return ""
+    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Key Projects} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
+    for i, proj in enumerate(projects):
+        if i > 0: latex_string += "\\vspace{-10pt}\n"
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in proj.points if point.strip()])
+        description_latex = f"\\vspace{{-1.5mm}}\n\\textit{{{sanitize_and_format(proj.description)}}}\n\\vspace{{-1mm}}" if proj.description else ""
+        latex_string += f"""
+\\noindent \\textbf{{\\large {sanitize_and_format(proj.name)}}}
+\\textit{{| {sanitize_and_format(proj.subtitle)} }}
+\\hfill{{\\textit{{{sanitize_and_format(proj.dates)}}}}}
+\\vspace{{-3mm}}
+\\\\ \\rule{{\\textwidth}}{{0.2mm}}
+{description_latex}
+\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]
+{points_latex}\\end{{itemize}}
+"""
+    if projects: latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_por_latex(pors: List[Responsibility]) -> str:
+    if not pors: return ""
+    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Positions of Responsibility} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
+    for i, por in enumerate(pors):
+        if i > 0: latex_string += "\\vspace{-8pt}\n"
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in por.points if point.strip()])
+        latex_string += f"""
+\\noindent \\textbf{{\\large {sanitize_and_format(por.role)}}} | {sanitize_and_format(por.organization)} \\hfill{{\\textit{{{sanitize_and_format(por.dates)}}}}} 
+\\vspace{{-3mm}}
+\\\\ \\rule{{\\textwidth}}{{0.2mm}}
+\\vspace{{-1.5mm}}
+\\textit{{{sanitize_and_format(por.description)}}}
+\\vspace{{-1mm}}
+\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]
+{points_latex}\\end{{itemize}}
+"""
+    if pors: latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_extracurricular_latex(extracurriculars: List[ExtraCurricular]) -> str:
+    if not extracurriculars: return ""
+    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Extra-Curricular Activities} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
+    items = "".join([f"    \\item {sanitize_and_format(ec.text)} \\hfill {{\\sl \\small [{sanitize_and_format(ec.date)}]}}\n" for ec in extracurriculars if ec.text.strip()])
+    latex_string += f"\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-28pt}\n" # Pulls the next section up
+    return latex_string
+
+# --- NEW: Dense Blue Style LaTeX Generation Functions ---
+
+def generate_dense_scholastic_latex(achievements: List[ScholasticAchievement]) -> str:
+    if not achievements: return ""
+    latex_string = "\\section*{\\LARGE \\color{myblue}Scholastic Achievements\\xfilll[0pt]{0.5pt}}\n\\vspace{-12pt}\n"
+    items = "".join([f"    \\item {sanitize_and_format(ach.text)}\n" for ach in achievements])
+    latex_string += f"\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_dense_experience_latex(experiences: List[Experience]) -> str:
+    if not experiences: return ""
+    latex_string = "\\section*{\\LARGE \\color{myblue}Professional Experience\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
+    for i, exp in enumerate(experiences):
+        if i > 0: latex_string += "\\vspace{-10pt}\n"
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in exp.points if point.strip()])
+        description_latex = f"\\textit{{{sanitize_and_format(exp.description)}}}" if exp.description else ""
+        latex_string += f"""
+\\noindent {{\\large \\textbf{{{sanitize_and_format(exp.company)}}}}} | {{\\large \\textbf{{{sanitize_and_format(exp.role)}}}}} \\hfill{{{sanitize_and_format(exp.dates)}}}
+\\\\  
+\\hfill{{{description_latex}}}
+\\vspace{{-12pt}}
+\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]
+{points_latex}\\end{{itemize}}
+"""
+    if experiences: latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_dense_projects_latex(projects: List[Project]) -> str:
+    if not projects: return ""
+    latex_string = "\\section*{\\LARGE \\color{myblue}Key Projects\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
+    for i, proj in enumerate(projects):
+        if i > 0: latex_string += "\\vspace{-10pt}\n"
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in proj.points if point.strip()])
+        
+        # --- Corrected Logic ---
+        # Format subtitle to match the "Company | Role" style
+        subtitle_latex = f"| {{\\large \\textbf{{{sanitize_and_format(proj.subtitle)}}}}}" if proj.subtitle else ""
+        # Format description to match the "perfect" experience model
+        description_latex = f"\\textit{{{sanitize_and_format(proj.description)}}}" if proj.description else ""
+        
+        latex_string += f"""
+\\noindent {{\\large \\textbf{{{sanitize_and_format(proj.name)}}}}} {subtitle_latex} \\hfill{{{sanitize_and_format(proj.dates)}}}
+\\\\ 
+\\hfill{{{description_latex}}}
+\\vspace{{-12pt}}
+\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]
+{points_latex}\\end{{itemize}}
+"""
+    if projects: latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_dense_por_latex(pors: List[Responsibility]) -> str:
+    if not pors: return ""
+    latex_string = "\\section*{\\LARGE \\color{myblue}Positions of Responsibility\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
+    for i, por in enumerate(pors):
+        if i > 0: latex_string += "\\vspace{-8pt}\n"
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in por.points if point.strip()])
+        latex_string += f"""
+\\noindent {{\\large \\textbf{{{sanitize_and_format(por.role)}}}}} | {sanitize_and_format(por.organization)} \\hfill{{{sanitize_and_format(por.dates)}}}
+\\vspace{{-10pt}}
+\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]
+{points_latex}\\end{{itemize}}
+"""
+    if pors: latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_dense_extracurricular_latex(extracurriculars: List[ExtraCurricular]) -> str:
+    if not extracurriculars: return ""
+    latex_string = "\\section*{\\LARGE \\color{myblue}Extra-Curricular Activities\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
+    items = "".join([f"    \\item {sanitize_and_format(ec.text)} \\hfill {{{sanitize_and_format(ec.date)}}}\n" for ec in extracurriculars if ec.text.strip()])
+    latex_string += f"\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-28pt}\n" # Pulls the next section up
+    return latex_string
+
+def generate_technical_skills_latex(skills: List[TechnicalSkill]) -> str:
+    if not skills: return ""
+    latex_string = "\\section*{\\textcolor{Blue}{\\Large{Technical Skills} \\vhrulefill{1pt}}}\n\\vspace{-12pt}\n"
+    # Note the \textbf for category and the colon
+    items = "".join([f"    \\item \\textbf{{{sanitize_and_format(skill.category)}:}} {sanitize_and_format(skill.skills)}\n" for skill in skills if skill.category or skill.skills])
+    latex_string += f"\\begin{{itemize}}[itemsep=-1.55mm, leftmargin=6mm]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+def generate_dense_technical_skills_latex(skills: List[TechnicalSkill]) -> str:
+    if not skills: return ""
+    latex_string = "\\section*{\\LARGE \\color{myblue}Technical Skills\\xfilll[0pt]{1pt}}\n\\vspace{-12pt}\n"
+    # Note the \textbf for category and the colon
+    items = "".join([f"    \\item \\textbf{{{sanitize_and_format(skill.category)}:}} {sanitize_and_format(skill.skills)}\n" for skill in skills if skill.category or skill.skills])
+    latex_string += f"\\begin{{itemize}}[label=\\textcolor{{myblue}}{{\\textbullet}},itemsep = -1.55 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-28pt}\n"
+    return latex_string
+
+# --- NEW: T-Colorbox Style LaTeX Generation Functions ---
+
+def generate_tcolorbox_scholastic_latex(achievements: List[ScholasticAchievement]) -> str:
+    if not achievements: return ""
+    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
+    latex_string += "\\vspace{-1.7mm}\n\\textbf{SCHOLASTIC ACHIEVEMENTS}\n\\end{tcolorbox}\n"
+    latex_string += "\\vspace{-5mm}\n" # REMOVED excessive negative space
+    items = "".join([f"    \\item {sanitize_and_format(ach.text)}\n" for ach in achievements])
+    latex_string += f"\\begin{{itemize}}[itemsep = -1.5mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-5mm}\n" # Reduced final spacing slightly
+    return latex_string
+
+def generate_tcolorbox_experience_latex(experiences: List[Experience]) -> str:
+    if not experiences: return ""
+    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
+    latex_string += "\\vspace{-1.7mm}\n\\textbf{PROFESSIONAL EXPERIENCE}\n\\end{tcolorbox}\n"
+    latex_string += "\\vspace{-2mm}\n"
+    for i, exp in enumerate(experiences):
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in exp.points if point.strip()])
+        description_latex = f"\\textit{{{sanitize_and_format(exp.description)}}}" if exp.description else ""
+        
+        # --- Start replacement ---
+        latex_string += f"""
+\\vspace{{1mm}}
+\\hspace*{{-7.6mm}} % Keep negative horizontal space for alignment
+\\textbf{{{sanitize_and_format(exp.company)}}} $|$ \\textbf{{{sanitize_and_format(exp.role)}}} \\hfill{{\\small {sanitize_and_format(exp.dates)}}}
+\\vspace{{0mm}} \\hline % Adjusted space before first hline
+\\vspace{{1mm}}\\hspace*{{-5mm}} % Keep negative horizontal space
+{description_latex}
+\\vspace{{-3.5mm}} % Reduced space before itemize
+\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]
+{points_latex}
+\\end{{itemize}}
+\\vspace{{0mm}} \\hline % Adjusted space before second hline
+\\\\ % Use only one line break here
+"""
+        # --- End replacement ---
+    return latex_string
+
+def generate_tcolorbox_projects_latex(projects: List[Project]) -> str:
+    if not projects: return ""
+    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
+    latex_string += "\\vspace{-1.7mm}\n\\textbf{KEY PROJECTS}\n\\end{tcolorbox}\n"
+    latex_string += "\\vspace{-2mm}\n"
+    for i, proj in enumerate(projects):
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in proj.points if point.strip()])
+        subtitle_latex = f"| \\textit{{{sanitize_and_format(proj.subtitle)}}}" if proj.subtitle else ""
+        description_latex = f"\\textit{{{sanitize_and_format(proj.description)}}}" if proj.description else ""
+        
+        # --- Start replacement ---
+        latex_string += f"""
+\\vspace{{1mm}}
+\\hspace*{{-7.5mm}} % Keep negative horizontal space
+\\textbf{{{sanitize_and_format(proj.name)}}} {subtitle_latex} \\hfill{{\\small {sanitize_and_format(proj.dates)}}}
+\\vspace{{0mm}} \\hline % Adjusted space before first hline
+\\vspace{{1mm}}
+\\hspace*{{-4.5mm}} % Keep negative horizontal space
+{description_latex}
+\\vspace{{-3.5mm}} % Reduced space before itemize
+\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]
+{points_latex}
+\\end{{itemize}}
+\\vspace{{0mm}} \\hline % Adjusted space before second hline
+\\\\ % Use only one line break here
+"""
+        # --- End replacement ---
+    return latex_string
+
+def generate_tcolorbox_por_latex(pors: List[Responsibility]) -> str:
+    if not pors: return ""
+    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
+    latex_string += "\\vspace{-1.7mm}\n\\textbf{POSITION OF RESPONSIBILITY}\n\\end{tcolorbox}\n"
+    latex_string += "\\vspace{-2mm}\n"
+    for i, por in enumerate(pors):
+        points_latex = "".join([f"    \\item {sanitize_and_format(point)}\n" for point in por.points if point.strip()])
+        description_latex = f"\\textit{{{sanitize_and_format(por.description)}}}" if por.description else ""
+        
+        # --- Start replacement ---
+        latex_string += f"""
+\\vspace{{1mm}}
+\\hspace*{{-7.6mm}} % Keep negative horizontal space
+\\textbf{{{sanitize_and_format(por.role)}}} $|$ {sanitize_and_format(por.organization)} \\hfill{{\\small {sanitize_and_format(por.dates)}}}
+\\vspace{{0mm}} \\hline % Adjusted space before first hline
+\\vspace{{1mm}}\\hspace*{{-5mm}} % Keep negative horizontal space
+{description_latex}
+\\vspace{{-3.5mm}} % Reduced space before itemize
+\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]
+{points_latex}
+\\end{{itemize}}
+\\vspace{{0mm}} \\hline % Adjusted space before second hline
+\\\\ % Use only one line break here
+"""
+        # --- End replacement ---
+    return latex_string
+
+def generate_tcolorbox_technical_skills_latex(skills: List[TechnicalSkill]) -> str:
+    if not skills: return ""
+    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
+    latex_string += "\\vspace{-1.7mm}\n\\textbf{TECHNICAL SKILLS}\n\\end{tcolorbox}\n"
+    latex_string += "\\vspace{-5mm}\n" # REMOVED excessive negative space
+    items = "".join([f"    \\item \\textbf{{{sanitize_and_format(skill.category)}:}} {sanitize_and_format(skill.skills)}\n" for skill in skills if skill.category or skill.skills])
+    latex_string += f"\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    latex_string += "\\vspace{-5mm}\n" # Kept moderate final spacing
+    return latex_string
+
+def generate_tcolorbox_extracurricular_latex(extracurriculars: List[ExtraCurricular]) -> str:
+    if not extracurriculars: return ""
+    latex_string = "\\begin{tcolorbox}[colback=SecondBlue, coltext=black, sharp corners, boxrule=0pt, halign=center, height= .5cm, valign=top]\n"
+    latex_string += "\\vspace{-1.7mm}\n\\textbf{EXTRA CURRICULAR ACTIVITIES}\n\\end{tcolorbox}\n"
+    latex_string += "\\vspace{-5.5mm}\n"
+    items = "".join([f"    \\item {sanitize_and_format(ec.text)} \\hfill{{\\small {sanitize_and_format(ec.date)}}}\n" for ec in extracurriculars if ec.text.strip()])
+    latex_string += f"\\begin{{itemize}}[itemsep = -1.5 mm, leftmargin=*]\n{items}\\end{{itemize}}\n"
+    return latex_string
+
+# --- Header and Body Style Dispatch Tables (built once at import) ---
+HEADER_GENERATORS = {
+    "iitb": generate_iitb_header_latex,
+    "universal": generate_universal_header_latex,
+    "blank": generate_blank_header_latex,
+    "iitb_2": generate_iitb_official_2_header,
+}
+
+UNIVERSAL_STYLE_SECTIONS = {
+    "scholasticAchievements": generate_scholastic_latex,
+    "professionalExperience": generate_experience_latex,
+    "keyProjects": generate_projects_latex,
+    "positionsOfResponsibility": generate_por_latex,
+    "extraCurriculars": generate_extracurricular_latex,
+    "technicalSkills": generate_technical_skills_latex,
+}
+
+DENSE_BLUE_STYLE_SECTIONS = {
+    "scholasticAchievements": generate_dense_scholastic_latex,
+    "professionalExperience": generate_dense_experience_latex,
+    "keyProjects": generate_dense_projects_latex,
+    "positionsOfResponsibility": generate_dense_por_latex,
+    "extraCurriculars": generate_dense_extracurricular_latex,
+    "technicalSkills": generate_dense_technical_skills_latex,
+}
+TCOLORBOX_STYLE_SECTIONS = {
+    "scholasticAchievements": generate_tcolorbox_scholastic_latex,
+    "professionalExperience": generate_tcolorbox_experience_latex,
+    "keyProjects": generate_tcolorbox_projects_latex,
+    "positionsOfResponsibility": generate_tcolorbox_por_latex,
+    "extraCurriculars": generate_tcolorbox_extracurricular_latex,
+    "technicalSkills": generate_tcolorbox_technical_skills_latex,
+}
+
+BODY_STYLE_MAP = {
+    "iitb_one_page.tex": UNIVERSAL_STYLE_SECTIONS,
+    "dense_blue.tex": DENSE_BLUE_STYLE_SECTIONS,
+    "tcolorbox_style.tex": TCOLORBOX_STYLE_SECTIONS,
+}
+
+# --- Resume Assembly ---
+def build_resume_latex(resume_data: ResumeData) -> str:
+    # Raises HTTPException for an unknown body template or header. The sanitizing of every string
+    # in the resume is summed and reported once, as the "sanitize" stage.
+    with stage_totals():
+        return populate_template(resume_data)
+
+def populate_template(resume_data: ResumeData) -> str:
+    # Populates the body template with the header and the sections in the requested order.
+    # --- 1. Look Up Body Template (whitelist of templates loaded at startup) ---
+    with stage("template"):
+        body_id = resume_data.body_id
+        latex_template = template_registry.get(body_id)
+        if latex_template is None: raise HTTPException(status_code=404, detail=f"Body template '{body_id}' not found")
+
+        # --- 2. Generate Header LaTeX ---
+        header_id = resume_data.header_id
+        header_func = HEADER_GENERATORS.get(header_id)
+        if not header_func: raise HTTPException(status_code=400, detail=f"Invalid header_id: {header_id}")
+        header_latex = header_func(resume_data.personalDetails) if header_id != "blank" else header_func()
+
+    # --- 3. Generate Dynamic Content LaTeX based on Body Style ---
+    section_generators = BODY_STYLE_MAP.get(body_id)
+    body_style = body_id
+    if not section_generators:
+        # Default to universal style if the body_id is not explicitly mapped
+        section_generators = UNIVERSAL_STYLE_SECTIONS
+        body_style = "iitb_one_page.tex"
+
+    # --- Start replacement ---
+    dynamic_content = ""
+    # Add initial space ONLY for tcolorbox style to prevent header overlap
+    if body_id == "tcolorbox_style.tex":
+        dynamic_content += "\\vspace{5mm}\n" # Adjust this value as needed
+
+    with stage("sections"):
+        for section_key in resume_data.sectionOrder:
+            generator_func = section_generators.get(section_key)
+            if generator_func:
+                section_data = getattr(resume_data, section_key, [])
+                if section_data: # Only process if there's data
+                    section_latex = render_section(body_style, section_key, generator_func, section_data)
+                    if section_latex:
+                        dynamic_content += section_latex + "\n"
+    # --- End replacement ---
+
+    # --- 4. Populate Template ---
+    latex_template = latex_template.replace("__PERSONAL_DETAILS_SECTION__", header_latex)
+    latex_template = latex_template.replace("__DYNAMIC_CONTENT_SECTION__", dynamic_content)
+    return latex_template
+
+def bulk_resume_latex(record: dict) -> str:
+    # One JSONL record of a bulk run (see bulk.py)
+    return build_resume_latex(ResumeData(**record))
+
+def bullet_probe_latex(body_id: str, point: str) -> str:
+    # A resume whose only content is one experience bullet, set exactly like a real one (see text_metrics.py)
+    return build_resume_latex(ResumeData(header_id="blank", body_id=body_id, sectionOrder=["professionalExperience"],
+                                         personalDetails=PersonalDetails(), scholasticAchievements=[],
+                                         professionalExperience=[Experience(points=[point])], keyProjects=[], positionsOfResponsibility=[]))
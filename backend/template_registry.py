@@ -0,0 +1,68 @@
+# template_registry.py (body templates loaded and validated once, with optional hot reload)
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BACKEND_DIR, "templates")
+
+TEMPLATE_HOT_RELOAD = os.getenv("TEMPLATE_HOT_RELOAD", "").lower() in ("1", "true", "yes")  # dev mode only
+TEMPLATE_RELOAD_INTERVAL = 1.0  # seconds between directory scans when hot reload is on
+
+REQUIRED_MARKERS = ["\\begin{document}", "\\end{document}", "__PERSONAL_DETAILS_SECTION__", "__DYNAMIC_CONTENT_SECTION__"]
+
+def validate_template(source: str) -> List[str]:
+    return [f"missing {marker}" for marker in REQUIRED_MARKERS if marker not in source]
+
+class TemplateRegistry:
+    # Holds every valid templates/*.tex in memory. Lookups are a whitelist: only file names that were
+    # loaded and passed validation can be used as a body_id, so no path ever reaches the filesystem.
+    def __init__(self, templates_dir: str = TEMPLATES_DIR, hot_reload: bool = TEMPLATE_HOT_RELOAD):
+        self.templates_dir = templates_dir
+        self.hot_reload = hot_reload
+        self._templates: Dict[str, str] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        templates, mtimes = {}, {}
+        for name in sorted(os.listdir(self.templates_dir)):
+            if not name.endswith(".tex"): continue
+            path = os.path.join(self.templates_dir, name)
+            mtimes[name] = os.path.getmtime(path)
+            if self._mtimes.get(name) == mtimes[name] and name in self._templates:
+                templates[name] = self._templates[name]
+                continue
+            with open(path, "r", encoding='utf-8') as f: source = f.read()
+            problems = validate_template(source)
+            if problems:
+                print(f"--- TEMPLATE {name} REJECTED ---: {', '.join(problems)}")
+                continue
+            if name in self._templates: print(f"--- TEMPLATE {name} RELOADED ---")
+            templates[name] = source
+        with self._lock:
+            self._templates, self._mtimes = templates, mtimes
+            self._last_scan = time.monotonic()
+
+    def _maybe_reload(self) -> None:
+        if time.monotonic() - self._last_scan < TEMPLATE_RELOAD_INTERVAL: return
+        current = {}
+        for name in os.listdir(self.templates_dir):
+            if name.endswith(".tex"): current[name] = os.path.getmtime(os.path.join(self.templates_dir, name))
+        if current != self._mtimes: self.reload()
+        else: self._last_scan = time.monotonic()
+
+    def get(self, body_id: str) -> Optional[str]:
+        if self.hot_reload: self._maybe_reload()
+        return self._templates.get(body_id)
+
+    def names(self) -> List[str]:
+        return list(self._templates)
+
+    def sources(self) -> List[str]:
+        return list(self._templates.values())
+
+template_registry = TemplateRegistry()
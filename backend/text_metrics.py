@@ -0,0 +1,203 @@
+# text_metrics.py (one-line fit prediction for bullet points from the templates' TFM font metrics)
+import os
+import re
+import shutil
+import struct
+import functools
+import subprocess
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from latex_compiler import compile_cold, job_paths, make_scratch_dir
+from resume_latex import bullet_probe_latex
+from template_registry import template_registry
+
+TFM_DIR = os.getenv("TEXT_METRICS_TFM_DIR", "")       # optional extra directory searched before kpsewhich
+
+# Geometry, list indents and fonts differ per template (margins, leftmargin=6mm vs leftmargin=* with
+# whatever label the template sets), so instead of restating them here each template is asked once:
+# a one-bullet resume is compiled with pdflatex, and the bullet reports \linewidth and the TFM name and
+# size of its regular and bold font from inside the list. The result is cached per template source.
+PROBE_MARKER = "TEXTMETRICSPROBE"   # letters only, so sanitize_and_format passes it through
+PROBE_COMMANDS = ("\\typeout{TEXT-METRICS linewidth=\\the\\linewidth}\\typeout{TEXT-METRICS regular=\\fontname\\font}"
+                  "{\\bfseries\\typeout{TEXT-METRICS bold=\\fontname\\font}}")
+PROBE_PATTERN = re.compile(r"^TEXT-METRICS (linewidth|regular|bold)=(.+)$", re.MULTILINE)
+FONTNAME_PATTERN = re.compile(r"^(\S+)(?: at ([\d.]+)pt)?$")   # \fontname omits "at" for a font at its design size
+
+class TemplateFonts(NamedTuple):
+    regular: str          # TFM TeX loads for the bullet text
+    bold: str             # ... and for **bold** runs
+    size_pt: float
+    line_width_pt: float  # \linewidth inside the bullet list (\textwidth minus the list's margins)
+
+class TextMetricsUnavailable(Exception):
+    pass
+
+class FontMetrics(NamedTuple):
+    # Widths and kerns in units of the design size (multiply by the point size to get pt)
+    widths: Dict[int, float]
+    kerns: Dict[Tuple[int, int], float]
+    ligatures: Dict[Tuple[int, int], int]
+    space: float
+    space_stretch: float
+    space_shrink: float
+    design_size_pt: float
+
+class TextFit(NamedTuple):
+    width_pt: float        # natural width of the text set on one line
+    min_width_pt: float    # width with every interword space shrunk as far as TeX allows
+    line_width_pt: float
+    overflow_pt: float     # natural width minus line width; negative means room to spare
+    fits_one_line: bool    # True when TeX can set it on one line (shrinking spaces if needed)
+
+    def as_dict(self) -> dict:
+        return {key: (round(value, 2) if isinstance(value, float) else value) for key, value in self._asdict().items()}
+
+def parse_tfm(data: bytes) -> FontMetrics:
+    # TeX font metric format (TFM, see tftopl): a 24-byte length header followed by 32-bit words.
+    lf, lh, bc, ec, nw, nh, nd, ni, nl, nk, ne, np = struct.unpack(">12H", data[:24])
+    def words(offset: int, count: int) -> List[bytes]:
+        return [data[24 + 4 * (offset + i):24 + 4 * (offset + i + 1)] for i in range(count)]
+    def fix_word(word: bytes) -> float:
+        return struct.unpack(">i", word)[0] / 2 ** 20
+
+    char_base = lh
+    width_base = char_base + (ec - bc + 1)
+    lig_kern_base = width_base + nw + nh + nd + ni
+    kern_base = lig_kern_base + nl
+    param_base = kern_base + nk + ne
+
+    width_table = [fix_word(w) for w in words(width_base, nw)]
+    kern_table = [fix_word(w) for w in words(kern_base, nk)]
+    lig_kern = words(lig_kern_base, nl)
+    params = [fix_word(w) for w in words(param_base, np)]
+    design_size = fix_word(words(0, lh)[1]) if lh > 1 else 10.0
+
+    widths, kerns, ligatures = {}, {}, {}
+    for code, info in zip(range(bc, ec + 1), words(char_base, ec - bc + 1)):
+        width_index, _, tag_byte, remainder = info
+        if width_index == 0: continue   # character not present in the font
+        widths[code] = width_table[width_index]
+        if tag_byte & 3 != 1 or not lig_kern: continue
+        index = remainder
+        skip, _, op, rem = lig_kern[index]
+        if skip > 128: index = 256 * op + rem   # program starts elsewhere
+        while index < len(lig_kern):
+            skip, next_char, op, rem = lig_kern[index]
+            if skip <= 128:
+                if op >= 128: kerns.setdefault((code, next_char), kern_table[256 * (op - 128) + rem])
+                elif op == 0: ligatures.setdefault((code, next_char), rem)   # plain =: ligature (ff, fi, --, ...)
+            if skip >= 128: break
+            index += skip + 1
+
+    space, stretch, shrink = (params + [0.0] * 5)[1:4]
+    return FontMetrics(widths, kerns, ligatures, space, stretch, shrink, design_size)
+
+@functools.lru_cache(maxsize=None)
+def find_tfm(name: str) -> Optional[str]:
+    if TFM_DIR and os.path.exists(os.path.join(TFM_DIR, f"{name}.tfm")): return os.path.join(TFM_DIR, f"{name}.tfm")
+    try:
+        found = subprocess.run(['kpsewhich', f"{name}.tfm"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    path = found.stdout.strip()
+    return path if path and os.path.exists(path) else None
+
+@functools.lru_cache(maxsize=None)
+def load_font(candidates: Tuple[str, ...]) -> Optional[FontMetrics]:
+    # First readable TFM among the candidates; None (remembered, like a hit) when there is none
+    for name in candidates:
+        path = find_tfm(name)
+        if not path: continue
+        try:
+            with open(path, "rb") as f: return parse_tfm(f.read())
+        except (OSError, struct.error, IndexError) as e:
+            print(f"--- FONT METRICS {path} UNREADABLE ---: {e}")
+    return None
+
+def read_probe(log_content: str) -> Optional[TemplateFonts]:
+    values = dict(PROBE_PATTERN.findall(log_content))
+    if set(values) != {"linewidth", "regular", "bold"}: return None
+    regular, bold = FONTNAME_PATTERN.match(values["regular"].strip()), FONTNAME_PATTERN.match(values["bold"].strip())
+    if not regular or not bold: return None
+    if regular.group(2): size = float(regular.group(2))
+    else:
+        font = load_font((regular.group(1),))
+        if font is None: return None
+        size = font.design_size_pt
+    return TemplateFonts(regular.group(1), bold.group(1), size, float(values["linewidth"].strip().rstrip("pt")))
+
+@functools.lru_cache(maxsize=64)
+def probe(probe_source: str) -> Optional[TemplateFonts]:
+    # Compiles a probe document and reads its report; None (remembered, like a hit) when that fails
+    if shutil.which("pdflatex") is None: return None
+    workdir = make_scratch_dir()
+    try:
+        _, log_filepath, _, tex_filepath = job_paths(workdir)
+        with open(tex_filepath, "w", encoding='utf-8') as f: f.write(probe_source)
+        compile_cold(tex_filepath)
+        if not os.path.exists(log_filepath): return None
+        with open(log_filepath, "r", encoding='utf-8', errors='replace') as f: fonts = read_probe(f.read())
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"--- TEXT METRICS PROBE FAILED ---: {e}")
+        return None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if fonts is None: print("--- TEXT METRICS PROBE FAILED ---: the bullet did not report its fonts and line width")
+    return fonts
+
+def template_fonts(body_id: str) -> TemplateFonts:
+    # Blocking the first time per template source (one pdflatex run), a dict lookup afterwards
+    if template_registry.get(body_id) is None: raise TextMetricsUnavailable(f"Body template '{body_id}' not found")
+    fonts = probe(bullet_probe_latex(body_id, PROBE_MARKER).replace(PROBE_MARKER, PROBE_COMMANDS, 1))
+    if fonts is None: raise TextMetricsUnavailable(f"Could not measure the bullets of template '{body_id}' with pdflatex")
+    if load_font((fonts.regular,)) is None: raise TextMetricsUnavailable(f"Font metrics {fonts.regular}.tfm were not found")
+    return fonts
+
+def run_width(font: FontMetrics, text: str) -> Tuple[float, int]:
+    # (width in design-size units, number of interword spaces) of a run set in one font,
+    # applying the font's ligatures and kerning like TeX does.
+    fallback = font.widths.get(ord("o"), 0.5)
+    codes = [ord(char) for char in text]
+    width, spaces, i = 0.0, 0, 0
+    while i < len(codes):
+        code = codes[i]
+        if code == 32:
+            spaces += 1
+            i += 1
+            continue
+        while i + 1 < len(codes) and (code, codes[i + 1]) in font.ligatures:
+            code = font.ligatures[(code, codes[i + 1])]
+            i += 1
+        width += font.widths.get(code, fallback)
+        if i + 1 < len(codes): width += font.kerns.get((code, codes[i + 1]), 0.0)
+        i += 1
+    return width, spaces
+
+def measure(text: str, body_id: str) -> TextFit:
+    # Predicts how wide a bullet is when typeset in the given template. **bold** runs use the bold
+    # font, mirroring sanitize_and_format. Microtype's protrusion/expansion are not modelled, so
+    # results within a point or two of the line width are borderline.
+    fonts = template_fonts(body_id)
+    regular = load_font((fonts.regular,))
+    bold = load_font((fonts.bold,)) or regular
+
+    runs = " ".join(text.split()).split("**")
+    width = spaces = 0.0
+    for index, run in enumerate(runs):
+        # Odd runs sit between a pair of ** markers; an unpaired trailing ** stays literal
+        is_bold = index % 2 == 1 and index < len(runs) - 1
+        run_em, run_spaces = run_width(bold if is_bold else regular, run)
+        width += run_em
+        spaces += run_spaces
+    size = fonts.size_pt
+    natural = (width + spaces * regular.space) * size
+    minimum = natural - spaces * regular.space_shrink * size
+    return TextFit(natural, minimum, fonts.line_width_pt, natural - fonts.line_width_pt, minimum <= fonts.line_width_pt)
+
+def available(body_id: str) -> bool:
+    # Whether this server can measure text for the template (pdflatex and its TFM files are installed)
+    try:
+        template_fonts(body_id)
+    except TextMetricsUnavailable:
+        return False
+    return True